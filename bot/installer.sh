@@ -44,6 +44,15 @@ install_monibot() {
                 /etc/systemd/system
     fi
 
+    # Slack and Zulip
+    if [ -f /etc/systemd/system/multibotd.service ]; then
+        echo skip install /etc/systemd/system/multibotd.service
+    else
+        install -o root -g root -m 644 \
+                multibotd.service \
+                /etc/systemd/system
+    fi
+
     if id ${user_id} &>/dev/null; then
         echo ${user_id} user already exists.
     else
@@ -58,19 +67,23 @@ install_monibot() {
     install -m 700 -o ${user_id} -g ${co2group} -d ${monibotd_dir}/.cache 
     install -m 700 -o ${user_id} -g ${co2group} -d ${monibotd_dir}/.cache/matplotlib
 
+    # report outbox
+    install -m 700 -o ${user_id} -g ${co2group} -d ${monibotd_dir}/var
+
     cat <<EOF
 
 Slack bot: monibotd
 Zulip bot: monibotzd
+Slack and Zulip bot in one process: multibotd
 
 Start bot service
-$ sodo systemctl start [monibotd or monibotzd]
+$ sodo systemctl start [monibotd, monibotzd or multibotd]
 
 Check service
-$ systemctl status [monibotd or monibotzd]
+$ systemctl status [monibotd, monibotzd or multibotd]
 
 Enable to start bot service on system boot 
-$ sudo systemctl enable [monibotd or monibotzd]
+$ sudo systemctl enable [monibotd, monibotzd or multibotd]
 
 EOF
 }
@@ -95,6 +108,7 @@ uninstall_monibot() {
     systemctl disable monibotd
     rm /etc/systemd/system/monibotd.service
     rm /etc/systemd/system/monibotzd.service
+    rm /etc/systemd/system/multibotd.service
     rm /etc/default/monibot
     rm -r ${monibotd_dir}
 
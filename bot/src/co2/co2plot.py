@@ -3,19 +3,52 @@
 import os
 import json
 import argparse
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
+import logging
 import sqlite3
 from datetime import datetime, timedelta, time, timezone
-plt.switch_backend('Agg')
+from zoneinfo import ZoneInfo
+from co2 import payload
 
 
 DEFAULT_DATABASE = 'measurement.db'
 DEFAULT_TABLE = 'measurement'
+OUTPUT_FORMATS = ('png', 'webp', 'svg')
+_plt = None
+log = logging.getLogger(__name__)
 
 
-def read_database(database, table, tz='UTC'):
+class OutputError(ValueError):
+    pass
+
+
+def pyplot():
+    """
+    Import matplotlib.pyplot with the Agg backend on first use
+
+    pandas and matplotlib take seconds to import on a Raspberry Pi,
+    so they are only loaded when a figure is actually drawn.
+
+    Returns
+    -------
+    plt : module
+        matplotlib.pyplot
+    """
+    global _plt
+    if _plt is None:
+        import matplotlib.pyplot as plt
+        plt.switch_backend('Agg')
+        _plt = plt
+    return _plt
+
+
+def to_nanoseconds(dt):
+    """
+    Convert aware datetime into UNIX time nanoseconds
+    """
+    return round(dt.timestamp() * 1_000_000) * 1000
+
+
+def read_database(database, table, tz='UTC', begin=None, end=None):
     """
     Read co2 from database and create DataFrame
 
@@ -27,15 +60,34 @@ def read_database(database, table, tz='UTC'):
         table name in database
     tz : str
         timezone
+    begin : datetime or None
+        read rows at or after 'begin'
+    end : datetime or None
+        read rows at or before 'end'
 
     Returns
     -------
     df : DataFrame
          Set DataFrame index using timestamp(UNIX time ns) column
     """
+    import pandas as pd
+
+    # timestamp is the INTEGER PRIMARY KEY, so the range is a rowid seek
+    where = []
+    params = []
+    if begin is not None:
+        where.append('timestamp >= ?')
+        params.append(to_nanoseconds(begin))
+    if end is not None:
+        where.append('timestamp <= ?')
+        params.append(to_nanoseconds(end))
+    query = 'SELECT * FROM %s' % table
+    if where:
+        query += ' WHERE ' + ' AND '.join(where)
+
     conn = sqlite3.connect(database)
     try:
-        df = pd.read_sql_query('SELECT * FROM %s' % table, conn)
+        df = pd.read_sql_query(query, conn, params=params)
     except Exception as e:
         print(e)
         exit(0)
@@ -61,27 +113,31 @@ def guess_xsv(data):
     dict :
         Converted data into dict not into list
     """
-    for delimiter in [',', None]:
-        try:
-            res = list(map(lambda x: float(x), data.split(delimiter)))
-            res_dict = {k: v for k, v in enumerate(res)}
-            return res_dict
-        except ValueError:
-            continue
+    return payload.guess(data)[1]
 
-    try:
-        res = json.loads(data)
-        if isinstance(res, list):
-            res_dict = {k: v for k, v in enumerate(res)}
-            return res_dict
-        return res
-    except json.decoder.JSONDecodeError:
-        return {}
 
-    return {}
+def load_registry(config):
+    """
+    Create payload schema registry from configuration
 
+    Parameters
+    ----------
+    config : dict
+        content of co2plot.json
 
-def extract_plot_data(df, topic, column):
+    Returns
+    -------
+    registry : co2.payload.SchemaRegistry
+        schemas declared in 'topics'
+    """
+    try:
+        return payload.SchemaRegistry(config.get('topics'))
+    except payload.PayloadError as e:
+        print(e)
+        exit(0)
+
+
+def extract_plot_data(df, topic, column, registry=None):
     """
     Extract plot data from DataFrame
 
@@ -93,21 +149,151 @@ def extract_plot_data(df, topic, column):
         topic
     column : str or int
         column in payload
+    registry : co2.payload.SchemaRegistry
+        payload schemas, guessed for each topic if None
 
     Returns
     -------
     ser : pandas.Series
         extracted series from DataFrame
     """
+    if registry is None:
+        registry = payload.SchemaRegistry()
+    key = registry.key(topic, column)
     topic_df = df[df.topic == topic]
-    ser = topic_df.payload.map(lambda x: guess_xsv(x).get(column))
+    ser = topic_df.payload.map(lambda x: registry.decode(topic, x).get(key))
     ser = ser[ser.notna()]
     ser.name = column
 
     return ser
 
 
-def plot(df, axes, filename="figure.png"):
+def output_options(config, output=None):
+    """
+    Merge per-request output options over 'output' in configuration
+
+    Parameters
+    ----------
+    config : dict
+        content of co2plot.json
+    output : dict or None
+        options given by the request
+
+    Returns
+    -------
+    options : dict
+        format, dpi, width, height, compress_level, colors, quality and
+        max_bytes, only those which are set
+
+    Raises
+    ------
+    OutputError
+        unknown output format
+    """
+    options = {}
+    options.update(config.get('output') or {})
+    options.update({k: v for k, v in (output or {}).items() if v is not None})
+    fmt = options.get('format', 'png')
+    if fmt not in OUTPUT_FORMATS:
+        raise OutputError(f"unknown output format '{fmt}'")
+    return options
+
+
+def output_filename(filename, options):
+    """
+    Replace the extension of 'filename' with the output format
+    """
+    fmt = options.get('format')
+    if fmt is None:
+        return filename
+    root, ext = os.path.splitext(filename)
+    if ext.lower().lstrip('.') == fmt:
+        return filename
+    return f"{root}.{fmt}"
+
+
+def encode_image(fig, dpi, fmt, colors=None, compress_level=6, quality=80):
+    """
+    Render figure at 'dpi' and encode it with Pillow
+
+    Returns
+    -------
+    data : bytes
+        PNG or WebP image
+    """
+    import io
+    import numpy as np
+    from PIL import Image
+
+    fig.set_dpi(dpi)
+    fig.canvas.draw()
+    img = Image.fromarray(np.asarray(fig.canvas.buffer_rgba())).convert('RGB')
+    buf = io.BytesIO()
+    if fmt == 'webp':
+        img.save(buf, 'WEBP', quality=quality)
+    else:
+        if colors:
+            img = img.quantize(colors, method=Image.Quantize.FASTOCTREE)
+        img.save(buf, 'PNG', compress_level=compress_level)
+    return buf.getvalue()
+
+
+def save_figure(fig, filename, options):
+    """
+    Save figure with output options
+
+    With 'max_bytes' the image is encoded again with fewer colors (PNG)
+    or lower quality (WebP), then at lower resolution, until it fits.
+
+    Parameters
+    ----------
+    fig : matplotlib.figure.Figure
+        figure to save
+    filename : str
+        output filename
+    options : dict
+        output options, see output_options()
+    """
+    fmt = options.get('format', 'png')
+    dpi = options.get('dpi', fig.get_dpi())
+    if fmt == 'svg':
+        fig.savefig(filename, format='svg')
+        return
+
+    max_bytes = options.get('max_bytes')
+    compress_level = options.get('compress_level', 6)
+    if fmt == 'webp':
+        first = options.get('quality', 80)
+        steps = [first] + [q for q in (60, 40, 20) if q < first]
+    else:
+        first = options.get('colors')
+        steps = [first] + [c for c in (256, 64, 16) if not first or c < first]
+    if not max_bytes:
+        steps = steps[:1]
+    scales = (1.0, 0.75, 0.5) if max_bytes else (1.0,)
+
+    data = None
+    for scale in scales:
+        for step in steps:
+            if fmt == 'webp':
+                kwargs = {'quality': step}
+            else:
+                kwargs = {'colors': step, 'compress_level': compress_level}
+            encoded = encode_image(fig, dpi * scale, fmt, **kwargs)
+            if data is None or len(encoded) < len(data):
+                data = encoded
+            if not max_bytes or len(data) <= max_bytes:
+                break
+        else:
+            continue
+        break
+    if max_bytes and len(data) > max_bytes:
+        log.warning(f"{filename} is {len(data)} bytes over {max_bytes}")
+    with open(filename, 'wb') as f:
+        f.write(data)
+
+
+def plot(df, axes, filename="figure.png", registry=None, output=None):
     """
     Plot time series data and Save to PNG file
 
@@ -119,8 +305,32 @@ def plot(df, axes, filename="figure.png"):
         axes infromation for plot
     filename : str
         png filename
+    registry : co2.payload.SchemaRegistry
+        payload schemas, guessed for each topic if None
+    output : dict or None
+        output options, see output_options()
+
+    Returns
+    -------
+    filename : str
+        saved filename, the extension follows the output format
     """
-    fig = plt.figure(figsize=(15, 4*len(axes)))
+    import matplotlib.dates as mdates
+    plt = pyplot()
+    if registry is None:
+        registry = payload.SchemaRegistry()
+
+    figsize = (15, 4*len(axes))
+    if output:
+        dpi = output.get('dpi', plt.rcParams['figure.dpi'])
+        if output.get('width'):
+            ratio = output['width'] / dpi / figsize[0]
+            figsize = (figsize[0] * ratio, figsize[1] * ratio)
+        if output.get('height'):
+            figsize = (figsize[0], output['height'] / dpi)
+        fig = plt.figure(figsize=figsize, dpi=dpi)
+    else:
+        fig = plt.figure(figsize=figsize)
     for i, axis in enumerate(axes):
         ax = fig.add_subplot(len(axes), 1, i+1)
         if axis.get('name'):
@@ -133,7 +343,7 @@ def plot(df, axes, filename="figure.png"):
         for d in data:
             topic = d.get('topic')
             column = d.get('column')
-            ser = extract_plot_data(df, topic, column)
+            ser = extract_plot_data(df, topic, column, registry)
             if len(ser) > 0:
                 ax.plot(ser.index, ser, label=topic)
 
@@ -156,8 +366,62 @@ def plot(df, axes, filename="figure.png"):
         ax.spines['left'].set_visible(False)
         ax.spines['right'].set_visible(False)
 
+    registry.report()
     fig.tight_layout()
-    plt.savefig(filename)
+    try:
+        if output:
+            filename = output_filename(filename, output)
+            save_figure(fig, filename, output)
+        else:
+            fig.savefig(filename)
+    finally:
+        plt.close(fig)
+    return filename
+
+
+def read_latest(database, table, topics, tz='UTC'):
+    """
+    Read the latest row of each topic without pandas
+
+    Parameters
+    ----------
+    database : str
+        SQLite3 database filename
+    table : str
+        table name in database
+    topics : list
+        topics to look up
+    tz : str
+        timezone
+
+    Returns
+    -------
+    latest : dict
+        topic -> (timestamp as aware datetime, payload)
+    """
+    latest = {}
+    conn = sqlite3.connect(database)
+    try:
+        for topic in topics:
+            # walk the timestamp primary key backwards and stop at the
+            # first hit instead of scanning the whole table
+            row = conn.execute(
+                'SELECT timestamp, payload FROM %s WHERE topic = ? '
+                'ORDER BY timestamp DESC LIMIT 1' % table,
+                (topic,)
+            ).fetchone()
+            if row is None:
+                continue
+            timestamp = datetime.fromtimestamp(
+                row[0] // 1_000_000_000, tz=ZoneInfo(tz))
+            latest[topic] = (timestamp, row[1])
+    except Exception as e:
+        print(e)
+        exit(0)
+    finally:
+        conn.close()
+
+    return latest
 
 
 def get_latest(config="co2plot.json"):
@@ -183,14 +447,19 @@ def get_latest(config="co2plot.json"):
         exit(0)
     table = config.get('table', DEFAULT_TABLE)
     tz = config.get('timezone', 'UTC')
-    df = read_database(database, table, tz=tz)
-    latest = df.sort_values("timestamp").groupby("topic").tail(1)
+    topics = []
+    for axis in config["axes"]:
+        for d in axis["data"]:
+            if d["topic"] not in topics:
+                topics.append(d["topic"])
+    latest = read_latest(database, table, topics, tz=tz)
+    registry = load_registry(config)
 
     all_measurement = {}
-    for index, row in latest.iterrows():
-        all_measurement[row.topic] = {
-            "payload": guess_xsv(row.payload),
-            "timestamp": index.strftime("%Y-%m-%dT%H:%M:%S%z"),  # type: ignore
+    for topic, (timestamp, data) in latest.items():
+        all_measurement[topic] = {
+            "payload": registry.decode(topic, data),
+            "timestamp": timestamp.strftime("%Y-%m-%dT%H:%M:%S%z"),
         }
 
     measurement = {}
@@ -201,45 +470,67 @@ def get_latest(config="co2plot.json"):
                 continue
             if not topic.get("metadata"):
                 topic["metadata"] = {}
-            if not topic["payload"].get(d["column"]):
+            key = registry.key(d["topic"], d["column"])
+            if not topic["payload"].get(key):
                 continue
-            topic["metadata"][d["column"]] = {
+            topic["metadata"][key] = {
                 "name": axis["name"],
                 "unit": axis["unit"],
             }
             measurement[d["topic"]] = topic
+    registry.report()
 
     return measurement
 
 
-def figure(days=None, config="co2plot.json", filename="figure.png"):
+def to_utc(date):
+    """
+    Convert date (local midnight) or naive local datetime into UTC
+    """
+    if not isinstance(date, datetime):
+        date = datetime.combine(date, time(0, 0, 0))
+    return date.astimezone(timezone.utc)
+
+
+def figure(days=None, config="co2plot.json", filename="figure.png",
+           output=None):
     """
     Plot time series data and Save to PNG file
 
     Parameters
     ----------
-    days : int or list(begin, end) or None
-        plot from 'days' to now or from begin to end or all
+    days : int or tuple(begin, end) or None
+        plot from 'days' to now or from begin to end or all.
+        begin and end are dates, or naive local datetimes for ranges
+        shorter than a day
     config : str
         axes configuration
     filename : str
         output PNG filename
+    output : dict or None
+        output options overriding 'output' in configuration
 
     Returns
     -------
     values : str
-        plotted filename or None
+        plotted filename or None. The extension is replaced when the
+        output format is not PNG
+
+    Raises
+    ------
+    OutputError
+        invalid output options
     """
 
     f = open(config, 'r', encoding='utf-8')
     plot_config = json.load(f)
+    options = output_options(plot_config, output)
     database = plot_config.get('database', DEFAULT_DATABASE)
     if not os.path.exists(database):
         print("cannot read '%s'" % database)
         exit(0)
     table = plot_config.get('table', DEFAULT_TABLE)
     tz = plot_config.get('timezone', 'UTC')
-    df = read_database(database, table, tz=tz)
     begin = None
     end = None
     if days:
@@ -247,14 +538,11 @@ def figure(days=None, config="co2plot.json", filename="figure.png"):
             now = datetime.now(timezone.utc)
             begin = now - timedelta(days=days)
         elif type(days) == tuple and len(days) == 2:
-            start_of_day = time(0, 0, 0)
             if days[0]:
-                begin = datetime.combine(days[0], start_of_day).astimezone(
-                    timezone.utc)
+                begin = to_utc(days[0])
             if days[1]:
-                end = datetime.combine(days[1], start_of_day).astimezone(
-                    timezone.utc)
-    df = df[begin:end]
+                end = to_utc(days[1])
+    df = read_database(database, table, tz=tz, begin=begin, end=end)
     if len(df.index) == 0:
         return None
     axes = plot_config.get('axes')
@@ -262,8 +550,7 @@ def figure(days=None, config="co2plot.json", filename="figure.png"):
         print("axes not found in config")
         exit(0)
 
-    plot(df, axes, filename)
-    return filename
+    return plot(df, axes, filename, load_registry(plot_config), options)
 
 
 def main():
@@ -286,6 +573,43 @@ def main():
         type=int,
         help='Plot data from "days" to today'
     )
+    parser.add_argument(
+        '-r',
+        '--range',
+        help='Plot data in DATE range such as "6h", "90min", '
+             '"08:00-12:00" or "2024-01-01..2024-01-15"'
+    )
+    parser.add_argument(
+        '-f',
+        '--format',
+        choices=OUTPUT_FORMATS,
+        help='Output image format'
+    )
+    parser.add_argument(
+        '--dpi',
+        type=float,
+        help='Output resolution'
+    )
+    parser.add_argument(
+        '--width',
+        type=int,
+        help='Output width in pixels'
+    )
+    parser.add_argument(
+        '--height',
+        type=int,
+        help='Output height in pixels'
+    )
+    parser.add_argument(
+        '--colors',
+        type=int,
+        help='Number of PNG palette colors'
+    )
+    parser.add_argument(
+        '--max-bytes',
+        type=int,
+        help='Shrink the image until it fits in MAX_BYTES'
+    )
     parser.add_argument(
         '-n',
         '--now',
@@ -321,7 +645,27 @@ def main():
                 mes += "\n"
         print(mes, end="")
     else:
-        figure(days=args.days, config=args.config, filename=args.png)
+        days = args.days
+        if args.range is not None:
+            from co2 import dateparser
+            days = dateparser.parse(args.range)
+            if days is None:
+                print(f"cannot parse range '{args.range}'")
+                exit(1)
+        output = {
+            'format': args.format,
+            'dpi': args.dpi,
+            'width': args.width,
+            'height': args.height,
+            'colors': args.colors,
+            'max_bytes': args.max_bytes,
+        }
+        try:
+            figure(days=days, config=args.config, filename=args.png,
+                   output=output)
+        except OutputError as e:
+            print(e)
+            exit(0)
 
 
 if __name__ == '__main__':
@@ -5,6 +5,41 @@ import time
 from dateutil.relativedelta import relativedelta
 
 DAYS = {"d": 1, "w": 7, "m": 30, "y": 365}
+MINUTES = {"h": 60, "hr": 60, "hour": 60, "hours": 60,
+           "min": 1, "mins": 1, "minute": 1, "minutes": 1}
+
+
+def as_datetime(date):
+    if isinstance(date, datetime.datetime):
+        return date
+    return datetime.datetime.combine(date, datetime.time())
+
+
+def parse_range(begin, end):
+    from_date = None
+    to_date = None
+    if begin:
+        res = parse(begin)
+        if res is None:
+            return None
+        from_date = res[0]
+    if end:
+        res = parse(end)
+        if res is None:
+            return None
+        to_date = res[1]
+    if from_date is None and to_date is None:
+        return None
+
+    if from_date is not None and to_date is not None:
+        if isinstance(from_date, datetime.datetime) or \
+                isinstance(to_date, datetime.datetime):
+            from_date = as_datetime(from_date)
+            to_date = as_datetime(to_date)
+        if from_date >= to_date:
+            return None
+
+    return (from_date, to_date)
 
 
 def parse(date):
@@ -12,6 +47,11 @@ def parse(date):
     from_date = None
     to_date = None
 
+    # explicit range FROM..TO, either side may be omitted
+    result = re.match(r"^\s*(.*?)\s*\.\.\s*(.*?)\s*$", date)
+    if result:
+        return parse_range(*result.groups())
+
     if date == "":
         from_date = datetime.date(1970, 1, 1)
         to_date = today
@@ -49,6 +89,33 @@ def parse(date):
         from_date = today - lastdays
         to_date = today
 
+    # last N hours, minutes
+    result = re.match(r"^\s*(\d+)\s*([a-zA-Z]+)\s*$", date)
+    if result and result.group(2).lower() in MINUTES:
+        num = int(result.group(1))
+        minutes = MINUTES[result.group(2).lower()]
+        now = datetime.datetime.now().replace(second=0, microsecond=0)
+        from_date = now - datetime.timedelta(minutes=num*minutes)
+        to_date = now
+
+    # time of day hh:mm-hh:mm, yesterday if it has not started yet
+    result = re.match(
+        r"^\s*([012]?\d):([0-5]\d)\s*-\s*([012]?\d):([0-5]\d)\s*$", date)
+    if result:
+        begin_h, begin_m, end_h, end_m = map(int, result.groups())
+        if begin_h > 23 or end_h > 24 or (end_h == 24 and end_m > 0):
+            return None
+        now = datetime.datetime.now()
+        from_date = datetime.datetime.combine(
+            today, datetime.time(begin_h, begin_m))
+        if from_date > now:
+            from_date -= datetime.timedelta(days=1)
+        to_date = datetime.datetime.combine(
+            from_date.date(), datetime.time()) \
+            + datetime.timedelta(hours=end_h, minutes=end_m)
+        if to_date <= from_date:
+            to_date += datetime.timedelta(days=1)
+
     # date mm/dd or mm-dd
     result = re.match(r"^\s*([10]*\d)[-/]([0123]*\d)\s*$", date)
     if result:
@@ -126,10 +193,10 @@ def parse(date):
 if __name__ == "__main__":
     dates = (
         "1", "29", "2020",
-        "1d", "2w", "3m", "4y",
+        "1d", "2w", "3m", "4y", "6h", "90min",
         "1/2", "12/31", "02-03",
         "wed", "Sunday", "Feb", "December", "today",
-        ""
+        "08:00-12:00", "2020-01-01..2020-01-15", "",
     )
     print("today:", datetime.date.today().strftime("%Y-%m-%d"))
 
@@ -137,5 +204,5 @@ if __name__ == "__main__":
         print(f"'{date}'")
         res = parse(date)
         if res:
-            print("  from:", res[0].strftime("%Y-%m-%d"))
-            print("    to:", res[1].strftime("%Y-%m-%d"))
+            print("  from:", res[0])
+            print("    to:", res[1])
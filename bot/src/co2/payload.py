@@ -0,0 +1,200 @@
+""" Decode measurement payloads """
+
+import json
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class PayloadError(Exception):
+    pass
+
+
+def decode_csv(data):
+    """
+    Convert comma separated values into dict
+
+    Parameters
+    ----------
+    data : str
+        CSV
+
+    Returns
+    -------
+    dict :
+        column index -> value
+    """
+    return {k: float(v) for k, v in enumerate(data.split(','))}
+
+
+def decode_ssv(data):
+    """
+    Convert space or tab separated values into dict
+
+    Parameters
+    ----------
+    data : str
+        SSV or TSV
+
+    Returns
+    -------
+    dict :
+        column index -> value
+    """
+    return {k: float(v) for k, v in enumerate(data.split())}
+
+
+def decode_json(data):
+    """
+    Convert JSON object or array into dict
+
+    Parameters
+    ----------
+    data : str
+        JSON
+
+    Returns
+    -------
+    dict :
+        key or index -> value
+    """
+    res = json.loads(data)
+    if isinstance(res, list):
+        return {k: v for k, v in enumerate(res)}
+    if not isinstance(res, dict):
+        raise ValueError("JSON payload is neither object nor array")
+    return res
+
+
+DECODERS = {
+    "csv": decode_csv,
+    "ssv": decode_ssv,
+    "json": decode_json,
+}
+
+
+def guess(data):
+    """
+    Try every payload format in turn
+
+    Parameters
+    ----------
+    data : str
+        CSV, TSV, SSV or JSON
+
+    Returns
+    -------
+    (format, dict) :
+        name of the first format that decodes 'data' and the decoded
+        payload, or (None, {}) if nothing matches
+    """
+    for fmt, decoder in DECODERS.items():
+        try:
+            return (fmt, decoder(data))
+        except (ValueError, TypeError, AttributeError):
+            continue
+    return (None, {})
+
+
+class Schema:
+    """
+    payload format and column names of a topic
+
+    'columns' names the fields of CSV and SSV payloads in order, so that
+    axes can refer to a column by name. For JSON payloads it lists the
+    keys every payload must have.
+    """
+    def __init__(self, format, columns=None):
+        if format not in DECODERS:
+            raise PayloadError(f"unknown payload format '{format}'")
+        if columns is not None and not isinstance(columns, list):
+            raise PayloadError("'columns' is not 'list'")
+        self.format = format
+        self.columns = columns
+        self.decoder = DECODERS[format]
+
+    def decode(self, data):
+        res = self.decoder(data)
+        if not self.columns:
+            return res
+        if self.format == "json":
+            missing = [c for c in self.columns if c not in res]
+            if missing:
+                raise ValueError(f"{missing} not found")
+        elif len(res) != len(self.columns):
+            raise ValueError(
+                f"{len(res)} columns but {len(self.columns)} declared")
+        return res
+
+    def key(self, column):
+        """
+        Resolve a column name of CSV or SSV into its index
+        """
+        if self.format != "json" and self.columns and column in self.columns:
+            return self.columns.index(column)
+        return column
+
+
+class SchemaRegistry:
+    """
+    decode payloads topic by topic
+
+    Topics declared in the 'topics' section of co2plot.json are decoded
+    with their own format. Any other topic is guessed once from its first
+    decodable payload and the format is remembered for the rest.
+    """
+    def __init__(self, topics=None):
+        self.schemas = {}
+        self.mismatches = {}
+        if topics is None:
+            topics = {}
+        if not isinstance(topics, dict):
+            raise PayloadError("'topics' is not 'dict'")
+        for topic, conf in topics.items():
+            if not isinstance(conf, dict) or "format" not in conf:
+                raise PayloadError(f"'format' not found in '{topic}'")
+            self.schemas[topic] = Schema(conf["format"], conf.get("columns"))
+
+    def schema(self, topic, sample=None):
+        schema = self.schemas.get(topic)
+        if schema is None and sample is not None:
+            fmt, _ = guess(sample)
+            if fmt is not None:
+                log.debug(f"payload format of '{topic}' is '{fmt}'")
+                schema = Schema(fmt)
+                self.schemas[topic] = schema
+        return schema
+
+    def decode(self, topic, data):
+        schema = self.schema(topic, sample=data)
+        if schema is not None:
+            try:
+                return schema.decode(data)
+            except (ValueError, TypeError, AttributeError):
+                pass
+        self.mismatches[topic] = self.mismatches.get(topic, 0) + 1
+        return {}
+
+    def key(self, topic, column):
+        schema = self.schemas.get(topic)
+        if schema is None:
+            return column
+        return schema.key(column)
+
+    def report(self):
+        """
+        Log and reset the number of payloads that did not match
+
+        Returns
+        -------
+        mismatches : dict
+            topic -> number of rows dropped since the last report
+        """
+        mismatches = self.mismatches
+        self.mismatches = {}
+        for topic, count in mismatches.items():
+            fmt = None
+            if topic in self.schemas:
+                fmt = self.schemas[topic].format
+            log.warning(f"{count} payloads of '{topic}' do not match '{fmt}'")
+        return mismatches
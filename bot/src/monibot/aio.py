@@ -0,0 +1,194 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+from co2 import co2plot
+from monibot.backend import plot_title
+from monibot.dispatcher import Batcher
+from monibot.scheduler import Every, Scheduler, SchedulerError
+from monibot.startup import Subsystems
+from monibot.worker import read_config, WorkerError
+import logging
+log = logging.getLogger(__name__)
+
+# figure name and content
+Figure = Tuple[str, bytes]
+
+
+def executor_slots() -> asyncio.Semaphore:
+    """
+    Limit blocking jobs in the executor to 'max_workers' of the worker
+    section
+    """
+    try:
+        return asyncio.Semaphore(int(read_config().get("max_workers", 4)))
+    except (WorkerError, ValueError, TypeError) as e:
+        log.warning(f"Worker pool: {e}")
+        log.info("Use default worker pool")
+        return asyncio.Semaphore(4)
+
+
+class Coalescer:
+    """
+    coalesce identical requests into one task
+
+    The asyncio counterpart of monibot.worker.SingleFlight. Identical
+    requests arriving while the task is running await the same result.
+    """
+    def __init__(self):
+        self.flights: Dict[Hashable, asyncio.Task] = {}
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self.flights.get(key)
+        if task is None:
+            task = asyncio.create_task(func())
+            self.flights[key] = task
+            task.add_done_callback(lambda t: self.flights.pop(key, None))
+        else:
+            log.debug(f"{key} joins the in-flight job")
+        return await asyncio.shield(task)
+
+
+def on_ready(subsystems: Subsystems, name: str, callback: Callable[[Any], None]) -> None:
+    """
+    Call 'callback' on the running event loop once the subsystem 'name'
+    of monibot.startup.Subsystems is ready
+    """
+    loop = asyncio.get_running_loop()
+    subsystems.on_ready(name, lambda obj: loop.call_soon_threadsafe(callback, obj))
+
+
+async def run_blocking(slots: asyncio.Semaphore, func: Callable, *args: Any) -> Any:
+    loop = asyncio.get_running_loop()
+    async with slots:
+        return await loop.run_in_executor(None, func, *args)
+
+
+def render(dates, config: str, directory: str) -> Optional[Figure]:
+    """
+    Plot into 'directory' and read the figure back into memory, so that
+    every coalesced request can upload it after the file is gone
+    """
+    figure_png = f"{directory}/co2plot{time.time()}.png"
+    log.debug(f"plot to {figure_png}")
+    res = co2plot.figure(days=dates, config=config, filename=figure_png)
+    if not res:
+        return None
+    try:
+        with open(res, "rb") as f:
+            return (os.path.basename(res), f.read())
+    finally:
+        log.debug(f"remove {res}")
+        os.remove(res)
+
+
+async def plot(
+    slots: asyncio.Semaphore,
+    dates,
+    config: str,
+    directory: str,
+) -> Tuple[str, List[Figure]]:
+    try:
+        figure = await run_blocking(slots, render, dates, config, directory)
+    except co2plot.OutputError as e:
+        log.warning(f"co2plot: {e}")
+        return (f"co2plot: {e}", [])
+    if figure is None:
+        return ("no data", [])
+    return (plot_title(dates), [figure])
+
+
+def default_scheduler() -> Scheduler:
+    """
+    Scheduler of the 'scheduler' section, whose retry settings cron()
+    follows
+    """
+    try:
+        return Scheduler()
+    except SchedulerError as e:
+        log.warning(f"Scheduler: {e}")
+        log.info("Use default scheduler")
+        return Scheduler({})
+
+
+async def cron(
+    func: Callable[[], Awaitable[str]],
+    interval_sec: float,
+    queue: Any,
+    scheduler: Optional[Scheduler] = None,
+) -> None:
+    """
+    asyncio counterpart of a job of monibot.scheduler.Scheduler
+
+    Runs are 'interval_sec' apart from the first one however long each
+    run takes, and missed runs are skipped. A failed run is retried with
+    the backoff of 'scheduler', and the job is back on its schedule once
+    it succeeds.
+    """
+    if scheduler is None:
+        scheduler = default_scheduler()
+    every = Every(interval_sec)
+    loop = asyncio.get_running_loop()
+    planned = every.first(loop.time())
+    failures = 0
+    while True:
+        log.debug(f"call '{func.__name__}'")
+        try:
+            ret = await func()
+        except Exception as e:
+            failures += 1
+            backoff = scheduler.backoff(failures)
+            log.warning(f"failed to execute {func.__name__}(): {e}, "
+                        f"retry in {backoff:.0f} seconds")
+            await asyncio.sleep(backoff)
+            continue
+        if failures:
+            log.info(f"{func.__name__} is back on schedule")
+            failures = 0
+        if ret:
+            queue.put_nowait(ret)
+        planned = every.next(planned, loop.time())
+        await asyncio.sleep(max(0.0, planned - loop.time()))
+
+
+class Dispatcher:
+    """
+    asyncio counterpart of monibot.dispatcher.Dispatcher
+
+    'send' is a coroutine function that posts a text and raises on
+    failure.
+    """
+    def __init__(self, send: Callable[[str], Awaitable[None]],
+                 batcher: Optional[Batcher] = None):
+        self.send = send
+        self.batcher = batcher if batcher is not None else Batcher()
+        self.wake = asyncio.Event()
+
+    def put_nowait(
+        self,
+        message: str,
+        urgent: Optional[bool] = None,
+        key: Optional[str] = None,
+    ) -> None:
+        self.batcher.put(message, urgent, key)
+        self.wake.set()
+
+    async def run(self) -> None:
+        try:
+            while True:
+                if self.batcher.next_wait() != 0:
+                    self.wake.clear()
+                    try:
+                        await asyncio.wait_for(self.wake.wait(), self.batcher.wait())
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                batch = self.batcher.take()
+                error = None
+                try:
+                    await self.send(self.batcher.text(batch))
+                except Exception as e:
+                    error = e
+                self.batcher.done(batch, error)
+        finally:
+            self.batcher.close()
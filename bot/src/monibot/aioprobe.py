@@ -0,0 +1,133 @@
+import asyncio
+import atexit
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+import logging
+log = logging.getLogger(__name__)
+
+
+def host_of(target: Any) -> str:
+    """
+    host name of a probe target, the key of its per-host limit
+    """
+    name = target.target
+    if "://" in name:
+        return urlsplit(name).hostname or name
+    return name
+
+
+class ProbeEngine:
+    """
+    run ais_alive() of many targets concurrently
+
+    At most 'max_concurrency' probes run at once, and at most
+    'max_per_host' of them against one host.
+    """
+    def __init__(self, max_concurrency: int = 256, max_per_host: int = 4):
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+
+    async def probe(
+        self,
+        targets: Sequence[Any],
+        session: Any = None,
+        deadline: Optional[float] = None,
+    ) -> List[Tuple[bool, str]]:
+        """
+        Returns (alive, response) of every target; a target that has not
+        answered within 'deadline' seconds, or has raised, is down
+        """
+        if not targets:
+            return []
+        limit = asyncio.Semaphore(self.max_concurrency)
+        hosts: Dict[str, asyncio.Semaphore] = {}
+
+        async def one(target: Any) -> Tuple[bool, str]:
+            per_host = hosts.setdefault(
+                host_of(target), asyncio.Semaphore(self.max_per_host))
+            # a slot of the host first, so waiting for it holds no global slot
+            async with per_host, limit:
+                try:
+                    return await target.ais_alive(session)
+                except Exception as e:
+                    log.warning(f"{target.target}: {e}")
+                    return (False, f"{target.target}: {e}")
+
+        tasks = [asyncio.ensure_future(one(t)) for t in targets]
+        _done, pending = await asyncio.wait(tasks, timeout=deadline)
+        for task in pending:
+            task.cancel()
+        if pending:
+            log.warning(f"{len(pending)} of {len(tasks)} targets did not answer "
+                        f"in {deadline} seconds")
+        return [
+            (False, f"{target.target}: no answer") if task in pending else task.result()
+            for target, task in zip(targets, tasks)
+        ]
+
+
+def new_session() -> Any:
+    """
+    aiohttp session for Web probes, None without aiohttp
+    """
+    try:
+        import aiohttp
+    except ImportError:
+        log.info("aiohttp is not installed, Web probes run on threads")
+        return None
+    return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
+
+
+class LoopThread:
+    """
+    event loop on a thread of its own, shared by the synchronous callers
+    of the process
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.session: Any = None
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=self.loop.run_forever, name="aioprobe", daemon=True)
+                thread.start()
+                atexit.register(self.close)
+            return self.loop
+
+    def close(self) -> None:
+        """
+        Close the shared session and stop the loop
+        """
+        if self.loop is None or not self.loop.is_running():
+            return
+        if self.session is not None:
+            future = asyncio.run_coroutine_threadsafe(self.session.close(), self.loop)
+            try:
+                future.result(5)
+            except Exception as e:
+                log.debug(f"closing session: {e}")
+            self.session = None
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def _call(self, func: Callable[[Any], Awaitable[Any]]) -> Any:
+        if self.session is None:
+            self.session = new_session()
+        return await func(self.session)
+
+    def run(self, func: Callable[[Any], Awaitable[Any]],
+            timeout: Optional[float] = None) -> Any:
+        """
+        Block until 'func', called with the shared aiohttp session,
+        returns on the loop
+        """
+        loop = self.start()
+        future = asyncio.run_coroutine_threadsafe(self._call(func), loop)
+        return future.result(timeout)
+
+
+loop = LoopThread()
@@ -0,0 +1,137 @@
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+import aiohttp
+import zulip
+import logging
+log = logging.getLogger(__name__)
+
+# Zulip sends a heartbeat event to idle long-polls about every 50 seconds
+LONG_POLL_TIMEOUT = aiohttp.ClientTimeout(total=90, connect=10)
+UPLOADED_CACHE_SIZE = 64
+
+
+class AsyncClient:
+    """
+    Zulip REST API on aiohttp
+
+    The credentials and the site are resolved by zulip.Client, so that
+    zuliprc and the ZULIP_* environment variables work as for monibotz.
+    """
+    def __init__(self, session: aiohttp.ClientSession,
+                 client: Optional[zulip.Client] = None):
+        if client is None:
+            client = zulip.Client()
+        self.session = session
+        self.email = client.email
+        self.base_url = client.base_url.rstrip("/") + "/v1/"
+        self.auth = aiohttp.BasicAuth(client.email, client.api_key)
+        # sha256 of uploaded file -> uri
+        self.uploaded: "OrderedDict[str, str]" = OrderedDict()
+
+    async def call_endpoint(
+        self,
+        url: str,
+        method: str = "POST",
+        request: Dict[str, Any] = {},
+        timeout: Optional[aiohttp.ClientTimeout] = None,
+        data: Optional[aiohttp.FormData] = None,
+    ) -> Dict[str, Any]:
+        params = {
+            k: v if isinstance(v, str) else json.dumps(v)
+            for k, v in request.items()
+        }
+        kwargs: Dict[str, Any] = {"auth": self.auth}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        if method == "GET":
+            kwargs["params"] = params
+        else:
+            kwargs["data"] = data if data is not None else params
+        try:
+            async with self.session.request(
+                    method, self.base_url + url, **kwargs) as res:
+                try:
+                    return await res.json(content_type=None)
+                except ValueError:
+                    return {"result": "http-error", "msg": f"status {res.status}"}
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return {"result": "connection-error", "msg": str(e)}
+
+    async def register(self, event_types: Iterable[str]) -> Dict[str, Any]:
+        return await self.call_endpoint(
+            "register", request={"event_types": list(event_types)})
+
+    async def get_events(self, queue_id: str, last_event_id: int) -> Dict[str, Any]:
+        return await self.call_endpoint(
+            "events",
+            method="GET",
+            request={"queue_id": queue_id, "last_event_id": last_event_id},
+            timeout=LONG_POLL_TIMEOUT,
+        )
+
+    async def send_message(self, message_data: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.call_endpoint("messages", request=message_data)
+
+    async def upload_file(self, name: str, content: bytes) -> Optional[str]:
+        digest = hashlib.sha256(content).hexdigest()
+        uri = self.uploaded.get(digest)
+        if uri is not None:
+            self.uploaded.move_to_end(digest)
+            log.debug(f"already uploaded: {name}")
+            return uri
+
+        log.debug(f"upload file: {name}")
+        data = aiohttp.FormData()
+        data.add_field("file", content, filename=name)
+        result = await self.call_endpoint("user_uploads", data=data)
+        log.debug(result)
+        if result["result"] != "success":
+            log.warning(result["msg"])
+            return None
+        uri = result.get("uri", result.get("url"))
+        self.uploaded[digest] = uri
+        while len(self.uploaded) > UPLOADED_CACHE_SIZE:
+            self.uploaded.popitem(last=False)
+        return uri
+
+    async def messages(self, finish: asyncio.Event):
+        """
+        Long-poll the event queue and yield every message
+
+        The queue is registered again when the server forgets it.
+        """
+        queue_id: Optional[str] = None
+        last_event_id = -1
+        while not finish.is_set():
+            if queue_id is None:
+                queue_id, last_event_id = await self.do_register()
+            res = await self.get_events(queue_id, last_event_id)
+            if "error" in res["result"]:
+                if res["result"] == "http-error":
+                    log.warning("HTTP error fetching events --"
+                                "probably a server restart")
+                elif res["result"] == "connection-error":
+                    log.warning(f"Connection error fetching events:\n {res['msg']}")
+                else:
+                    log.warning(f"Server returned error:\n{res['msg']}")
+                    if (res.get("code") == "BAD_EVENT_QUEUE_ID" or
+                            res["msg"].startswith("Bad event queue id:")):
+                        queue_id = None
+                await asyncio.sleep(1)
+                continue
+            for event in res["events"]:
+                last_event_id = max(last_event_id, int(event["id"]))
+                if event["type"] == "message":
+                    yield event["message"]
+
+    async def do_register(self) -> Tuple[str, int]:
+        while True:
+            res = await self.register(event_types=["message"])
+            if "error" in res["result"]:
+                log.warning(f"Server returned error:\n{res['msg']}")
+                await asyncio.sleep(1)
+            else:
+                return (res["queue_id"], res["last_event_id"])
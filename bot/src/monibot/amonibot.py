@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+
+import asyncio
+import logging
+import os
+import re
+import signal
+import tempfile
+from typing import Any, Dict, List, Optional
+import aiohttp
+from slack_bolt.async_app import AsyncApp
+from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+from slack_sdk.errors import SlackApiError
+from slack_sdk.webhook.async_client import AsyncWebhookClient
+from co2 import co2plot, dateparser
+from monibot import aio
+from monibot.backend import add_subsystems, find_co2plot, latest_text, new_subsystems
+from monibot.backend import split_command, usage
+from monibot.dispatcher import Batcher, DispatcherError, RetryAfter
+from monibot.command import add_retry_handlers, async_retry_handlers
+from monibot.home import HomeSnapshot, HOME_REFRESH_SEC, KEEP
+from monibot.startup import Subsystems
+
+
+# global logging settings
+MONIBOT_LOGGING_LEVEL = os.environ.get("MONIBOT_LOGGING_LEVEL")
+if MONIBOT_LOGGING_LEVEL == "info":
+    log_level = logging.INFO
+    formatter = '%(name)s: %(message)s'
+elif MONIBOT_LOGGING_LEVEL == "debug":
+    log_level = logging.DEBUG
+    formatter = '%(asctime)s %(name)s[%(lineno)s] %(levelname)s: %(message)s'
+else:
+    log_level = logging.WARNING  # default debug level
+    formatter = '%(name)s: %(message)s'
+logging.basicConfig(level=log_level, format=formatter)
+log = logging.getLogger('amonibot')
+
+# slack app, built from the environment in amain()
+app: Optional[AsyncApp] = None
+my_user_id = None
+
+# co2plot figure directory
+tmpdir = tempfile.TemporaryDirectory()
+co2plot_fig = tmpdir.name
+
+# book search, forecast, server monitor and IP address, started in amain()
+subsystems: Optional[Subsystems] = None
+
+# one connection pool shared by every fetcher, opened in main()
+session: Optional[aiohttp.ClientSession] = None
+webhook: Optional[AsyncWebhookClient] = None
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=3)
+
+# co2plot renders on threads, 'max_workers' of the worker section at once
+plot_slots = aio.executor_slots()
+flights = aio.Coalescer()
+coalesce = flights.run
+
+
+async def respond(channel: str, message: str,
+                  figures: List[aio.Figure] = []) -> None:
+    try:
+        if figures:
+            await app.client.files_upload_v2(
+                channel=channel,
+                file_uploads=[
+                    {"filename": name, "content": content, "title": message}
+                    for name, content in figures
+                ],
+            )
+        else:
+            await app.client.chat_postMessage(channel=channel, text=message)
+    except SlackApiError as e:
+        log.error(e.response["error"])
+
+
+async def get_latest() -> Dict[str, Any]:
+    return await aio.run_blocking(plot_slots, co2plot.get_latest, CO2PLOT)
+
+
+async def air_event(channel: str, arg: str) -> None:
+    if not CO2PLOT:
+        await respond(channel, "Sorry, the command is out of service.")
+        return
+    arguments = " ".join(arg.split())
+    if arguments == "now":
+        now = await coalesce(("air", arguments), get_latest)
+        await respond(channel, latest_text(now))
+        return
+
+    dates = dateparser.parse(arguments)
+    message, figures = await coalesce(
+        ("air", arguments, dates),
+        lambda: aio.plot(plot_slots, dates, CO2PLOT, co2plot_fig),
+    )
+    await respond(channel, message, figures)
+
+
+async def book_event(channel: str, arg: str) -> None:
+    book = subsystems.get("book")
+    if book is None:
+        await respond(channel, subsystems.unavailable("book", "book"))
+        return
+    await respond(channel, f'"{arg}"...')
+    result_, text = await coalesce(
+        ("book", " ".join(arg.split())),
+        lambda: book.asearch(arg, session),
+    )
+    await respond(channel, text)
+
+
+async def weather_event(channel: str, arg: str) -> None:
+    forecast = subsystems.get("forecast")
+    if forecast is None:
+        await respond(channel, subsystems.unavailable("forecast", "weather"))
+        return
+    summary = await coalesce(
+        ("weather",), lambda: forecast.afetch_summary(session))
+    if not summary:
+        summary = "Sorry, weather forecast is temporarily unavailable."
+    await respond(channel, summary)
+
+
+async def ip_event(channel: str, arg: str) -> None:
+    ip = subsystems.get("ip")
+    if ip is None:
+        await respond(channel, subsystems.unavailable("ip", "ip"))
+        return
+    message = await coalesce(("ip",), lambda: ip.aget(session))
+    if message is None:
+        message = "Failed to fetch IP address."
+    await respond(channel, message)
+
+
+async def ping_event(channel: str, arg: str) -> None:
+    servers = subsystems.get("servers")
+    if servers is None:
+        await respond(channel, subsystems.unavailable("servers", "ping"))
+        return
+    up_down = {True: "UP", False: "DOWN"}
+    targets = await coalesce(("ping",), lambda: servers.aget_status(session))
+    message = ""
+    for target in targets:
+        message += f"{target} is {up_down[targets[target]]}.\n"
+    if not message:
+        message = "no servers"
+    await respond(channel, message)
+
+
+async def help_event(channel: str, arg: str) -> None:
+    cmd = usage(commands, CO2PLOT, subsystems)
+    await respond(channel, f"Usage: {arg} [{cmd}]")
+
+
+commands = {
+    "air": air_event,
+    "book": book_event,
+    "ip": ip_event,
+    "ping": ping_event,
+    "weather": weather_event,
+    "help": help_event,
+    "?": help_event,
+}
+
+
+def parse_command(text):
+    return split_command(text, commands)
+
+
+def get_user_id(text):
+    text = text.strip()
+    result = re.match(r"^<@(\w+?)>\s*(.*)", text)
+    if result:
+        return result.groups()
+    return None, None
+
+
+async def run_command(channel: str, text: str) -> None:
+    cmd, arg = parse_command(text)
+    try:
+        await commands[cmd](channel, arg)
+    except Exception as e:
+        log.exception(f"failed to execute {cmd}: {e}")
+        await respond(channel, "Sorry, the command failed.")
+
+
+async def reply_direct_message(event):
+    if event.get('channel_type') != 'im':
+        return
+    text = event.get("text")
+    if text is None:
+        return
+    await run_command(event["channel"], text)
+
+
+async def reply_mention(event):
+    text = event.get("text")
+    if text is None:
+        return
+    user_id, command = get_user_id(text)
+    if user_id != my_user_id:
+        return
+    await run_command(event["channel"], command)
+
+
+async def nothing() -> None:
+    return None
+
+
+async def keep() -> Any:
+    return KEEP
+
+
+async def refresh_home() -> str:
+    forecast, ip = home.forecast, home.ip
+    if forecast and home.is_stale("observation"):
+        observation = forecast.afetch_observation(session)
+    else:
+        observation = keep() if forecast else nothing()
+    if ip and home.is_stale("address"):
+        address = ip.aget(session)
+    else:
+        address = keep() if ip else nothing()
+    home.update(*await asyncio.gather(
+        get_latest() if CO2PLOT else nothing(),
+        observation,
+        address,
+        return_exceptions=True,
+    ))
+    return ""
+
+
+async def home_opened(client, event):
+    try:
+        await client.views_publish(
+            user_id=event["user"],
+            view=home.view(event["user"]),
+        )
+    except Exception as e:
+        log.error(f"Error publishing home tab: {e}")
+
+
+async def check_temperature() -> str:
+    return await subsystems.get("forecast").acheck_temperature(session)
+
+
+async def check_servers() -> str:
+    targets = await subsystems.get("servers").ais_changed(
+        session,
+        classes={
+            0.9: ":large_yellow_circle:",
+            0.0: ":large_orange_circle:"
+        },
+        class1=":large_green_circle:",
+        class0=":red_circle:",
+    )
+    message = ""
+    for target in targets:
+        message += f"{targets[target]} {target}\n"
+    return message
+
+
+async def send_report(text: str) -> None:
+    res = await webhook.send(text=text)
+    if res.status_code == 429:
+        raise RetryAfter(float(res.headers.get("retry-after", 60)))
+    if res.status_code != 200:
+        raise DispatcherError(f"webhook returned {res.status_code}: {res.body}")
+
+
+CO2PLOT = find_co2plot()
+
+# App Home view rebuilt in the background
+home = HomeSnapshot(CO2PLOT)
+
+
+def create_app(bot_token: str) -> AsyncApp:
+    new_app = AsyncApp(token=bot_token)
+    add_retry_handlers(new_app.client, async_retry_handlers())
+    new_app.event("message")(reply_direct_message)
+    new_app.event("app_mention")(reply_mention)
+    new_app.event("app_home_opened")(home_opened)
+    return new_app
+
+
+async def amain() -> None:
+    global app, session, my_user_id, webhook, subsystems
+    # slack tokens and the incoming webhook for reports
+    settings = {
+        name: os.environ.get(name)
+        for name in ("SLACK_BOT_TOKEN", "SLACK_APP_TOKEN", "REPORT_WEBHOOK")
+    }
+    for name, value in settings.items():
+        if not value:
+            log.critical(f"Environment value '{name}' is not defined")
+            exit(1)
+    app = create_app(settings["SLACK_BOT_TOKEN"])
+    subsystems = new_subsystems()
+    add_subsystems(subsystems)
+
+    session = aiohttp.ClientSession(timeout=HTTP_TIMEOUT)
+    try:
+        result = await app.client.auth_test()
+        if result["ok"]:
+            my_user_id = result["user_id"]
+    except SlackApiError as e:
+        log.critical(f"I don't know who I am: {e}")
+        await session.close()
+        exit(1)
+
+    handler = AsyncSocketModeHandler(app, settings["SLACK_APP_TOKEN"])
+    try:
+        await handler.connect_async()
+    except Exception as e:
+        log.error(f'failed to connect Slack: {e}')
+        await session.close()
+        exit(1)
+
+    webhook = AsyncWebhookClient(settings["REPORT_WEBHOOK"], session=session)
+    try:
+        q = aio.Dispatcher(send_report, Batcher(channel="slack"))
+    except DispatcherError as e:
+        log.warning(f"Report: {e}")
+        log.info("Use default report dispatcher")
+        q = aio.Dispatcher(send_report, Batcher({}, channel="slack"))
+    # retry settings of the crons
+    scheduler = aio.default_scheduler()
+    tasks = [asyncio.create_task(q.run())]
+    tasks.append(asyncio.create_task(
+        aio.cron(refresh_home, HOME_REFRESH_SEC, q, scheduler)))
+
+    def forecast_ready(forecast):
+        home.forecast = forecast
+        tasks.append(asyncio.create_task(
+            aio.cron(check_temperature, forecast.interval_hours*60*60, q, scheduler)))
+
+    def servers_ready(servers):
+        tasks.append(asyncio.create_task(
+            aio.cron(check_servers, servers.ping_interval_sec, q, scheduler)))
+
+    def ip_ready(ip):
+        home.ip = ip
+
+    # initialized on threads after connecting, so a slow upstream only
+    # delays its own command
+    aio.on_ready(subsystems, "forecast", forecast_ready)
+    aio.on_ready(subsystems, "servers", servers_ready)
+    aio.on_ready(subsystems, "ip", ip_ready)
+    subsystems.start()
+    log.info('running.')
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+    await stop.wait()
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    subsystems.shutdown()
+    await handler.close_async()
+    await session.close()
+    log.info('stopped.')
+
+
+def main():
+    asyncio.run(amain())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+#! /usr/bin/env python3
+
+import asyncio
+import logging
+import os
+import signal
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+import aiohttp
+import zulip
+from co2 import co2plot, dateparser
+from monibot import aio
+from monibot.aiozulip import AsyncClient
+from monibot.backend import ZULIP_MENTION, add_subsystems, book_markdown, find_co2plot
+from monibot.backend import latest_text, new_subsystems, split_command, usage
+from monibot.dispatcher import Batcher, DispatcherError
+from monibot.startup import Subsystems
+
+
+# global logging settings
+MONIBOT_LOGGING_LEVEL = os.environ.get("MONIBOT_LOGGING_LEVEL")
+if MONIBOT_LOGGING_LEVEL == "info":
+    log_level = logging.INFO
+    formatter = '%(name)s: %(message)s'
+elif MONIBOT_LOGGING_LEVEL == "debug":
+    log_level = logging.DEBUG
+    formatter = '%(asctime)s %(name)s[%(lineno)s] %(levelname)s: %(message)s'
+else:
+    log_level = logging.WARNING  # default debug level
+    formatter = '%(name)s: %(message)s'
+logging.basicConfig(level=log_level, format=formatter)
+log = logging.getLogger('amonibotz')
+
+
+# report stream and topic, read from the environment in amain()
+zulip_stream = ""
+zulip_topic = ""
+
+# co2plot figure directory
+tmpdir = tempfile.TemporaryDirectory()
+co2plot_fig = tmpdir.name
+
+# book search, forecast, server monitor and IP address, started in amain()
+subsystems: Optional[Subsystems] = None
+
+# one connection pool shared by Zulip and every fetcher, opened in amain()
+session: Optional[aiohttp.ClientSession] = None
+client: Optional[AsyncClient] = None
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=3)
+
+# co2plot renders on threads, 'max_workers' of the worker section at once
+plot_slots = aio.executor_slots()
+flights = aio.Coalescer()
+coalesce = flights.run
+
+
+class Parameter:
+    def __init__(
+            self,
+            arguments: str = "",
+            tag: Dict[str, Any] = {}):
+        self.arguments = arguments
+        self.tag = tag
+
+    async def respond(self, message: str = "",
+                      figures: List[aio.Figure] = [],
+                      filenames: List[str] = []) -> None:
+        tag = dict(self.tag)
+        tag["content"] = message
+        uris = await asyncio.gather(
+            *(client.upload_file(name, content) for name, content in figures))
+        for i, uri in enumerate(uris):
+            if uri is None:
+                continue
+            if tag["content"]:
+                tag["content"] += "\n"
+            if len(filenames) > i:
+                tag["content"] += f"[{filenames[i]}]({uri})"
+            else:
+                tag["content"] += f"[file{i}]({uri})"
+        result = await client.send_message(tag)
+        if result["result"] != "success":
+            log.warning(result["msg"])
+        log.debug(result)
+
+
+async def get_latest() -> Dict[str, Any]:
+    return await aio.run_blocking(plot_slots, co2plot.get_latest, CO2PLOT)
+
+
+async def air_event(param: Parameter) -> None:
+    if not CO2PLOT:
+        await param.respond(message="Sorry, the command is out of service.")
+        return
+    arguments = " ".join(param.arguments.split())
+    if arguments == "now":
+        now = await coalesce(("air", arguments), get_latest)
+        await param.respond(latest_text(now))
+        return
+
+    dates = dateparser.parse(arguments)
+    title, figures = await coalesce(
+        ("air", arguments, dates),
+        lambda: aio.plot(plot_slots, dates, CO2PLOT, co2plot_fig),
+    )
+    if figures:
+        await param.respond(figures=figures, filenames=[title])
+    else:
+        await param.respond(message=title)
+
+
+async def book_event(param: Parameter) -> None:
+    book = subsystems.get("book")
+    if book is None:
+        await param.respond(message=subsystems.unavailable("book", "book"))
+        return
+    await param.respond(message=f'"{param.arguments}"...')
+    result, text_ = await coalesce(
+        ("book", " ".join(param.arguments.split())),
+        lambda: book.asearch(param.arguments, session),
+    )
+    text = book_markdown(result)
+    if text:
+        await param.respond(message=text)
+
+
+async def weather_event(param: Parameter) -> None:
+    forecast = subsystems.get("forecast")
+    if forecast is None:
+        await param.respond(message=subsystems.unavailable("forecast", "weather"))
+        return
+    summary = await coalesce(
+        ("weather",), lambda: forecast.afetch_summary(session, md_type="zulip"))
+    if not summary:
+        summary = "Sorry, weather forecast is temporarily unavailable."
+    await param.respond(message=summary)
+
+
+async def ip_event(param: Parameter) -> None:
+    ip = subsystems.get("ip")
+    if ip is None:
+        await param.respond(message=subsystems.unavailable("ip", "ip"))
+        return
+    message = await coalesce(("ip",), lambda: ip.aget(session))
+    if message is None:
+        message = "Failed to fetch IP address."
+    await param.respond(message=message)
+
+
+async def ping_event(param: Parameter) -> None:
+    servers = subsystems.get("servers")
+    if servers is None:
+        await param.respond(message=subsystems.unavailable("servers", "ping"))
+        return
+    up_down = {True: "UP", False: "DOWN"}
+    targets = await coalesce(("ping",), lambda: servers.aget_status(session))
+    message = ""
+    for target in targets:
+        message += f"{target} is {up_down[targets[target]]}.\n"
+    if not message:
+        message = "no servers"
+    await param.respond(message=message)
+
+
+async def help_event(param: Parameter) -> None:
+    cmd = usage(commands, CO2PLOT, subsystems)
+    await param.respond(message=f"Usage: {cmd}")
+
+
+commands = {
+    "air": air_event,
+    "book": book_event,
+    "ip": ip_event,
+    "weather": weather_event,
+    "ping": ping_event,
+    "help": help_event,
+    "?": help_event,
+}
+
+
+def parse_command(text: str) -> Tuple[str, str]:
+    return split_command(text, commands, ZULIP_MENTION)
+
+
+async def message_handler(msg: Dict[str, Any]) -> None:
+    if msg["sender_email"] == client.email:
+        return
+    content = msg["content"]
+    if content is None:
+        return
+    cmd, arg = parse_command(content)
+    if msg["type"] == "private":
+        tag = dict(
+            type="private",
+            to=[x["id"] for x in msg["display_recipient"]],
+            content="",
+        )
+    else:
+        tag = dict(
+            type="stream",
+            to=msg["display_recipient"],
+            subject=msg["subject"],
+            content="",
+        )
+    param = Parameter(arguments=arg, tag=tag)
+    log.debug(f"cmd: {cmd}, arguments: {param.arguments}, tag: {tag}")
+    try:
+        await commands[cmd](param)
+    except Exception as e:
+        log.exception(f"failed to execute {cmd}: {e}")
+        await param.respond(message="Sorry, the command failed.")
+
+
+async def call_on_message(finish: asyncio.Event) -> None:
+    handlers = set()
+    async for msg in client.messages(finish):
+        log.debug(msg)
+        task = asyncio.create_task(message_handler(msg))
+        handlers.add(task)
+        task.add_done_callback(handlers.discard)
+    log.info("call_on_message is done.")
+
+
+async def check_temperature() -> str:
+    return await subsystems.get("forecast").acheck_temperature(session)
+
+
+async def check_servers() -> str:
+    targets = await subsystems.get("servers").ais_changed(
+        session,
+        classes={0.9: ":yellow_circle:", 0.0: ":orange_circle:"},
+        class1=":green_circle:",
+        class0=":red_circle:",
+    )
+    message = ""
+    for target in targets:
+        message += f"{targets[target]} {target}\n"
+    return message
+
+
+async def send_report(text: str) -> None:
+    result = await client.send_message(dict(
+        type="stream",
+        to=zulip_stream,
+        subject=zulip_topic,
+        content=text,
+    ))
+    if result["result"] != "success":
+        raise DispatcherError(f"Can't send a report: {result['msg']}")
+
+
+CO2PLOT = find_co2plot()
+
+
+async def amain() -> None:
+    global session, client, zulip_stream, zulip_topic, subsystems
+    stream_topic = os.environ.get("ZULIP_MONIBOT_STREAM")
+    if not stream_topic or ":" not in stream_topic:
+        log.critical("Zulip stream:topic is not defined")
+        exit(1)
+    zulip_stream, zulip_topic = stream_topic.split(":", 1)
+    log.debug(f"ZULIP_MONIBOT_STREAM:  #{zulip_stream}>{zulip_topic}")
+    # also checks Zulip environmet variables
+    try:
+        zulip_client = zulip.Client()
+    except zulip.ZulipError as e:
+        log.critical(f"Zulip client: {e}")
+        exit(1)
+
+    session = aiohttp.ClientSession(timeout=HTTP_TIMEOUT)
+    client = AsyncClient(session, zulip_client)
+
+    try:
+        q = aio.Dispatcher(send_report, Batcher(channel="zulip"))
+    except DispatcherError as e:
+        log.warning(f"Report: {e}")
+        log.info("Use default report dispatcher")
+        q = aio.Dispatcher(send_report, Batcher({}, channel="zulip"))
+    # retry settings of the crons
+    scheduler = aio.default_scheduler()
+    tasks = [asyncio.create_task(q.run())]
+
+    def forecast_ready(forecast):
+        tasks.append(asyncio.create_task(
+            aio.cron(check_temperature, forecast.interval_hours*60*60, q, scheduler)))
+
+    def servers_ready(servers):
+        tasks.append(asyncio.create_task(
+            aio.cron(check_servers, servers.ping_interval_sec, q, scheduler)))
+
+    # initialized on threads while the bot polls, so a slow upstream only
+    # delays its own command
+    subsystems = new_subsystems()
+    add_subsystems(subsystems)
+    aio.on_ready(subsystems, "forecast", forecast_ready)
+    aio.on_ready(subsystems, "servers", servers_ready)
+    subsystems.start()
+
+    finish = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, finish.set)
+    log.info('running.')
+    poller = asyncio.create_task(call_on_message(finish))
+    await finish.wait()
+
+    log.info("Wait stopping bot...")
+    poller.cancel()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(poller, *tasks, return_exceptions=True)
+    subsystems.shutdown()
+    await session.close()
+    log.info("done.")
+
+
+def main():
+    asyncio.run(amain())
+
+
+if __name__ == "__main__":
+    main()
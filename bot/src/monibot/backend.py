@@ -0,0 +1,381 @@
+import hashlib
+import os
+import random
+import re
+import signal
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from monibot.book import BookStatus, BookStatusError
+from monibot.getip import GetIP, GetIPError
+from monibot.monitor import OutsideTemperature, Server, MonitorError
+from monibot.ratelimit import RateLimiter, RateLimitError
+from monibot.scheduler import Every, Scheduler, SchedulerError, current_run
+from monibot.startup import Subsystems, StartupError
+from monibot.worker import WorkerPool, WorkerError
+import logging
+log = logging.getLogger(__name__)
+
+# server states of Server.is_changed(), drawn by each frontend
+SERVER_UP = "up"
+SERVER_DOWN = "down"
+SERVER_CLASSES = {0.9: "degraded", 0.0: "failing"}
+
+RELOADABLE = ["book", "forecast", "servers", "ip"]
+
+# names and units of co2plot metadata in replies, names with the format of the value
+ABBREVIATIONS = {
+    "degree celsius": "°",
+    "parcentage": "%",
+    "Temperature": ("🌡", "%.1f"),
+    "Humidity": ("💧", "%.1f"),
+    "Carbon Dioxide": ("💨", "%d"),
+}
+
+# commands in the help, and the subsystems they need
+USAGE = [
+    ("air", "air [now|DATE]"),
+    ("book", "book|TITLE|ISBN-10"),
+    ("ip", "ip"),
+    ("weather", "weather"),
+    ("ping", "ping"),
+    ("cron", "cron [JOB]"),
+]
+COMMAND_SUBSYSTEMS = {
+    "book": "book",
+    "ip": "ip",
+    "weather": "forecast",
+    "ping": "servers",
+}
+
+# mentions of the bot before a Zulip command
+ZULIP_MENTION = r"(?:@\*\*\S+\*\*\s)*"
+
+
+def report_key(message: str) -> Optional[str]:
+    """
+    Returns the idempotency key of a report made by a scheduled job: the
+    job, its scheduled time and the message, so that the same report of
+    the same run is queued once. None outside a job.
+    """
+    run = current_run()
+    if run is None:
+        return None
+    name, due = run
+    digest = hashlib.sha256(message.encode("utf-8")).hexdigest()[:16]
+    return f"{name}:{due:.0f}:{digest}"
+
+
+def put_report(queue: Any, message: str) -> None:
+    key = report_key(message)
+    if key is None:
+        queue.put_nowait(message)
+    else:
+        queue.put_nowait(message, key=key)
+
+
+def measurement(meta: Dict[str, str], value: Any) -> Tuple[str, str]:
+    """
+    Returns the abbreviated name of a co2plot measurement and its value
+    with the unit
+    """
+    name, fmt = ABBREVIATIONS.get(meta["name"], (meta["name"], "%f"))
+    unit = ABBREVIATIONS.get(meta["unit"], meta["unit"])
+    return name, fmt % value + unit
+
+
+def latest_text(now: Dict[str, Any]) -> str:
+    """
+    reply to "air now" from co2plot.get_latest()
+    """
+    text = ""
+    for topic in now:
+        text += f"{topic} ({now[topic]['timestamp']})\n"
+        for n in now[topic]["metadata"]:
+            name, value = measurement(now[topic]["metadata"][n], now[topic]["payload"][n])
+            text += "%6s %s\n" % (name, value)
+    return text
+
+
+def plot_title(dates) -> str:
+    date_format = "%Y-%m-%d"
+    if any(isinstance(d, datetime) for d in dates or ()):
+        date_format = "%Y-%m-%d %H:%M"
+    title = "Measurements "
+    if dates:
+        if dates[0]:
+            title += "from " + dates[0].strftime(date_format) + " "
+        if dates[1]:
+            title += "to " + dates[1].strftime(date_format)
+    return title
+
+
+def book_markdown(result: Dict[str, Any]) -> str:
+    """
+    Zulip reply to a BookStatus search result
+    """
+    if not result:
+        return ""
+    if not result['data']:
+        emoji = [
+            ':collision:',
+            ':moyai:',
+            ':sandal:',
+            ':ramen:',
+            ':jack-o-lantern:'
+        ]
+        return emoji[random.randrange(0, len(emoji))]
+
+    string = f"[{result['book']}]"
+    for title in result['data']:
+        string += f"\n{title}\n"
+        for systemid in result['data'][title]:
+            library = result['data'][title][systemid]
+            if library['status']:
+                for place in library['status']:
+                    string += '- %s(%s): [%s](%s)\n' % (
+                        library['name'], place,
+                        library['status'][place], library['url'])
+            else:
+                string += f"- {library['name']}: 蔵書なし\n"
+    return string
+
+
+def split_command(
+    text: str,
+    commands: Iterable[str],
+    mention: str = "",
+) -> Tuple[str, str]:
+    """
+    Returns the command of 'text' and its argument
+
+    A command may be abbreviated to a unique prefix; any other text is
+    the title of a book search. 'mention' matches what precedes the
+    command.
+    """
+    text = text.strip()
+    result = re.match(mention + r"\s*((\S*)\s*(.*))", text)
+    if result is None:
+        return ("help", "")
+    title, command, arg = result.groups()
+    if command == "":
+        return ("help", "")
+    cmd = [c for c in commands if c.startswith(command)]
+    if len(cmd) != 1:
+        return ("book", title)
+    return (cmd[0], arg)
+
+
+def usage(
+    commands: Iterable[str],
+    co2plot: Optional[str],
+    subsystems: Subsystems,
+    allows: Callable[[str], bool] = lambda command: True,
+) -> str:
+    """
+    Returns the help of the commands that are ready and allowed
+    """
+    def available(command: str) -> bool:
+        if command == "air":
+            return bool(co2plot)
+        name = COMMAND_SUBSYSTEMS.get(command)
+        return name is None or subsystems.get(name) is not None
+
+    commands = set(commands)
+    cmd = [u for c, u in USAGE if c in commands and available(c) and allows(c)]
+    cmd.append("help|?")
+    return '|'.join(cmd)
+
+
+def find_co2plot() -> Optional[str]:
+    """
+    co2plot reads its configuration on every plot, so only the file
+    itself is checked here
+    """
+    co2plot_config = os.environ.get("CO2PLOT")
+    if co2plot_config:
+        if not os.path.exists(co2plot_config):
+            log.info(f"co2plot configration file '{co2plot_config}' not found")
+            co2plot_config = None
+    else:
+        log.info("Environment value 'CO2PLOT' is not defined")
+    return co2plot_config
+
+
+def reload_forecast(forecast: OutsideTemperature) -> OutsideTemperature:
+    return OutsideTemperature(weather=forecast.wt)
+
+
+def reload_servers(servers: Server) -> Server:
+    new_servers = Server()
+    new_servers.adopt(servers)
+    return new_servers
+
+
+def new_subsystems() -> Subsystems:
+    try:
+        return Subsystems()
+    except StartupError as e:
+        log.warning(f"Startup: {e}")
+        log.info("Use default startup timeouts")
+        return Subsystems({})
+
+
+def add_subsystems(subsystems: Subsystems) -> None:
+    """
+    Register the book search, the forecast, the server monitor and the
+    IP address, each initialized on its own thread
+    """
+    subsystems.add("book", BookStatus, (BookStatusError,))
+    subsystems.add("forecast", OutsideTemperature, (MonitorError,),
+                   reload=reload_forecast)
+    subsystems.add("servers", Server, (MonitorError,), reload=reload_servers)
+    subsystems.add("ip", GetIP, (GetIPError,))
+
+
+class Backend:
+    """
+    monitors, fetchers, workers and crons shared by every chat frontend
+
+    A frontend attaches its report queue with the emoji of the server
+    states and the kinds of alert it wants. A report is put to every
+    queue of its kind, so one probe or one forecast download serves all
+    frontends and tenants.
+    """
+    def __init__(
+        self,
+        subsystems: Optional[Subsystems] = None,
+        pool: Optional[WorkerPool] = None,
+        limiter: Optional[RateLimiter] = None,
+        scheduler: Optional[Scheduler] = None,
+    ):
+        if subsystems is None:
+            subsystems = new_subsystems()
+        self.subsystems = subsystems
+
+        if pool is None:
+            try:
+                pool = WorkerPool()
+            except WorkerError as e:
+                log.warning(f"Worker pool: {e}")
+                log.info("Use default worker pool")
+                pool = WorkerPool({})
+        self.pool = pool
+
+        if limiter is None:
+            try:
+                limiter = RateLimiter()
+            except RateLimitError as e:
+                log.warning(f"Rate limit: {e}")
+                log.info("Use default rate limits")
+                limiter = RateLimiter({})
+        self.limiter = limiter
+
+        if scheduler is None:
+            try:
+                scheduler = Scheduler()
+            except SchedulerError as e:
+                log.warning(f"Scheduler: {e}")
+                log.info("Use default scheduler")
+                scheduler = Scheduler({})
+        self.scheduler = scheduler
+
+        self.co2plot = find_co2plot()
+        self.sinks: List[Tuple[Any, Dict[str, str], Set[str]]] = []
+        self.finish = threading.Event()
+
+        add_subsystems(subsystems)
+        subsystems.on_ready("forecast", lambda forecast: self.start_cron(
+            self.check_temperature, forecast.interval_hours*60*60))
+        subsystems.on_ready("servers", lambda servers: self.start_cron(
+            self.check_servers, servers.ping_interval_sec))
+
+    def attach(
+        self,
+        queue: Any,
+        emoji: Dict[str, str],
+        alerts: Iterable[str] = ("temperature", "servers"),
+    ) -> None:
+        """
+        Send reports of 'alerts' to 'queue', drawing server states with
+        'emoji'
+        """
+        self.sinks.append((queue, emoji, set(alerts)))
+
+    def report(self, message: str, kind: str) -> None:
+        for queue, _emoji, alerts in self.sinks:
+            if kind in alerts:
+                put_report(queue, message)
+
+    def check_temperature(self) -> str:
+        forecast = self.subsystems.get("forecast")
+        if forecast is None:
+            return ""
+        message = forecast.check_temperature()
+        if message:
+            self.report(message, "temperature")
+        return ""
+
+    def check_servers(self) -> str:
+        servers = self.subsystems.get("servers")
+        if servers is None:
+            return ""
+        targets = servers.is_changed(
+            classes=SERVER_CLASSES,
+            class1=SERVER_UP,
+            class0=SERVER_DOWN,
+        )
+        for queue, emoji, alerts in self.sinks:
+            if "servers" not in alerts:
+                continue
+            message = ""
+            for target in targets:
+                message += f"{emoji.get(targets[target], targets[target])} {target}\n"
+            if message:
+                put_report(queue, message)
+        return ""
+
+    def start_cron(
+        self,
+        func: Callable[[], str],
+        interval_sec: float,
+        queue: Any = None,
+    ) -> None:
+        """
+        Run 'func' every 'interval_sec', or retime it if it already runs
+        """
+        self.scheduler.add(func.__name__, func, Every(interval_sec), queue=queue)
+
+    def start(self) -> None:
+        self.scheduler.start()
+        self.subsystems.start()
+
+    def reload(self) -> None:
+        self.co2plot = find_co2plot()
+        self.subsystems.reload(RELOADABLE)
+
+    def run(self) -> None:
+        """
+        Block until SIGTERM, reloading on SIGHUP
+        """
+        def terminate(signum, frame):
+            log.info('Signal handler called with signal %d' % signum)
+            self.finish.set()
+
+        def reload(signum, frame):
+            log.info('Signal handler called with signal %d' % signum)
+            self.reload()
+
+        signal.signal(signal.SIGTERM, terminate)
+        signal.signal(signal.SIGHUP, reload)
+        log.info('running.')
+        self.finish.wait()
+
+    def stop(self) -> None:
+        servers = self.subsystems.get("servers")
+        if servers is not None:
+            servers.stop()
+        self.subsystems.shutdown()
+        self.finish.set()
+        self.scheduler.shutdown()
+        self.pool.shutdown(wait=False)
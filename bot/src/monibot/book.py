@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
 
+import asyncio
 import time
 import re
 import os
 import json
 import random
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
 import requests
-from requests_html import HTMLSession
+from requests_html import HTML, HTMLSession
 
 import logging
 log = logging.getLogger(__name__)
@@ -16,6 +17,15 @@ ZEN = "".join(chr(0xff01 + i) for i in range(94))
 HAN = "".join(chr(0x21 + i) for i in range(94))
 ZEN2HAN = str.maketrans(ZEN, HAN)
 
+CALIL_SEARCH_URL = 'https://calil.jp/search'
+CALIL_CHECK_URL = 'https://api.calil.jp/check'
+CALIL_POLLING_INTERVAL = 2  # [sec]
+HONTO_SEARCH_URL = 'https://honto.jp/netstore/search_10'
+HONTO_PARAMS = {
+    'srchf': 1,
+    'tbty': 1,
+}
+
 
 class BookStatusError(Exception):
     pass
@@ -72,11 +82,10 @@ class BookStatus:
 
     def get_isbn_c(self, book: str, max_count: int = 5) -> Dict[str, str]:
         log.debug('get_isbn_c(%s, %d)' % (book, max_count))
-        url = 'https://calil.jp/search'
+        url = CALIL_SEARCH_URL
         params = {
             'q': book
         }
-        isbns = {}
         session = HTMLSession()
         try:
             res = session.get(url, params=params)
@@ -88,7 +97,11 @@ class BookStatus:
                 log.warning('%s return %d' % (url, res.status_code))
                 return None
 
-        title = res.html.find('a.title')
+        return self.parse_isbn_c(res.html, book)
+
+    def parse_isbn_c(self, html: HTML, book: str) -> Dict[str, str]:
+        isbns = {}
+        title = html.find('a.title')
         book_han = book.translate(ZEN2HAN).lower().split()
         for t in title:
             log.debug(f"{t.text}")
@@ -113,14 +126,9 @@ class BookStatus:
 
     def get_isbn_h(self, book: str, max_count: int = 5) -> Dict[str, str]:
         log.debug('get_isbn_h((%s, %d)' % (book, max_count))
-        base_url = "https://honto.jp/netstore/search_10"
-        url = f"{base_url}{book}.html"
-        params = {
-            'srchf': 1,
-            'tbty': 1,
-        }
+        url = f"{HONTO_SEARCH_URL}{book}.html"
+        params = HONTO_PARAMS
         isbns = {}
-        book_link = []
         session = HTMLSession()
         try:
             res = session.get(url, params=params)
@@ -132,7 +140,25 @@ class BookStatus:
                 log.warning('%s return %d' % (url, res.status_code))
                 return None
 
-        title = res.html.find('a.dyTitle')
+        book_link = self.parse_links_h(res.html, book)
+        for title, link in book_link[:max_count]:
+            try:
+                res = session.get(link)
+            except Exception as e:
+                log.warning(e)
+                return None
+            else:
+                if res.status_code != 200:
+                    log.warning('%s return %d' % (link, res.status_code))
+                    return None
+            isbns.update(self.parse_isbn_h(res.html, title))
+
+        log.debug('get_isbn_h(): %s' % isbns)
+        return isbns
+
+    def parse_links_h(self, html: HTML, book: str) -> List[Tuple[str, str]]:
+        book_link = []
+        title = html.find('a.dyTitle')
         book_han = book.translate(ZEN2HAN).lower().split()
         for t in title:
             log.debug(f"{t.text}")
@@ -148,38 +174,27 @@ class BookStatus:
             if match:
                 for link in t.links:
                     book_link.append((t.text.translate(ZEN2HAN), link))
+        return book_link
 
-        for title, link in book_link[:max_count]:
-            try:
-                res = session.get(link)
-            except Exception as e:
-                log.warning(e)
-                return None
-            else:
-                if res.status_code != 200:
-                    log.warning('%s return %d' % (link, res.status_code))
-                    return None
-
-            uls = res.html.find('ul.stItemData')
-            for ul in uls:
-                for li in ul.find('li'):
-                    try:
-                        label, isbn = li.text.split('：')
-                    except ValueError:
-                        continue
-                    result = self.normalize_isbn(isbn)
-                    if result:
-                        isbns[result] = title
-
-        log.debug('get_isbn_h(): %s' % isbns)
+    def parse_isbn_h(self, html: HTML, title: str) -> Dict[str, str]:
+        isbns = {}
+        uls = html.find('ul.stItemData')
+        for ul in uls:
+            for li in ul.find('li'):
+                try:
+                    label, isbn = li.text.split('：')
+                except ValueError:
+                    continue
+                result = self.normalize_isbn(isbn)
+                if result:
+                    isbns[result] = title
         return isbns
 
     def get_book_status(self, isbns, systemids, timeout=60):
         log.debug('get_book_status(%s, %s, %s)' %
                   (isbns, systemids, timeout))
 
-        polling_interval = 2  # [sec]
-        url = 'https://api.calil.jp/check'
+        url = CALIL_CHECK_URL
         params = {
             'appkey': self.CALIL_APPKEY,
             'callback': 'no'
@@ -198,13 +213,13 @@ class BookStatus:
             return []
 
         json_data = res.json()
-        timer = timeout/polling_interval
+        timer = timeout/CALIL_POLLING_INTERVAL
         while json_data['continue'] == 1:
             if timer <= 0:
                 log.warning('calil.jp query time-out')
                 return []
             timer -= 1
-            time.sleep(polling_interval)
+            time.sleep(CALIL_POLLING_INTERVAL)
             try:
                 params = {
                     'appkey': self.CALIL_APPKEY,
@@ -236,6 +251,98 @@ class BookStatus:
             return (result, self.result_by_string(result))
 
         book_status = self.get_book_status(isbns, self.libraries)
+        return self.make_result(result, isbns, book_status)
+
+    async def asearch(self, book, session):
+        """
+        search() on an aiohttp session instead of blocking requests
+        """
+        log.debug('asearch(%s)' % book)
+        result = {'book': book, 'data': {}}
+
+        isbns = await self.aget_isbn_h(book, session)
+        if not isbns:
+            isbns = await self.aget_isbn_c(book, session)
+        if not isbns:
+            return (result, self.result_by_string(result))
+
+        book_status = await self.aget_book_status(isbns, self.libraries, session)
+        return self.make_result(result, isbns, book_status)
+
+    async def aget_html(self, session, url, params=None) -> Optional[HTML]:
+        try:
+            async with session.get(url, params=params) as res:
+                if res.status != 200:
+                    log.warning('%s return %d' % (url, res.status))
+                    return None
+                return HTML(url=str(res.url), html=await res.text())
+        except Exception as e:
+            log.warning(e)
+            return None
+
+    async def aget_json(self, session, url, params):
+        try:
+            async with session.get(url, params=params) as res:
+                if res.status != 200:
+                    log.warning('%s return %d' % (url, res.status))
+                    return None
+                return await res.json(content_type=None)
+        except Exception as e:
+            log.warning(e)
+            return None
+
+    async def aget_isbn_c(self, book: str, session) -> Dict[str, str]:
+        html = await self.aget_html(session, CALIL_SEARCH_URL, {'q': book})
+        if html is None:
+            return None
+        return self.parse_isbn_c(html, book)
+
+    async def aget_isbn_h(self, book: str, session, max_count: int = 5) -> Dict[str, str]:
+        html = await self.aget_html(
+            session, f"{HONTO_SEARCH_URL}{book}.html", HONTO_PARAMS)
+        if html is None:
+            return None
+        book_link = self.parse_links_h(html, book)[:max_count]
+        pages = await asyncio.gather(
+            *(self.aget_html(session, link) for _title, link in book_link))
+        isbns = {}
+        for (title, _link), page in zip(book_link, pages):
+            if page is None:
+                return None
+            isbns.update(self.parse_isbn_h(page, title))
+        return isbns
+
+    async def aget_book_status(self, isbns, systemids, session, timeout=60):
+        params = {
+            'appkey': self.CALIL_APPKEY,
+            'callback': 'no',
+            'isbn': ','.join(isbns.keys()),
+            'systemid': ','.join(systemids),
+        }
+        json_data = await self.aget_json(session, CALIL_CHECK_URL, params)
+        if json_data is None:
+            return []
+
+        timer = timeout/CALIL_POLLING_INTERVAL
+        while json_data['continue'] == 1:
+            if timer <= 0:
+                log.warning('calil.jp query time-out')
+                return []
+            timer -= 1
+            await asyncio.sleep(CALIL_POLLING_INTERVAL)
+            params = {
+                'appkey': self.CALIL_APPKEY,
+                'session': json_data['session'],
+                'callback': 'no'
+            }
+            json_data = await self.aget_json(session, CALIL_CHECK_URL, params)
+            if json_data is None:
+                return []
+
+        log.debug('aget_book_status(): %s' % json_data)
+        return json_data
+
+    def make_result(self, result, isbns, book_status):
         if not book_status:
             return (result, 'Search error :construction:')
 
@@ -1,14 +1,87 @@
 import os
+import threading
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
+from slack_sdk.http_retry.builtin_handlers import (
+    ConnectionErrorRetryHandler,
+    RateLimitErrorRetryHandler,
+    ServerErrorRetryHandler,
+)
+from slack_sdk.http_retry.builtin_async_handlers import (
+    AsyncConnectionErrorRetryHandler,
+    AsyncRateLimitErrorRetryHandler,
+    AsyncServerErrorRetryHandler,
+)
 import logging
 log = logging.getLogger(__name__)
 
+_client = None
+_client_lock = threading.Lock()
+
 
 class CommandStatusError(Exception):
     pass
 
 
+def retry_handlers():
+    return [
+        ConnectionErrorRetryHandler(max_retry_count=2),
+        RateLimitErrorRetryHandler(max_retry_count=3),
+        ServerErrorRetryHandler(max_retry_count=2),
+    ]
+
+
+def async_retry_handlers():
+    """
+    retry_handlers() of an AsyncWebClient
+    """
+    return [
+        AsyncConnectionErrorRetryHandler(max_retry_count=2),
+        AsyncRateLimitErrorRetryHandler(max_retry_count=3),
+        AsyncServerErrorRetryHandler(max_retry_count=2),
+    ]
+
+
+def add_retry_handlers(client, handlers=None):
+    if handlers is None:
+        handlers = retry_handlers()
+    kinds = tuple(type(h) for h in client.retry_handlers)
+    for handler in handlers:
+        if not isinstance(handler, kinds):
+            client.retry_handlers.append(handler)
+
+
+def set_client(client):
+    """
+    Share an existing WebClient, such as slack_bolt App.client, with
+    every Command
+    """
+    global _client
+    with _client_lock:
+        add_retry_handlers(client)
+        _client = client
+
+
+def get_client():
+    """
+    process-wide Slack WebClient shared by every Command
+
+    The client retries on connection errors and server errors, and waits
+    for Retry-After when Slack answers HTTP 429.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            if not os.environ.get("SLACK_BOT_TOKEN"):
+                log.warning("Environment value 'SLACK_BOT_TOKEN' is not difined")
+                return None
+            _client = WebClient(
+                token=os.environ["SLACK_BOT_TOKEN"],
+                retry_handlers=retry_handlers(),
+            )
+        return _client
+
+
 class Command:
     def __init__(
             self,
@@ -17,31 +90,36 @@ class Command:
             message="",
             files=[],
             args={},
-            callback=None):
+            callback=None,
+            client=None,
+            tenant=None):
         self.command = command
         self.channel = channel
         self.message = message
         self.files = files
         self.args = args
+        # WebClient of the workspace, the shared client if None
+        self.client = client
+        self.tenant = tenant
 
     def respond(self):
-        if os.environ.get("SLACK_BOT_TOKEN"):
-            client = WebClient(token=os.environ["SLACK_BOT_TOKEN"])
-        else:
-            log.warning("Environment value 'SLACK_BOT_TOKEN' is not difined")
+        client = self.client if self.client is not None else get_client()
+        if client is None:
             return
 
         if self.files:
             for file in self.files:
                 log.debug(f"result file: {file}")
-                try:
-                    client.files_upload(
-                        channels=self.channel,
-                        file=file,
-                        title=self.message,
-                    )
-                except SlackApiError as e:
-                    log.error(e.response["error"])
+            try:
+                client.files_upload_v2(
+                    channel=self.channel,
+                    file_uploads=[
+                        {"file": file, "title": self.message}
+                        for file in self.files
+                    ],
+                )
+            except SlackApiError as e:
+                log.error(e.response["error"])
         else:
             try:
                 client.chat_postMessage(
@@ -1,6 +1,5 @@
 import threading
 import queue
-import time
 import logging
 log = logging.getLogger(__name__)
 
@@ -39,7 +38,8 @@ class Cron(threading.Thread):
                 ret = self.func(*self.args, **self.kwargs)
             except Exception as e:
                 log.warning(f"failed to execute {self.func.__name__}(): {e}")
-                time.sleep(60)
+                if self.event.wait(60):
+                    break
                 continue
             if self.queue and ret:
                 log.debug(self.queue)
@@ -0,0 +1,317 @@
+import os
+import json
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Set
+from monibot.outbox import Outbox, OutboxError
+import logging
+log = logging.getLogger(__name__)
+
+
+class DispatcherError(Exception):
+    pass
+
+
+class RetryAfter(DispatcherError):
+    """
+    raised by a sender when the platform asks to wait before the next post
+    """
+    def __init__(self, seconds: float):
+        super().__init__(f"retry after {seconds} seconds")
+        self.seconds = seconds
+
+
+DEFAULT_URGENT = ["keep your pipes!!", ":red_circle:"]
+
+
+def read_config() -> Dict[str, Any]:
+    report_config = os.environ.get("REPORT_CONFIG")
+    if not report_config:
+        return {}
+
+    try:
+        f = open(report_config, encoding="utf-8")
+    except (IOError, FileNotFoundError):
+        raise DispatcherError(f"cannot open configuration file '{report_config}'")
+
+    try:
+        conf = json.load(f)
+    except ValueError as e:
+        log.warning(e)
+        raise DispatcherError("cannot parse configuration")
+
+    return conf.get("report", {})
+
+
+class Report:
+    """
+    one queued report message
+
+    'key' is the idempotency key and 'id' the row in the outbox, if any.
+    """
+    def __init__(self, seq: int, message: str, urgent: bool, created: float,
+                 key: str = "", id: Optional[int] = None):
+        self.seq = seq
+        self.message = message
+        self.urgent = urgent
+        self.created = created
+        self.key = key
+        self.id = id
+
+    def __lt__(self, other: "Report") -> bool:
+        return (not self.urgent, self.seq) < (not other.urgent, other.seq)
+
+
+class Batcher:
+    """
+    decide when and what to post to one channel
+
+    Messages arriving within 'window_sec' of the oldest pending one are
+    merged into one post, urgent ones first. Urgent messages do not wait
+    for the window. Posts are at least 'min_interval_sec' apart, and a
+    failed post is retried after 'retry_sec', doubling up to
+    'max_retry_sec', while new messages keep merging in.
+
+    With 'outbox' configured, every report is written to that SQLite
+    file first and reports not delivered before a restart are sent
+    again. At most 'max_memory' reports are kept in memory. The rest wait
+    in the outbox, except urgent ones.
+
+    The Batcher keeps no thread and no lock of its own. Dispatcher and
+    monibot.aio.Dispatcher drive it.
+    """
+    def __init__(
+        self,
+        configuration: Optional[Dict[str, Any]] = None,
+        clock: Callable[[], float] = time.monotonic,
+        channel: str = "report",
+    ):
+        if configuration is None:
+            configuration = read_config()
+        try:
+            self.window = float(configuration.get("window_sec", 2.0))
+            self.min_interval = float(configuration.get("min_interval_sec", 1.0))
+            self.retry = float(configuration.get("retry_sec", 60.0))
+            self.max_retry = float(configuration.get("max_retry_sec", 3600.0))
+            self.max_length = int(configuration.get("max_length", 4000))
+            self.urgent_markers = list(configuration.get("urgent", DEFAULT_URGENT))
+            self.max_memory = int(configuration.get("max_memory", 256))
+            commit_rows = int(configuration.get("commit_rows", 32))
+            commit_interval = float(configuration.get("commit_interval_sec", 1.0))
+        except (ValueError, TypeError) as e:
+            raise DispatcherError(f"invalid report configuration: {e}")
+        log.debug(f"window: {self.window}, min_interval: {self.min_interval}, "
+                  f"retry: {self.retry}-{self.max_retry}")
+
+        self.clock = clock
+        self.pending: List[Report] = []
+        self.seq = itertools.count()
+        self.not_before = 0.0
+        self.backoff = self.retry
+
+        self.outbox: Optional[Outbox] = None
+        self.in_memory: Set[int] = set()
+        self.last_id = 0
+        self.spilled = False
+        if configuration.get("outbox"):
+            try:
+                self.outbox = Outbox(
+                    configuration["outbox"],
+                    channel=channel,
+                    commit_rows=commit_rows,
+                    commit_interval_sec=commit_interval,
+                )
+            except OutboxError as e:
+                # the rest of the configuration still applies
+                log.warning(f"{e}, reports are kept in memory only")
+            else:
+                self.load()
+                if self.pending:
+                    log.info(f"replay {len(self.pending)} reports of '{channel}'")
+
+    def is_urgent(self, message: str) -> bool:
+        return any(marker in message for marker in self.urgent_markers)
+
+    def put(
+        self,
+        message: str,
+        urgent: Optional[bool] = None,
+        key: Optional[str] = None,
+    ) -> Optional[Report]:
+        """
+        Queue a message
+
+        Returns None if a report of the same 'key' is already queued.
+        """
+        if urgent is None:
+            urgent = self.is_urgent(message)
+        if key is None:
+            key = uuid.uuid4().hex
+        report = Report(next(self.seq), message, urgent, self.clock(), key)
+        if self.outbox is not None:
+            report.id = self.outbox.append(key, message, urgent)
+            if report.id is None:
+                return None
+            if not urgent and (self.spilled or len(self.pending) >= self.max_memory):
+                self.spilled = True
+                return report
+            self.in_memory.add(report.id)
+            if not self.spilled:
+                self.last_id = report.id
+        heapq.heappush(self.pending, report)
+        return report
+
+    def load(self) -> None:
+        """
+        Move undelivered reports from the outbox into memory, oldest first
+        """
+        limit = self.max_memory - len(self.pending)
+        if limit <= 0:
+            return
+        rows = self.outbox.pending(limit, after=self.last_id)
+        for id, key, message, urgent in rows:
+            self.last_id = max(self.last_id, id)
+            if id in self.in_memory:
+                continue
+            self.in_memory.add(id)
+            heapq.heappush(self.pending, Report(
+                next(self.seq), message, urgent, self.clock(), key, id))
+        self.spilled = len(rows) == limit
+
+    def restore(self, reports: List[Report]) -> None:
+        for report in reports:
+            heapq.heappush(self.pending, report)
+
+    def next_wait(self) -> Optional[float]:
+        """
+        Returns seconds until the next post is due, 0 if it is due now,
+        or None if nothing is pending
+        """
+        if not self.pending:
+            return None
+        now = self.clock()
+        due = self.not_before
+        if not self.pending[0].urgent:
+            oldest = min(r.created for r in self.pending)
+            due = max(due, oldest + self.window)
+        return max(0.0, due - now)
+
+    def take(self) -> List[Report]:
+        """
+        Pop the reports of the next post, urgent first, up to
+        'max_length' characters
+        """
+        if self.next_wait() != 0:
+            return []
+        batch = [heapq.heappop(self.pending)]
+        length = len(batch[0].message)
+        while self.pending:
+            length += len(self.pending[0].message) + 1
+            if length > self.max_length:
+                break
+            batch.append(heapq.heappop(self.pending))
+        if self.outbox is not None:
+            self.outbox.flush()
+        return batch
+
+    @staticmethod
+    def text(batch: List[Report]) -> str:
+        return "\n".join(r.message.rstrip("\n") for r in batch)
+
+    def done(self, batch: List[Report], error: Optional[Exception] = None) -> None:
+        now = self.clock()
+        if error is None:
+            self.backoff = self.retry
+            self.not_before = now + self.min_interval
+            if self.outbox is not None:
+                ids = [r.id for r in batch]
+                self.outbox.delivered(ids)
+                self.in_memory.difference_update(ids)
+                if self.spilled and len(self.pending) < self.max_memory // 2:
+                    self.load()
+            return
+
+        self.restore(batch)
+        if isinstance(error, RetryAfter):
+            wait = error.seconds
+        else:
+            wait = self.backoff
+            self.backoff = min(self.backoff * 2, self.max_retry)
+        self.not_before = now + wait
+        log.warning(f"failed to send {len(batch)} reports: {error}")
+        log.warning(f"retry to send after {wait} seconds")
+
+    def sync(self) -> Optional[float]:
+        """
+        Commit the outbox if due, and return seconds until the next commit
+        """
+        if self.outbox is None:
+            return None
+        return self.outbox.sync()
+
+    def wait(self) -> Optional[float]:
+        """
+        Returns seconds until the next post or outbox commit, or None
+        """
+        waits = [w for w in (self.next_wait(), self.sync()) if w is not None]
+        return min(waits) if waits else None
+
+    def close(self) -> None:
+        if self.outbox is not None:
+            self.outbox.close()
+
+
+class Dispatcher(threading.Thread):
+    """
+    post reports from one thread through a Batcher
+
+    put_nowait() matches queue.Queue, so that Cron can feed it directly.
+    'send' posts a text and raises on failure.
+    """
+    def __init__(self, send: Callable[[str], None], batcher: Optional[Batcher] = None):
+        super().__init__(name="dispatcher")
+        self.send = send
+        self.batcher = batcher if batcher is not None else Batcher()
+        self.condition = threading.Condition()
+        self.finish = False
+
+    def put_nowait(
+        self,
+        message: str,
+        urgent: Optional[bool] = None,
+        key: Optional[str] = None,
+    ) -> None:
+        with self.condition:
+            self.batcher.put(message, urgent, key)
+            self.condition.notify()
+
+    put = put_nowait
+
+    def run(self) -> None:
+        log.debug("start dispatcher")
+        while True:
+            with self.condition:
+                while not self.finish:
+                    if self.batcher.next_wait() == 0:
+                        break
+                    self.condition.wait(self.batcher.wait())
+                if self.finish:
+                    break
+                batch = self.batcher.take()
+            error = None
+            try:
+                self.send(self.batcher.text(batch))
+            except Exception as e:
+                error = e
+            with self.condition:
+                self.batcher.done(batch, error)
+        self.batcher.close()
+        log.debug("stop dispatcher")
+
+    def abort(self) -> None:
+        with self.condition:
+            self.finish = True
+            self.condition.notify()
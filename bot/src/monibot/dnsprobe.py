@@ -0,0 +1,163 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import dns.asyncresolver
+import dns.exception
+import dns.rdatatype
+import dns.resolver
+import logging
+log = logging.getLogger(__name__)
+
+TIMEOUT_SEC = 3.0
+LIFETIME_SEC = 5.0
+# queries of a probe to several nameservers run on these threads
+MAX_WORKERS = 16
+
+_resolvers: Dict[Tuple[str, float, float, bool], dns.resolver.Resolver] = {}
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_resolver(
+    nameserver: str,
+    timeout: float = TIMEOUT_SEC,
+    lifetime: float = LIFETIME_SEC,
+    aio: bool = False,
+) -> dns.resolver.Resolver:
+    """
+    resolver of 'nameserver' shared by every DNS probe of the process
+
+    The resolver neither reads /etc/resolv.conf nor caches, so every
+    check really asks 'nameserver'. Raises ValueError if 'nameserver'
+    is not an address.
+    """
+    key = (nameserver, timeout, lifetime, aio)
+    with _lock:
+        resolver = _resolvers.get(key)
+        if resolver is None:
+            if aio:
+                resolver = dns.asyncresolver.Resolver(configure=False)
+            else:
+                resolver = dns.resolver.Resolver(configure=False)
+            resolver.nameservers = [nameserver]
+            resolver.timeout = timeout
+            resolver.lifetime = lifetime
+            _resolvers[key] = resolver
+        return resolver
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="dns")
+        return _executor
+
+
+def normalize(text: str) -> str:
+    """
+    compare names case-insensitively and with or without the final dot
+    """
+    return text.strip().rstrip(".").lower()
+
+
+class DNSResult:
+    """
+    one query to one nameserver, round trip time in milliseconds
+
+    'error' is the reason of a failed query, otherwise 'answers' holds
+    the records.
+    """
+    def __init__(self, nameserver: str, qname: str, rdtype: dns.rdatatype.RdataType):
+        self.nameserver = nameserver
+        self.qname = qname
+        self.rdtype = rdtype
+        self.answers: List[str] = []
+        self.rtt_ms = 0.0
+        self.error: Optional[str] = None
+
+    def summary(self) -> str:
+        rdtype = dns.rdatatype.to_text(self.rdtype)
+        text = f"{self.nameserver}: {self.qname} {rdtype} "
+        text += self.error if self.error else ", ".join(self.answers) or "No records"
+        return text + f", {self.rtt_ms:.1f} ms"
+
+
+def answer_result(result: DNSResult, answer: dns.resolver.Answer, elapsed: float) -> None:
+    result.answers = [str(r) for r in answer]
+    # the time of the query that answered, without earlier retries
+    rtt = getattr(answer.response, "time", None)
+    result.rtt_ms = (rtt if rtt is not None else elapsed)*1000
+
+
+def error_text(e: dns.exception.DNSException) -> str:
+    if isinstance(e, dns.resolver.NXDOMAIN):
+        return "Hostname does not exist"
+    if isinstance(e, dns.resolver.NoNameservers):
+        return "No response to dns request"
+    if isinstance(e, dns.exception.Timeout):
+        return "Request Timeout"
+    if isinstance(e, dns.resolver.NoAnswer):
+        return "No answer"
+    return type(e).__name__
+
+
+def query(
+    resolver: dns.resolver.Resolver,
+    qname: str,
+    rdtype: dns.rdatatype.RdataType,
+) -> DNSResult:
+    result = DNSResult(resolver.nameservers[0], qname, rdtype)
+    started = time.monotonic()
+    try:
+        answer = resolver.resolve(qname, rdtype, raise_on_no_answer=False)
+    except dns.exception.DNSException as e:
+        result.error = error_text(e)
+        result.rtt_ms = (time.monotonic() - started)*1000
+    else:
+        answer_result(result, answer, time.monotonic() - started)
+    log.debug(result.summary())
+    return result
+
+
+async def aquery(
+    resolver: dns.asyncresolver.Resolver,
+    qname: str,
+    rdtype: dns.rdatatype.RdataType,
+) -> DNSResult:
+    result = DNSResult(resolver.nameservers[0], qname, rdtype)
+    started = time.monotonic()
+    try:
+        answer = await resolver.resolve(qname, rdtype, raise_on_no_answer=False)
+    except dns.exception.DNSException as e:
+        result.error = error_text(e)
+        result.rtt_ms = (time.monotonic() - started)*1000
+    else:
+        answer_result(result, answer, time.monotonic() - started)
+    log.debug(result.summary())
+    return result
+
+
+def query_all(
+    resolvers: List[dns.resolver.Resolver],
+    qname: str,
+    rdtype: dns.rdatatype.RdataType,
+) -> List[DNSResult]:
+    """
+    Query every resolver in parallel
+    """
+    if len(resolvers) == 1:
+        return [query(resolvers[0], qname, rdtype)]
+    executor = get_executor()
+    futures = [executor.submit(query, r, qname, rdtype) for r in resolvers]
+    return [f.result() for f in futures]
+
+
+async def aquery_all(
+    resolvers: List[dns.asyncresolver.Resolver],
+    qname: str,
+    rdtype: dns.rdatatype.RdataType,
+) -> List[DNSResult]:
+    return list(await asyncio.gather(*(aquery(r, qname, rdtype) for r in resolvers)))
@@ -69,6 +69,25 @@ class GetIP:
         log.debug("exit get(): %s" % ip)
         return ip
 
+    async def aget(self, session):
+        log.debug("aget()")
+        ip = None
+        for i in range(len(self.urls)):
+            self.current_url = (self.current_url + 1) % len(self.urls)
+            url = self.urls[self.current_url]
+            try:
+                async with session.get(url) as res:
+                    if res.status == 200:
+                        ip = await res.text()
+                        break
+                    else:
+                        log.warning('%s return %d' % (url, res.status))
+            except Exception as e:
+                log.warning(e)
+
+        log.debug("exit aget(): %s" % ip)
+        return ip
+
 
 if __name__ == '__main__':
     log_level = logging.DEBUG
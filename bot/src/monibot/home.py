@@ -0,0 +1,174 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from co2 import co2plot
+import monibot
+from monibot.backend import measurement
+import logging
+log = logging.getLogger(__name__)
+
+# the measurements are read from the local database on every refresh, the
+# AMeDAS observation (updated every 10 minutes) and the IP address only
+# once they are older than their max age
+HOME_REFRESH_SEC = 60
+MAX_AGE_SEC = {
+    "observation": 600,
+    "address": 3600,
+}
+# a part of collect() that is still fresh
+KEEP = object()
+
+
+class HomeSnapshot:
+    """
+    prebuilt blocks of the App Home tab
+
+    refresh() collects the latest measurements, the AMeDAS observation
+    and the IP address, and rebuilds the blocks only when one of them has
+    changed. The observation and the address are fetched again only
+    after MAX_AGE_SEC. Opening the Home tab only publishes view().
+    """
+    def __init__(self, co2plot_config=None, forecast=None, ip=None,
+                 clock=time.monotonic):
+        self.co2plot_config = co2plot_config
+        self.forecast = forecast
+        self.ip = ip
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.state: Tuple[Any, Any, Any] = (None, None, None)
+        self.fetched: Dict[str, float] = {}
+        self.blocks = self.build(*self.state)
+
+    def is_stale(self, name: str) -> bool:
+        with self.lock:
+            fetched = self.fetched.get(name)
+        return fetched is None or self.clock() - fetched >= MAX_AGE_SEC[name]
+
+    def collect(self) -> Tuple[Any, Any, Any]:
+        """
+        Returns latest measurements, (observation time, weather summary)
+        and IP address. A part that failed is returned as its exception,
+        a part that is still fresh as KEEP.
+        """
+        def call(func, *args):
+            try:
+                return func(*args)
+            except Exception as e:
+                return e
+
+        latest = observation = address = None
+        if self.co2plot_config:
+            latest = call(co2plot.get_latest, self.co2plot_config)
+        if self.forecast:
+            observation = KEEP
+            if self.is_stale("observation"):
+                observation = call(self.forecast.fetch_observation)
+        if self.ip:
+            address = KEEP
+            if self.is_stale("address"):
+                address = call(self.ip.get)
+        return (latest, observation, address)
+
+    def refresh(self) -> str:
+        self.update(*self.collect())
+        return ""
+
+    def update(self, latest: Any, observation: Any, address: Any) -> bool:
+        """
+        Rebuild the blocks if anything has changed
+
+        A part given as an exception or KEEP keeps its previous value.
+        """
+        with self.lock:
+            now = self.clock()
+            state = []
+            for name, value, previous in zip(
+                    ("latest", "observation", "address"),
+                    (latest, observation, address),
+                    self.state):
+                if value is KEEP:
+                    value = previous
+                elif isinstance(value, Exception):
+                    log.warning(f"failed to refresh {name}: {value}")
+                    value = previous
+                else:
+                    self.fetched[name] = now
+                state.append(value)
+            if tuple(state) == self.state:
+                return False
+            self.state = tuple(state)
+            self.blocks = self.build(*self.state)
+        log.debug("home view is rebuilt")
+        return True
+
+    def build(
+        self,
+        latest: Optional[Dict[str, Any]],
+        observation: Optional[Tuple[int, Optional[str]]],
+        address: Optional[str],
+    ) -> List[Dict[str, Any]]:
+        blocks = []
+        fields = []
+        if latest:
+            air_quality = ""
+            for topic in latest:
+                air_quality += f"{topic} ({latest[topic]['timestamp']})\n"
+                for n in latest[topic]["metadata"]:
+                    name, value = measurement(
+                        latest[topic]["metadata"][n], latest[topic]["payload"][n])
+                    air_quality += f"{name} {value} "
+                air_quality += "\n"
+            fields.append({
+                "type": "mrkdwn",
+                "text": air_quality,
+            })
+        if self.forecast:
+            summary = observation[1] if observation else None
+            if summary is None:
+                summary = (
+                    "Sorry, weather forecast is temporarily unavailable."
+                )
+            fields.append({
+                "type": "mrkdwn",
+                "text": summary,
+            })
+        if fields:
+            blocks.append({
+                "type": "section",
+                "fields": fields
+            })
+        else:
+            blocks.append({
+                "type": "section",
+                "text": {
+                    "type": "mrkdwn",
+                    "text": "No Air Information",
+                }
+            })
+        blocks.append({
+            "type": "divider"
+        })
+        footer = ""
+        if address:
+            footer = f"IP Adderss: {address}\n"
+        footer += f"Version: {monibot.__version__}"
+        blocks.append({
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": footer
+            }
+        })
+        return blocks
+
+    def view(self, user: str) -> Dict[str, Any]:
+        return {
+            "type": "home",
+            "blocks": [{
+                "type": "section",
+                "text": {
+                    "type": "mrkdwn",
+                    "text": "*Welcome :house:, <@" + user + ">*",
+                }
+            }] + self.blocks,
+        }
@@ -0,0 +1,393 @@
+import os
+import asyncio
+import itertools
+import selectors
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+log = logging.getLogger(__name__)
+
+
+class IcmpError(Exception):
+    pass
+
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+ICMPV6_ECHO_REQUEST = 128
+ICMPV6_ECHO_REPLY = 129
+PAYLOAD = b"monibot-echo-req"
+# host names of a round resolved at once
+RESOLVERS = 16
+
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data)//2}H", data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def echo_request(identifier: int, sequence: int, kind: int = ICMP_ECHO_REQUEST) -> bytes:
+    """
+    The kernel overwrites the checksum of an ICMPv6 request
+    """
+    header = struct.pack("!BBHHH", kind, 0, 0, identifier, sequence)
+    csum = checksum(header + PAYLOAD)
+    return struct.pack("!BBHHH", kind, 0, csum, identifier, sequence) + PAYLOAD
+
+
+def parse_reply(packet: bytes, raw: bool,
+                kind: int = ICMP_ECHO_REPLY) -> Optional[Tuple[int, int]]:
+    """
+    Returns (identifier, sequence) of an echo reply, otherwise None
+
+    A raw IPv4 socket receives the IP header too, and a raw socket
+    every ICMP message of the host. A raw IPv6 socket receives no IP
+    header, so 'raw' is False for it.
+    """
+    if raw:
+        if len(packet) < 20:
+            return None
+        packet = packet[(packet[0] & 0x0f)*4:]
+    if len(packet) < 8:
+        return None
+    _kind, _code, _csum, identifier, sequence = struct.unpack("!BBHHH", packet[:8])
+    if packet[0] != kind:
+        return None
+    return identifier, sequence
+
+
+def open_socket(family: int = socket.AF_INET) -> Tuple[socket.socket, bool]:
+    """
+    Returns an ICMP socket of 'family' and whether it is raw
+
+    An unprivileged datagram socket needs the group of the process in
+    net.ipv4.ping_group_range, for IPv6 too, a raw socket needs
+    CAP_NET_RAW.
+    """
+    if family == socket.AF_INET6:
+        name, proto = "ICMPv6", socket.IPPROTO_ICMPV6
+    else:
+        name, proto = "ICMP", socket.IPPROTO_ICMP
+    errors = []
+    for kind, raw in ((socket.SOCK_DGRAM, False), (socket.SOCK_RAW, True)):
+        try:
+            sock = socket.socket(family, kind, proto)
+        except OSError as e:
+            errors.append(str(e))
+            continue
+        sock.setblocking(False)
+        return sock, raw
+    raise IcmpError(f"cannot open {name} socket: {', '.join(errors)}")
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=RESOLVERS, thread_name_prefix="icmp")
+        return _executor
+
+
+def first_address(host: str, infos: list) -> "EchoResult":
+    """
+    EchoResult of 'host' at its first IPv4 address of getaddrinfo(), or
+    its first IPv6 address if it has none
+    """
+    infos = [i for i in infos if i[0] in (socket.AF_INET, socket.AF_INET6)]
+    if not infos:
+        return EchoResult(host, error="failure in name resolution: no address")
+    family, _type, _proto, _name, sockaddr = min(infos, key=lambda i: i[0] != socket.AF_INET)
+    return EchoResult(host, sockaddr[0], family=family)
+
+
+def resolve(host: str) -> "EchoResult":
+    try:
+        infos = socket.getaddrinfo(host, None, type=socket.SOCK_DGRAM)
+    except (socket.gaierror, UnicodeError) as e:
+        return EchoResult(host, error=f"failure in name resolution: {e}")
+    return first_address(host, infos)
+
+
+def resolve_all(hosts: List[str]) -> List["EchoResult"]:
+    """
+    resolve() every host in parallel, so a slow name delays no other
+    """
+    if len(hosts) == 1:
+        return [resolve(hosts[0])]
+    return list(get_executor().map(resolve, hosts))
+
+
+class EchoResult:
+    """
+    echo replies of one host, round trip times in milliseconds
+    """
+    def __init__(self, host: str, address: Optional[str] = None,
+                 error: Optional[str] = None, family: int = socket.AF_INET):
+        self.host = host
+        self.address = address
+        self.family = family
+        self.error = error
+        # no ICMP socket of 'family', the host was not pinged
+        self.socket_error: Optional[str] = None
+        self.sent = 0
+        self.rtts: List[float] = []
+        # called by the receiver thread after every reply
+        self.on_reply: Optional[Callable[[], None]] = None
+
+    @property
+    def received(self) -> int:
+        return len(self.rtts)
+
+    @property
+    def loss(self) -> float:
+        """
+        packet loss in percent
+        """
+        if self.sent == 0:
+            return 100.0
+        return 100.0*(self.sent - self.received)/self.sent
+
+    @property
+    def min(self) -> Optional[float]:
+        return min(self.rtts) if self.rtts else None
+
+    @property
+    def avg(self) -> Optional[float]:
+        return sum(self.rtts)/len(self.rtts) if self.rtts else None
+
+    @property
+    def max(self) -> Optional[float]:
+        return max(self.rtts) if self.rtts else None
+
+    @property
+    def mdev(self) -> Optional[float]:
+        if not self.rtts:
+            return None
+        avg = self.avg
+        return (sum((r - avg)**2 for r in self.rtts)/len(self.rtts))**0.5
+
+    def summary(self) -> str:
+        """
+        the statistics lines of ping(8) in one line
+        """
+        text = (f"{self.sent} packets transmitted, {self.received} received, "
+                f"{self.loss:.0f}% packet loss")
+        if self.rtts:
+            text += (f", rtt min/avg/max/mdev = {self.min:.3f}/{self.avg:.3f}/"
+                     f"{self.max:.3f}/{self.mdev:.3f} ms")
+        return text
+
+
+class EchoEngine:
+    """
+    send echo requests to many hosts over one ICMP socket per address
+    family
+
+    A receiver thread per socket waits on it with a selector and
+    matches every reply to its request by sequence number, so callers
+    on any number of threads share the sockets.
+    """
+    def __init__(self):
+        self.lock = threading.Condition()
+        # family -> (socket, raw)
+        self.sockets: Dict[int, Tuple[socket.socket, bool]] = {}
+        self.identifier = os.getpid() & 0xffff
+        self.sequence = itertools.count()
+        # sequence -> (result, address, time sent)
+        self.pending: Dict[int, Tuple[EchoResult, str, float]] = {}
+        self.threads: List[threading.Thread] = []
+
+    def _open(self, family: int = socket.AF_INET) -> None:
+        """
+        Called with the lock held; raises IcmpError if no socket of
+        'family' can be opened
+        """
+        if family in self.sockets:
+            return
+        sock, raw = open_socket(family)
+        self.sockets[family] = (sock, raw)
+        log.debug(f"ICMP socket of {socket.AddressFamily(family).name} is {'raw' if raw else 'datagram'}")
+        thread = threading.Thread(
+            target=self._receive, args=(sock, raw, family), name="icmp", daemon=True)
+        self.threads.append(thread)
+        thread.start()
+
+    def _receive(self, sock: socket.socket, raw: bool, family: int) -> None:
+        if family == socket.AF_INET6:
+            strip, kind = False, ICMPV6_ECHO_REPLY
+        else:
+            strip, kind = raw, ICMP_ECHO_REPLY
+        selector = selectors.DefaultSelector()
+        selector.register(sock, selectors.EVENT_READ)
+        while True:
+            selector.select(timeout=1.0)
+            while True:
+                try:
+                    packet, peer = sock.recvfrom(2048)
+                except BlockingIOError:
+                    break
+                except OSError as e:
+                    log.warning(f"ICMP receive error: {e}")
+                    break
+                received = time.monotonic()
+                reply = parse_reply(packet, strip, kind)
+                if reply is None:
+                    continue
+                identifier, sequence = reply
+                address = peer[0]
+                # the kernel sets the identifier of a datagram socket
+                if raw and identifier != self.identifier:
+                    continue
+                with self.lock:
+                    request = self.pending.get(sequence)
+                    if request is None or request[1] != address:
+                        continue
+                    del self.pending[sequence]
+                    result, _address, sent = request
+                    result.rtts.append((received - sent)*1000)
+                    self.lock.notify_all()
+                if result.on_reply is not None:
+                    result.on_reply()
+
+    def _send(self, result: EchoResult) -> Optional[int]:
+        """
+        Called with the lock held; returns the sequence number of the
+        request, or None if it could not be sent
+        """
+        sequence = next(self.sequence) & 0xffff
+        sock, _raw = self.sockets[result.family]
+        if result.family == socket.AF_INET6:
+            packet = echo_request(self.identifier, sequence, ICMPV6_ECHO_REQUEST)
+        else:
+            packet = echo_request(self.identifier, sequence)
+        self.pending[sequence] = (result, result.address, time.monotonic())
+        try:
+            sock.sendto(packet, (result.address, 0))
+        except OSError as e:
+            del self.pending[sequence]
+            log.debug(f"{result.host}: {e}")
+            return None
+        result.sent += 1
+        return sequence
+
+    def ping_many(
+        self,
+        hosts: List[str],
+        count: int = 5,
+        interval: float = 0.2,
+        timeout: float = 1.0,
+    ) -> Dict[str, EchoResult]:
+        """
+        Send 'count' echo requests to every host, 'interval' seconds
+        apart, and wait 'timeout' seconds for the last replies
+
+        Raises IcmpError if no host can be pinged for want of an ICMP
+        socket. Otherwise a host of an address family without one has
+        its 'socket_error' set.
+        """
+        results = {r.host: r for r in resolve_all(list(dict.fromkeys(hosts)))}
+        targets = [r for r in results.values() if r.address is not None]
+        if not targets:
+            return results
+
+        families = {r.family for r in targets}
+        errors = {}
+        with self.lock:
+            for family in families:
+                try:
+                    self._open(family)
+                except IcmpError as e:
+                    errors[family] = e
+        if len(errors) == len(families):
+            raise next(iter(errors.values()))
+        for result in targets:
+            if result.family in errors:
+                result.socket_error = str(errors[result.family])
+        targets = [r for r in targets if r.family not in errors]
+
+        sequences = []
+        for i in range(count):
+            if i:
+                time.sleep(interval)
+            with self.lock:
+                for result in targets:
+                    sequence = self._send(result)
+                    if sequence is not None:
+                        sequences.append(sequence)
+
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while any(s in self.pending for s in sequences):
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    break
+                self.lock.wait(wait)
+            for s in sequences:
+                self.pending.pop(s, None)
+        return results
+
+    def ping(self, host: str, count: int = 5, interval: float = 0.2,
+             timeout: float = 1.0) -> EchoResult:
+        return self.ping_many([host], count, interval, timeout)[host]
+
+    async def aping(self, host: str, count: int = 5, interval: float = 0.2,
+                    timeout: float = 1.0) -> EchoResult:
+        """
+        ping() on the running event loop without a thread of its own
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            infos = await loop.getaddrinfo(host, None, type=socket.SOCK_DGRAM)
+        except (socket.gaierror, UnicodeError) as e:
+            return EchoResult(host, error=f"failure in name resolution: {e}")
+        result = first_address(host, infos)
+        if result.address is None:
+            return result
+        replied = asyncio.Event()
+        result.on_reply = lambda: loop.call_soon_threadsafe(replied.set)
+
+        sequences = []
+        with self.lock:
+            self._open(result.family)
+        for i in range(count):
+            if i:
+                await asyncio.sleep(interval)
+            with self.lock:
+                sequence = self._send(result)
+            if sequence is not None:
+                sequences.append(sequence)
+
+        deadline = loop.time() + timeout
+        try:
+            while True:
+                replied.clear()
+                with self.lock:
+                    if not any(s in self.pending for s in sequences):
+                        break
+                wait = deadline - loop.time()
+                if wait <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(replied.wait(), wait)
+                except asyncio.TimeoutError:
+                    break
+        finally:
+            with self.lock:
+                for s in sequences:
+                    self.pending.pop(s, None)
+        return result
+
+
+# shared by every ICMP probe of the process
+engine = EchoEngine()
@@ -1,9 +1,12 @@
+import asyncio
 import contextlib
 import json
 import logging
 import math
 import os
+import threading
 from datetime import datetime, time, timedelta, timezone
+from typing import TYPE_CHECKING
 
 import requests
 from astral import LocationInfo
@@ -11,6 +14,9 @@ from astral.sun import sun
 
 from monibot.ameoffice import AMEDAS_OFFICES
 
+if TYPE_CHECKING:
+    import aiohttp
+
 log = logging.getLogger(__name__)
 
 JST = timezone(timedelta(hours=9))
@@ -27,9 +33,27 @@ class NoEnvironmetVariableError(WeatherError):
 
 
 AMEDAS_DEVICE_URL = "https://www.jma.go.jp/bosai/amedas/const/amedastable.json"
-resp = requests.get(AMEDAS_DEVICE_URL, timeout=(3.0, 10.0))
-resp.raise_for_status()
-AMEDAS_DEVICES: dict[str, dict] = json.loads(resp.text)
+AMEDAS_LATEST_TIME_URL = "https://www.jma.go.jp/bosai/amedas/data/latest_time.txt"
+AMEDAS_MAP_URL = "https://www.jma.go.jp/bosai/amedas/data/map/{}.json"
+FORECAST_URL = "https://www.jma.go.jp/bosai/forecast/data/forecast/{}.json"
+_amedas_devices: dict[str, dict] | None = None
+_amedas_devices_lock = threading.Lock()
+
+
+def amedas_devices() -> dict[str, dict]:
+    """
+    Download the AMeDAS device table on first use
+    """
+    global _amedas_devices
+    with _amedas_devices_lock:
+        if _amedas_devices is None:
+            try:
+                resp = requests.get(AMEDAS_DEVICE_URL, timeout=(3.0, 10.0))
+                resp.raise_for_status()
+                _amedas_devices = json.loads(resp.text)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                raise WeatherError(f"failed to download AMeDAS devices: {e}")
+        return _amedas_devices
 
 
 def amedas_latlon60to10(point: dict) -> tuple[float, float]:
@@ -39,9 +63,10 @@ def amedas_latlon60to10(point: dict) -> tuple[float, float]:
 
 
 def nearest_amedas_device_id(lat: float, lon: float, devices: list[str] | None = None) -> str:
+    table = amedas_devices()
     if devices is None:
-        devices = list(AMEDAS_DEVICES.keys())
-    return min(devices, key=lambda p: math.dist(amedas_latlon60to10(AMEDAS_DEVICES[p]), (float(lat), float(lon))))
+        devices = list(table.keys())
+    return min(devices, key=lambda p: math.dist(amedas_latlon60to10(table[p]), (float(lat), float(lon))))
 
 
 def nearest_temperature_point(lat: float, lon: float) -> str:
@@ -49,10 +74,9 @@ def nearest_temperature_point(lat: float, lon: float) -> str:
     offices = AMEDAS_OFFICES[key]["offices"]
     temp_points = []
     for office in offices:
-        forecast_url = f"https://www.jma.go.jp/bosai/forecast/data/forecast/{office}.json"
         forecast = None
         try:
-            resp = requests.get(forecast_url, timeout=(3.0, 10.0))
+            resp = requests.get(FORECAST_URL.format(office), timeout=(3.0, 10.0))
             resp.raise_for_status()
             forecast = json.loads(resp.text)
         except (requests.exceptions.RequestException, ValueError):
@@ -152,7 +176,7 @@ def amedas_weather(*, sunshine: bool | None, precipitation: bool | None, snow: b
 class Amedas:
     def __init__(self, amedas_device_id: str) -> None:
         self.amedas_device_id = amedas_device_id
-        self.amedas_device = AMEDAS_DEVICES[amedas_device_id]
+        self.amedas_device = amedas_devices()[amedas_device_id]
         self.latest_time = 0
         self.amedas = {}
         lat, lon = amedas_latlon60to10(self.amedas_device)
@@ -240,22 +264,36 @@ class Amedas:
         return values
 
     def fetch(self) -> None:
-        latest_time_url = "https://www.jma.go.jp/bosai/amedas/data/latest_time.txt"
-        resp = requests.get(latest_time_url, timeout=(3.0, 10.0))
+        resp = requests.get(AMEDAS_LATEST_TIME_URL, timeout=(3.0, 10.0))
         resp.raise_for_status()
-        # latest_time.txt: 2024-10-27T10:20:00+09:00
-        dt = datetime.fromisoformat(resp.text)
-        latest_time = int(dt.strftime("%Y%m%d%H%M%S"))
+        latest_time = self.parse_latest_time(resp.text)
         if self.latest_time >= latest_time and self.amedas:
             return
-        amedas_url = f"https://www.jma.go.jp/bosai/amedas/data/map/{latest_time}.json"
-        resp = requests.get(amedas_url, timeout=(3.0, 10.0))
+        resp = requests.get(AMEDAS_MAP_URL.format(latest_time), timeout=(3.0, 10.0))
         resp.raise_for_status()
         self.amedas = json.loads(resp.text)
         self.latest_time = latest_time
 
-    def summary(self, md_type: str = "") -> str | None:
-        self.fetch()
+    async def afetch(self, session: "aiohttp.ClientSession") -> None:
+        async with session.get(AMEDAS_LATEST_TIME_URL) as resp:
+            resp.raise_for_status()
+            latest_time = self.parse_latest_time(await resp.text())
+        if self.latest_time >= latest_time and self.amedas:
+            return
+        async with session.get(AMEDAS_MAP_URL.format(latest_time)) as resp:
+            resp.raise_for_status()
+            self.amedas = json.loads(await resp.text())
+        self.latest_time = latest_time
+
+    @staticmethod
+    def parse_latest_time(text: str) -> int:
+        # latest_time.txt: 2024-10-27T10:20:00+09:00
+        dt = datetime.fromisoformat(text.strip())
+        return int(dt.strftime("%Y%m%d%H%M%S"))
+
+    def summary(self, md_type: str = "", fetch: bool = True) -> str | None:
+        if fetch:
+            self.fetch()
         if not self.amedas:
             return None
         p = self.summary_param()
@@ -306,10 +344,18 @@ class JMAForecast:
     def fetch(self) -> None:
         self.lowest = (None, None)
         self.highest = (None, None)
-        forecast_url = f"https://www.jma.go.jp/bosai/forecast/data/forecast/{self.offices}.json"
-        resp = requests.get(forecast_url, timeout=(3.0, 10.0))
+        resp = requests.get(FORECAST_URL.format(self.offices), timeout=(3.0, 10.0))
         resp.raise_for_status()
-        forecast = json.loads(resp.text)
+        self.parse(json.loads(resp.text))
+
+    async def afetch(self, session: "aiohttp.ClientSession") -> None:
+        self.lowest = (None, None)
+        self.highest = (None, None)
+        async with session.get(FORECAST_URL.format(self.offices)) as resp:
+            resp.raise_for_status()
+            self.parse(json.loads(await resp.text()))
+
+    def parse(self, forecast: list) -> None:
         self.reportDatetime = datetime.fromisoformat(forecast[0]["reportDatetime"])
         areas = forecast[0]["timeSeries"][2]["areas"]
         self.area_name = None
@@ -375,6 +421,9 @@ class Weather:
         self.amedas.fetch()
         self.forecast.fetch()
 
+    async def afetch(self, session: "aiohttp.ClientSession") -> None:
+        await asyncio.gather(self.amedas.afetch(session), self.forecast.afetch(session))
+
     def lowest_highest(self) -> tuple[tuple[float | None, datetime | None], tuple[float | None, datetime | None]]:
         self.forecast.fetch()
         return self.forecast.lowest, self.forecast.highest
@@ -387,8 +436,8 @@ class Weather:
         self.forecast.fetch()
         return self.forecast.highest
 
-    def summary(self, md_type: str = "") -> str | None:
-        return self.amedas.summary(md_type)
+    def summary(self, md_type: str = "", fetch: bool = True) -> str | None:
+        return self.amedas.summary(md_type, fetch=fetch)
 
 
 def amedas_example() -> None:
@@ -1,11 +1,9 @@
 #!/usr/bin/env python3
 
+import functools
 import logging
 import os
 import re
-import signal
-import queue
-import threading
 import time
 import tempfile
 from slack_bolt import App
@@ -13,12 +11,13 @@ from slack_bolt.adapter.socket_mode import SocketModeHandler
 from slack_sdk.errors import SlackApiError
 from slack_sdk import WebhookClient
 from co2 import co2plot, dateparser
-import monibot
-from monibot.book import BookStatus, BookStatusError
-from monibot.command import Command
-from monibot.cron import Cron
-from monibot.monitor import OutsideTemperature, Server, MonitorError
-from monibot.getip import GetIP, GetIPError
+from monibot.backend import Backend, latest_text, plot_title, split_command, usage
+from monibot.command import Command, add_retry_handlers, set_client
+from monibot.dispatcher import Batcher, Dispatcher, DispatcherError, RetryAfter
+from monibot.home import HomeSnapshot, HOME_REFRESH_SEC
+from monibot.tenant import Tenant
+from monibot.worker import WorkerBusyError
+from monibot.worker import SingleFlight
 
 
 # global logging settings
@@ -35,105 +34,102 @@ else:
 logging.basicConfig(level=log_level, format=formatter)
 log = logging.getLogger('monibot')
 
-# slack token and app settings
-if os.environ.get("SLACK_BOT_TOKEN"):
-    try:
-        app = App(token=os.environ["SLACK_BOT_TOKEN"])
-    except Exception as e:
-        log.critical(f"failed to connect to Slack: {e}")
-        exit(1)
-else:
-    log.critical("Environment value 'SLACK_BOT_TOTKEN' is not difined")
-    exit(1)
-if not os.environ.get("SLACK_APP_TOKEN"):
-    log.critical("environment value 'SLACK_APP_TOTKEN' is not difined")
-    exit(1)
-
-my_user_id = None
-try:
-    result = app.client.auth_test()
-    if result["ok"]:
-        my_user_id = result["user_id"]
-except SlackApiError as e:
-    log.critical(f"I don't know who I am: {e}")
-    exit(1)
-
-handler = SocketModeHandler(app, os.environ["SLACK_APP_TOKEN"])
-
-# incoming webhook for reports
-REPORT_WEBHOOK = os.environ.get("REPORT_WEBHOOK")
-if not REPORT_WEBHOOK:
-    log.critical("Environment value 'REPORT_WEBHOOK' is not defined")
-    exit(1)
-else:
-    webhook = WebhookClient(REPORT_WEBHOOK)
-
 # co2plot figure directory
 tmpdir = tempfile.TemporaryDirectory()
 co2plot_fig = tmpdir.name
-finish_monibot = False
-
-
-def signal_handler(signum, frame):
-    global finish_monibot
-    finish_monibot = True
-    log.info('Signal handler called with signal %d' % signum)
-    exit(0)
-
-
-def thread(func):
-    def _wrapper(*args, **kwargs):
-        thread = threading.Thread(target=func, args=args, kwargs=kwargs)
-        log.debug(f"start {func.__name__} thread...")
-        thread.start()
-        return thread
-    return _wrapper
 
-
-@thread
+# shared monitors, fetchers and workers, given to create_app()
+backend = None
+
+
+flights = SingleFlight()
+
+
+class CoalescedCommand(Command):
+    """
+    fan the response of a coalesced job out to every waiting command
+    """
+    def __init__(self, flight, param):
+        super().__init__(command=param.command, channel=param.channel,
+                         client=param.client, tenant=param.tenant)
+        self.flight = flight
+
+    def respond(self):
+        for waiter in flights.land(self.flight):
+            waiter.message = self.message
+            waiter.files = self.files
+            waiter.respond()
+
+
+def worker(name, key=None):
+    def _decorator(func):
+        @functools.wraps(func)
+        def _run(param):
+            try:
+                func(param)
+            finally:
+                if isinstance(param, CoalescedCommand):
+                    for waiter in flights.land(param.flight):
+                        waiter.message = "Sorry, the command failed."
+                        waiter.respond()
+
+        def _wrapper(param):
+            waiter = param
+            if key is not None:
+                flight = flights.join(key(param), param)
+                if flight is None:
+                    return
+                param = CoalescedCommand(flight, param)
+            try:
+                position = backend.pool.submit(name, _run, param)
+            except WorkerBusyError as e:
+                log.warning(f"{name}: {e}")
+                waiters = [waiter]
+                if isinstance(param, CoalescedCommand):
+                    waiters = flights.land(param.flight)
+                for w in waiters:
+                    busy = Command(channel=w.channel, client=w.client)
+                    busy.message = "Sorry, I'm busy. Please try again later."
+                    busy.respond()
+                return
+            if position:
+                busy = Command(channel=waiter.channel, client=waiter.client)
+                busy.message = f"busy, queued #{position}"
+                busy.respond()
+        return _wrapper
+    return _decorator
+
+
+def air_key(param):
+    arguments = " ".join(param.command.split())
+    if arguments == "now":
+        return ("air", arguments)
+    return ("air", arguments, dateparser.parse(arguments))
+
+
+@worker("air", key=air_key)
 def co2_command(param):
-    if CO2PLOT is None:
+    if backend.co2plot is None:
         return
     figure_png = None
     if param.command == "now":
-        now = co2plot.get_latest(config=CO2PLOT)
-        abrvs = {
-            "degree celsius": "°",
-            "parcentage": "%",
-            "Temperature": ("🌡", "%.1f"),
-            "Humidity": ("💧", "%.1f"),
-            "Carbon Dioxide": ("💨", "%d"),
-        }
-        mes = ""
-        for topic in now:
-            mes += f"{topic} ({now[topic]['timestamp']})\n"
-            for n in now[topic]["metadata"]:
-                meta = now[topic]["metadata"][n]
-                (name, fmt) = abrvs.get(meta['name'], (meta['name'], "%f"))
-                unit = abrvs.get(meta['unit'], meta['unit'])
-                val = now[topic]["payload"][n]
-                mes += "%6s " % name
-                mes += fmt % val
-                mes += "%s" % unit
-                mes += "\n"
-        param.message = mes
+        param.message = latest_text(co2plot.get_latest(config=backend.co2plot))
     else:
         dates = dateparser.parse(param.command)
         figure_png = f"{co2plot_fig}/co2plot{time.time()}.png"
         log.debug(f"plot to {figure_png}")
-        res = co2plot.figure(days=dates, config=CO2PLOT, filename=figure_png)
-        if res:
-            date_format = "%Y-%m-%d"
-            title = "Measurements "
-            if dates:
-                if dates[0]:
-                    title += "from " + dates[0].strftime(date_format) + " "
-                if dates[1]:
-                    title += "to " + dates[1].strftime(date_format)
-            param.files = [figure_png]
-            param.message = title
+        try:
+            res = co2plot.figure(days=dates, config=backend.co2plot, filename=figure_png)
+        except co2plot.OutputError as e:
+            log.warning(f"co2plot: {e}")
+            param.message = f"co2plot: {e}"
         else:
-            param.message = "no data"
+            if res:
+                figure_png = res
+                param.files = [res]
+                param.message = plot_title(dates)
+            else:
+                param.message = "no data"
     log.debug(f"command: {param.command}")
     log.debug(f"channel: {param.channel}")
     param.respond()
@@ -145,23 +141,25 @@ def co2_command(param):
 
 
 def book_event(param):
-    @thread
+    @worker("book", key=lambda p: ("book", " ".join(p.command.split())))
     def run_search_book(param):
+        book = backend.subsystems.get("book")
         if book is None:
             return
         result_, text = book.search(param.command)
         param.message = text
         param.respond()
 
-    if not book:
-        param.message = "Sorry, the book command is out of service."
+    unavailable = backend.subsystems.unavailable("book", "book")
+    if unavailable:
+        param.message = unavailable
         param.respond()
     else:
         run_search_book(param)
 
 
 def air_event(param):
-    if not CO2PLOT:
+    if not backend.co2plot:
         param.message = "Sorry, the command is out of service."
         param.respond()
     else:
@@ -169,8 +167,9 @@ def air_event(param):
 
 
 def weather_event(param):
-    @thread
+    @worker("weather", key=lambda p: ("weather",))
     def fetch_summary(param):
+        forecast = backend.subsystems.get("forecast")
         if forecast is None:
             return
         summary = forecast.fetch_summary()
@@ -182,16 +181,18 @@ def weather_event(param):
             )
         param.respond()
 
-    if not forecast:
-        param.message = "Sorry, the weather command is out of service."
+    unavailable = backend.subsystems.unavailable("forecast", "weather")
+    if unavailable:
+        param.message = unavailable
         param.respond()
     else:
         fetch_summary(param)
 
 
 def ip_event(param):
-    @thread
+    @worker("ip", key=lambda p: ("ip",))
     def fetch_ip(param):
+        ip = backend.subsystems.get("ip")
         if ip is None:
             return
         param.message = ip.get()
@@ -199,16 +200,18 @@ def ip_event(param):
             param.message = "Failed to fetch IP address."
         param.respond()
 
-    if not ip:
-        param.message = "Sorry, the ip command is out of service."
+    unavailable = backend.subsystems.unavailable("ip", "ip")
+    if unavailable:
+        param.message = unavailable
         param.respond()
     else:
         fetch_ip(param)
 
 
 def ping_event(param):
-    @thread
+    @worker("ping", key=lambda p: ("ping",))
     def ping_to_server(param):
+        servers = backend.subsystems.get("servers")
         if servers is None:
             return
         up_down = {True: "UP", False: "DOWN"}
@@ -222,28 +225,25 @@ def ping_event(param):
             param.message = "no servers"
         param.respond()
 
-    if not servers:
-        param.message = "Sorry, the ping command is out of service."
+    unavailable = backend.subsystems.unavailable("servers", "ping")
+    if unavailable:
+        param.message = unavailable
         param.respond()
     else:
         ping_to_server(param)
 
 
+def cron_event(param):
+    param.message = backend.scheduler.report(param.command.strip())
+    param.respond()
+
+
 def help_event(param):
-    cmd = []
-    if CO2PLOT:
-        cmd.append("air [now|DATE]")
-    if book:
-        cmd.append("book|TITLE|ISBN-10")
-    if ip:
-        cmd.append("ip")
-    if forecast:
-        cmd.append("weather")
-    if servers:
-        cmd.append("ping")
-    cmd.append("help|?")
-
-    param.message = f"Usage: {param.command} [" + '|'.join(cmd) + "]"
+    def allows(command):
+        return param.tenant is None or param.tenant.allows(command)
+
+    cmd = usage(commands, backend.co2plot, backend.subsystems, allows)
+    param.message = f"Usage: {param.command} [{cmd}]"
     param.respond()
 
 
@@ -253,39 +253,14 @@ commands = {
     "ip": ip_event,
     "ping": ping_event,
     "weather": weather_event,
+    "cron": cron_event,
     "help": help_event,
     "?": help_event,
 }
 
 
 def parse_command(text):
-    text = text.strip()
-    result = re.match(r"\s*((\S*)\s*(.*))", text)
-    if result is None:
-        return ("help", "")
-    title, command, arg = result.groups()
-    if command == "":
-        return ("help", "")
-    cmd = [c for c in commands.keys() if c.startswith(command)]
-    if len(cmd) != 1:
-        return ("book", title)
-    return (cmd[0], arg)
-
-
-@app.event("message")
-def reply_direct_message(say, event, client):
-    if event['channel_type'] != 'im':
-        return
-    text = event.get("text")
-    if text is None:
-        return
-    cmd, arg = parse_command(text)
-    if cmd == "book":
-        say(f'"{arg}"...')
-    param = Command(channel=event["channel"])
-    param.command = arg
-    commands[cmd](param)
-    return
+    return split_command(text, commands)
 
 
 def get_user_id(text):
@@ -296,215 +271,179 @@ def get_user_id(text):
     return None, None
 
 
-@app.event("app_mention")
-def reply_mention(say, event, client):
-    text = event.get("text")
-    if text is None:
-        return
-    user_id, command = get_user_id(text)
-    if user_id != my_user_id:
-        return
-    cmd, arg = parse_command(command)
-    if cmd == "book":
-        say(f'"{arg}"...')
-    param = Command(channel=event["channel"])
-    param.command = arg
-    commands[cmd](param)
-    return
-
-
-@app.event("app_home_opened")
-def home_opened(client, event):
-    view = {
-        "type": "home",
-        "blocks": [],
-    }
-    view["blocks"].append({
-        "type": "section",
-        "text": {
-                "type": "mrkdwn",
-                "text": "*Welcome :house:, <@" + event["user"] + ">*",
-        }
-    })
-    fields = []
-    if CO2PLOT:
-        now = co2plot.get_latest(config=CO2PLOT)
-        if now:
-            abrvs = {
-                "degree celsius": "°",
-                "parcentage": "%",
-                "Temperature": ("🌡", "%.1f"),
-                "Humidity": ("💧", "%.1f"),
-                "Carbon Dioxide": ("💨", "%d"),
-            }
-            air_quality = ""
-            for topic in now:
-                air_quality += f"{topic} ({now[topic]['timestamp']})\n"
-                for n in now[topic]["metadata"]:
-                    meta = now[topic]["metadata"][n]
-                    (name, fmt) = abrvs.get(meta['name'], (meta['name'], "%f"))
-                    unit = abrvs.get(meta['unit'], meta['unit'])
-                    val = now[topic]["payload"][n]
-                    air_quality += "%s " % name
-                    air_quality += fmt % val
-                    air_quality += "%s" % unit
-                    air_quality += " "
-                air_quality += "\n"
-            fields.append({
-                "type": "mrkdwn",
-                "text": air_quality,
-            })
-    if forecast:
-        summary = forecast.fetch_summary()
-        if summary is None:
-            summary = (
-                "Sorry, weather forecast is temporarily unavailable."
-            )
-        fields.append({
-            "type": "mrkdwn",
-            "text": summary,
-        })
-    if fields:
-        view["blocks"].append({
-            "type": "section",
-            "fields": fields
-        })
-    else:
-        view["blocks"].append({
-            "type": "section",
-            "text": {
-                "type": "mrkdwn",
-                "text": "No Air Information",
-            }
-        })
-    view["blocks"].append({
-        "type": "divider"
-    })
-    footer = ""
-    if ip:
-        ip_address = ip.get()
-        if ip_address:
-            footer = f"IP Adderss: {ip_address}\n"
-    footer += f"Version: {monibot.__version__}"
-    view["blocks"].append({
-        "type": "section",
-        "text": {
-            "type": "mrkdwn",
-            "text": footer
-        }
-    })
-    try:
-        client.views_publish(
-            user_id=event["user"],
-            view=view
-        )
-    except Exception as e:
-        log.error(f"Error publishing home tab: {e}")
-
-
-q = queue.Queue()
-crons = []
-
-CO2PLOT = os.environ.get("CO2PLOT")
-if CO2PLOT:
-    if not os.path.exists(CO2PLOT):
-        log.info(f"co2plot configration file '{CO2PLOT}' not found")
-        CO2PLOT = None
-else:
-    log.info("Environment value 'CO2PLOT' is not defined")
-
-try:
-    book = BookStatus()
-except BookStatusError as e:
-    log.warning(f"Book search: {e}")
-    log.info("Disable book search")
-    book = None
-
-try:
-    forecast = OutsideTemperature()
-    c = Cron(
-        forecast.check_temperature,
-        interval_sec=forecast.interval_hours*60*60,
-        queue=q
-    )
-    crons.append(c)
-except MonitorError as e:
-    log.warning(f"Weather forecast: {e}")
-    log.info("Disable outside temperature message")
-    forecast = None
-
-try:
-    servers = Server()
-
-    def check_servers():
-        if servers is None:
-            return ""
-        targets = servers.is_changed(
-            classes={
-                0.9: ":large_yellow_circle:",
-                0.0: ":large_orange_circle:"
-            },
-            class1=":large_green_circle:",
-            class0=":red_circle:",
-        )
-        message = ""
-        for target in targets:
-            message += f"{targets[target]} {target}\n"
-        return message
-
-    if servers:
-        c = Cron(
-            check_servers,
-            interval_sec=servers.ping_interval_sec,
-            queue=q
-        )
-        crons.append(c)
-except MonitorError as e:
-    log.warning(f"Server monitor: {e}")
-    log.info("Disable server monitor message")
-    servers = None
-
-try:
-    ip = GetIP()
-except GetIPError as e:
-    log.warning(f"Get IP: {e}")
-    log.info("Disable ip")
-    ip = None
+# App Home view shared by every workspace, rebuilt in the background
+home = HomeSnapshot()
 
+# server states of monibot.backend.Backend.check_servers()
+SERVER_EMOJI = {
+    "up": ":large_green_circle:",
+    "degraded": ":large_yellow_circle:",
+    "failing": ":large_orange_circle:",
+    "down": ":red_circle:",
+}
 
-def main():
-    signal.signal(signal.SIGTERM, signal_handler)
-    try:
-        handler.connect()
-    except Exception as e:
-        log.error(f'failed to connect Slack: {e}')
-        exit(1)
-
-    for c in crons:
-        c.start()
-    log.info('running.')
-
-    retry_interval_sec = 60
-    while not finish_monibot:
-        mes = q.get()
-        log.debug(f"dequeue message: {mes}")
-        if mes == "":
-            log.warning(f"message was empty")
-            continue
+
+def refresh_home():
+    home.co2plot_config = backend.co2plot
+    return home.refresh()
+
+
+def forecast_ready(forecast):
+    home.forecast = forecast
+
+
+def ip_ready(ip):
+    home.ip = ip
+
+
+class SlackFrontend:
+    """
+    Socket Mode app and report webhook of one workspace
+    """
+    def __init__(self, tenant):
+        self.tenant = tenant
+        self.identity = f"identity:{tenant.name}"
+
+        # slack token and app settings
+        bot_token = tenant.get("slack_bot_token", "SLACK_BOT_TOKEN")
+        app_token = tenant.get("slack_app_token", "SLACK_APP_TOKEN")
+        if not bot_token:
+            log.critical(f"{tenant.name}: Slack bot token is not defined")
+            exit(1)
+        if not app_token:
+            log.critical(f"{tenant.name}: Slack app token is not defined")
+            exit(1)
+        try:
+            self.app = App(token=bot_token, token_verification_enabled=False)
+            add_retry_handlers(self.app.client)
+        except Exception as e:
+            log.critical(f"failed to connect to Slack: {e}")
+            exit(1)
+        self.app.event("message")(self.reply_direct_message)
+        self.app.event("app_mention")(self.reply_mention)
+        self.app.event("app_home_opened")(self.home_opened)
+        self.handler = SocketModeHandler(self.app, app_token)
+
+        # incoming webhook for reports
+        report_webhook = tenant.get("report_webhook", "REPORT_WEBHOOK")
+        if not report_webhook:
+            log.critical(f"{tenant.name}: report webhook is not defined")
+            exit(1)
+        self.webhook = WebhookClient(report_webhook)
+
+        # coalescing and rate-limited report sender
+        channel = "slack" if tenant.name == "default" else f"slack:{tenant.name}"
+        try:
+            self.q = Dispatcher(self.send_report, Batcher(channel=channel))
+        except DispatcherError as e:
+            log.warning(f"Report: {e}")
+            log.info("Use default report dispatcher")
+            self.q = Dispatcher(self.send_report, Batcher({}, channel=channel))
+        self.q.name = f"dispatcher:{channel}"
+
+    def dispatch(self, say, user, channel, text):
+        cmd, arg = parse_command(text)
+        if not self.tenant.allows(cmd):
+            say(f"Sorry, the {cmd} command is not available here.")
+            return
+        prefix = f"slack:{self.tenant.name}"
+        over_limit = backend.limiter.acquire(
+            cmd, f"{prefix}:{user}", f"{prefix}:{channel}")
+        if over_limit:
+            say(over_limit)
+            return
+        if cmd == "book":
+            say(f'"{arg}"...')
+        param = Command(channel=channel, client=self.app.client,
+                        tenant=self.tenant)
+        param.command = arg
+        commands[cmd](param)
+
+    def reply_direct_message(self, say, event, client):
+        if event['channel_type'] != 'im':
+            return
+        text = event.get("text")
+        if text is None:
+            return
+        self.dispatch(say, event.get("user"), event["channel"], text)
+
+    def reply_mention(self, say, event, client):
+        text = event.get("text")
+        if text is None:
+            return
+        user_id, command = get_user_id(text)
+        my_user_id = backend.subsystems.get(self.identity)
+        if my_user_id is None or user_id != my_user_id:
+            return
+        self.dispatch(say, event.get("user"), event["channel"], command)
+
+    def home_opened(self, client, event):
         try:
-            webhook.send(text=mes)
-            retry_interval_sec = 60
+            client.views_publish(
+                user_id=event["user"],
+                view=home.view(event["user"]),
+            )
+        except Exception as e:
+            log.error(f"Error publishing home tab: {e}")
+
+    def send_report(self, text):
+        res = self.webhook.send(text=text)
+        if res.status_code == 429:
+            raise RetryAfter(float(res.headers.get("retry-after", 60)))
+        if res.status_code != 200:
+            raise DispatcherError(f"webhook returned {res.status_code}: {res.body}")
+
+    def who_am_i(self):
+        result = self.app.client.auth_test()
+        if not result["ok"]:
+            raise SlackApiError("auth_test failed", result)
+        return result["user_id"]
+
+    def start(self):
+        try:
+            self.handler.connect()
         except Exception as e:
-            log.warning(f"caught an exception in webhook.send: {e}")
-            log.warning(f"retry to send after {retry_interval_sec} seconds")
-            q.put(mes)
-            time.sleep(retry_interval_sec)
-            retry_interval_sec *= 2
-
-    for c in crons:
-        c.abort()
-        c.join()
-    handler.close()
+            log.error(f'{self.tenant.name}: failed to connect Slack: {e}')
+            exit(1)
+        self.q.start()
+
+    def stop(self):
+        self.q.abort()
+        self.q.join()
+        self.handler.close()
+
+
+def create_app(shared, tenant=None):
+    """
+    Build the Slack frontend of 'tenant' on 'shared', a
+    monibot.backend.Backend
+
+    Nothing slow happens here: subsystems are initialized concurrently
+    after the bot has connected.
+    """
+    global backend
+    backend = shared
+    if tenant is None:
+        tenant = Tenant("default", "slack")
+    frontend = SlackFrontend(tenant)
+    if tenant.name == "default":
+        set_client(frontend.app.client)
+    backend.attach(frontend.q, SERVER_EMOJI, tenant.alerts)
+    backend.subsystems.add(frontend.identity, frontend.who_am_i, (SlackApiError,))
+    backend.subsystems.on_ready("forecast", forecast_ready)
+    backend.subsystems.on_ready("ip", ip_ready)
+    backend.start_cron(refresh_home, HOME_REFRESH_SEC)
+    return frontend
+
+
+def main():
+    shared = Backend()
+    frontend = create_app(shared)
+    frontend.start()
+    shared.start()
+    shared.run()
+    frontend.stop()
+    shared.stop()
     log.info('stopped.')
 
 
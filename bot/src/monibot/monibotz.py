@@ -1,22 +1,25 @@
 #! /usr/bin/env python3
 
+import functools
+import hashlib
+import io
 import logging
 import os
-import re
-import signal
-import queue
 import threading
 import time
 import tempfile
-import random
-from typing import Any, Tuple, Dict, List, Callable
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Tuple, Dict, List, Callable, Hashable, Optional
 import requests
 import zulip
 from co2 import co2plot, dateparser
-from monibot.book import BookStatus, BookStatusError
-from monibot.getip import GetIP, GetIPError
-from monibot.cron import Cron
-from monibot.monitor import OutsideTemperature, Server, MonitorError
+from monibot.backend import Backend, ZULIP_MENTION, book_markdown, latest_text
+from monibot.backend import plot_title, split_command, usage
+from monibot.dispatcher import Batcher, Dispatcher, DispatcherError
+from monibot.tenant import Tenant
+from monibot.worker import WorkerBusyError
+from monibot.worker import Flight, SingleFlight
 
 
 # global logging settings
@@ -34,63 +37,81 @@ logging.basicConfig(level=log_level, format=formatter)
 log = logging.getLogger('monibotz')
 
 
-# Check Zulip Environmet Variable
-_ = zulip.Client()
-stream_topic = os.environ["ZULIP_MONIBOT_STREAM"]
-zulip_stream, zulip_topic = stream_topic.split(":")
-zulip_email = os.environ["ZULIP_EMAIL"]
-log.debug(f"ZULIP_MONIBOT_STREAM:  #{zulip_stream}>{zulip_topic}")
-
-# Initialize Global Variable
-finish_bot = False
-
 # co2plot figure directory
 tmpdir = tempfile.TemporaryDirectory()
 co2plot_fig = tmpdir.name
 
 
+# (realm, sha256 of uploaded file) -> uri
+UPLOADED_CACHE_SIZE = 64
+_uploaded: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+_uploaded_lock = threading.Lock()
+_uploader = ThreadPoolExecutor(max_workers=4, thread_name_prefix="upload")
+
+
+def upload_file(client: zulip.Client, file: str) -> Optional[str]:
+    with open(file, "rb") as fp:
+        data = fp.read()
+    digest = (client.base_url, hashlib.sha256(data).hexdigest())
+    with _uploaded_lock:
+        uri = _uploaded.get(digest)
+        if uri is not None:
+            _uploaded.move_to_end(digest)
+            log.debug(f"already uploaded: {file}")
+            return uri
+
+    log.debug(f"upload file: {file}")
+    fp = io.BytesIO(data)
+    fp.name = os.path.basename(file)
+    result = client.upload_file(fp)
+    log.debug(result)
+    if result["result"] != "success":
+        log.warning(result["msg"])
+        return None
+
+    with _uploaded_lock:
+        _uploaded[digest] = result["uri"]
+        while len(_uploaded) > UPLOADED_CACHE_SIZE:
+            _uploaded.popitem(last=False)
+    return result["uri"]
+
+
 class Parameter:
     def __init__(
             self,
             arguments: str = "",
-            tag: Dict[str, Any] = {}):
+            tag: Dict[str, Any] = {},
+            client: Optional[zulip.Client] = None,
+            tenant: Optional[Tenant] = None):
         self.arguments = arguments
         self.tag = tag
+        self.client = client
+        self.tenant = tenant
 
     def respond(self, message: str = "",
                 files: List[str] = [],
                 filenames: List[str] = []):
         if message:
             self.tag["content"] = message
-        client = zulip.Client()
-        for i, file in enumerate(files):
-            log.debug(f"upload file: {file}")
-            with open(file, "rb") as fp:
-                result = client.upload_file(fp)
-            if result["result"] == "success":
-                if message and i == 0:
-                    self.tag["content"] += "\n"
-                if i > 0:
-                    self.tag["content"] += "\n"
-                if len(filenames) > i:
-                    self.tag["content"] += f"[{filenames[i]}]({result['uri']})"
-                else:
-                    self.tag["content"] += f"[file{i}]({result['uri']})"
+        client = self.client
+        uris = list(_uploader.map(functools.partial(upload_file, client), files))
+        for i, uri in enumerate(uris):
+            if uri is None:
+                continue
+            if message and i == 0:
+                self.tag["content"] += "\n"
+            if i > 0:
+                self.tag["content"] += "\n"
+            if len(filenames) > i:
+                self.tag["content"] += f"[{filenames[i]}]({uri})"
             else:
-                log.warning(result["msg"])
-            log.debug(result)
+                self.tag["content"] += f"[file{i}]({uri})"
         result = client.send_message(self.tag)
         if result["result"] != "success":
             log.warning(result["msg"])
         log.debug(result)
 
 
-def signal_handler(signum, frame):
-    global finish_bot
-    finish_bot = True
-    log.info('Signal handler called with signal %d' % signum)
-
-
 def thread(func) -> Callable[..., threading.Thread]:
     def _wrapper(*args: Any, **kwargs: Any) -> threading.Thread:
         thread = threading.Thread(target=func, args=args, kwargs=kwargs)
@@ -100,49 +121,96 @@ def thread(func) -> Callable[..., threading.Thread]:
     return _wrapper
 
 
-@thread
+# shared monitors, fetchers and workers, given to create_app()
+backend: Optional[Backend] = None
+
+flights = SingleFlight()
+
+
+class CoalescedParameter(Parameter):
+    """
+    fan the response of a coalesced job out to every waiting parameter
+    """
+    def __init__(self, flight: Flight, param: Parameter):
+        super().__init__(arguments=param.arguments, tag=dict(param.tag),
+                         client=param.client, tenant=param.tenant)
+        self.flight = flight
+
+    def respond(self, message: str = "",
+                files: List[str] = [],
+                filenames: List[str] = []):
+        for waiter in flights.land(self.flight):
+            waiter.respond(message=message, files=files, filenames=filenames)
+
+
+def worker(
+    name: str,
+    key: Optional[Callable[[Parameter], Hashable]] = None,
+) -> Callable[..., Callable[[Parameter], None]]:
+    def _decorator(func: Callable[[Parameter], None]) -> Callable[[Parameter], None]:
+        @functools.wraps(func)
+        def _run(param: Parameter) -> None:
+            try:
+                func(param)
+            finally:
+                if isinstance(param, CoalescedParameter):
+                    for waiter in flights.land(param.flight):
+                        waiter.respond(message="Sorry, the command failed.")
+
+        def _wrapper(param: Parameter) -> None:
+            waiter = param
+            if key is not None:
+                flight = flights.join(key(param), param)
+                if flight is None:
+                    return
+                param = CoalescedParameter(flight, param)
+            try:
+                position = backend.pool.submit(name, _run, param)
+            except WorkerBusyError as e:
+                log.warning(f"{name}: {e}")
+                waiters = [waiter]
+                if isinstance(param, CoalescedParameter):
+                    waiters = flights.land(param.flight)
+                for w in waiters:
+                    busy = Parameter(tag=dict(w.tag), client=w.client)
+                    busy.respond(message="Sorry, I'm busy. Please try again later.")
+                return
+            if position:
+                busy = Parameter(tag=dict(waiter.tag), client=waiter.client)
+                busy.respond(message=f"busy, queued #{position}")
+        return _wrapper
+    return _decorator
+
+
+def air_key(param: Parameter) -> Hashable:
+    arguments = " ".join(param.arguments.split())
+    if arguments == "now":
+        return ("air", arguments)
+    return ("air", arguments, dateparser.parse(arguments))
+
+
+@worker("air", key=air_key)
 def co2_command(param: Parameter) -> None:
-    if CO2PLOT is None:
+    if backend.co2plot is None:
         return
     figure_png = None
     if param.arguments == "now":
-        now = co2plot.get_latest(config=CO2PLOT)
-        abrvs = {
-            "degree celsius": "°",
-            "parcentage": "%",
-            "Temperature": ("🌡", "%.1f"),
-            "Humidity": ("💧", "%.1f"),
-            "Carbon Dioxide": ("💨", "%d"),
-        }
-        mes = ""
-        for topic in now:
-            mes += f"{topic} ({now[topic]['timestamp']})\n"
-            for n in now[topic]["metadata"]:
-                meta = now[topic]["metadata"][n]
-                (name, fmt) = abrvs.get(meta['name'], (meta['name'], "%f"))
-                unit = abrvs.get(meta['unit'], meta['unit'])
-                val = now[topic]["payload"][n]
-                mes += "%6s " % name
-                mes += fmt % val
-                mes += "%s" % unit
-                mes += "\n"
-        param.respond(mes)
+        param.respond(latest_text(co2plot.get_latest(config=backend.co2plot)))
     else:
         dates = dateparser.parse(param.arguments)
         figure_png = f"{co2plot_fig}/co2plot{time.time()}.png"
         log.debug(f"plot to {figure_png}")
-        res = co2plot.figure(days=dates, config=CO2PLOT, filename=figure_png)
-        if res:
-            date_format = "%Y-%m-%d"
-            title = "Measurements "
-            if dates:
-                if dates[0]:
-                    title += "from " + dates[0].strftime(date_format) + " "
-                if dates[1]:
-                    title += "to " + dates[1].strftime(date_format)
-            param.respond(message="", files=[figure_png], filenames=[title])
+        try:
+            res = co2plot.figure(days=dates, config=backend.co2plot, filename=figure_png)
+        except co2plot.OutputError as e:
+            log.warning(f"co2plot: {e}")
+            param.respond(message=f"co2plot: {e}")
         else:
-            param.respond(message="no data")
+            if res:
+                figure_png = res
+                param.respond(message="", files=[res], filenames=[plot_title(dates)])
+            else:
+                param.respond(message="no data")
     if figure_png:
         if os.path.exists(figure_png):
             log.debug(f"remove {figure_png}")
@@ -151,59 +219,35 @@ def co2_command(param: Parameter) -> None:
 
 
 def book_event(param: Parameter) -> None:
-    @thread
+    @worker("book", key=lambda p: ("book", " ".join(p.arguments.split())))
     def run_search_book(param: Parameter) -> None:
+        book = backend.subsystems.get("book")
         if book is None:
             return
         result, text_ = book.search(param.arguments)
-        text = result_by_string(result)
+        text = book_markdown(result)
         if text:
             param.respond(message=text)
 
-    def result_by_string(result: Dict[str, Any]) -> str:
-        if not result:
-            return ""
-        if not result['data']:
-            emoji = [
-                ':collision:',
-                ':moyai:',
-                ':sandal:',
-                ':ramen:',
-                ':jack-o-lantern:'
-            ]
-            return emoji[random.randrange(0, len(emoji))]
-
-        string = f"[{result['book']}]"
-        for title in result['data']:
-            string += f"\n{title}\n"
-            for systemid in result['data'][title]:
-                library = result['data'][title][systemid]
-                if library['status']:
-                    for place in library['status']:
-                        string += '- %s(%s): [%s](%s)\n' % (
-                            library['name'], place,
-                            library['status'][place], library['url'])
-                else:
-                    string += f"- {library['name']}: 蔵書なし\n"
-        return string
-
-    if not book:
-        param.respond(message="Sorry, the book command is out of service.")
+    unavailable = backend.subsystems.unavailable("book", "book")
+    if unavailable:
+        param.respond(message=unavailable)
     else:
         param.respond(message=f'"{param.arguments}"...')
         run_search_book(param)
 
 
 def air_event(param: Parameter) -> None:
-    if not CO2PLOT:
+    if not backend.co2plot:
         param.respond(message="Sorry, the command is out of service.")
     else:
         co2_command(param)
 
 
 def weather_event(param: Parameter) -> None:
-    @thread
+    @worker("weather", key=lambda p: ("weather",))
     def fetch_summary(param: Parameter) -> None:
+        forecast = backend.subsystems.get("forecast")
         if forecast is None:
             return
         summary = forecast.fetch_summary(md_type="zulip")
@@ -212,31 +256,34 @@ def weather_event(param: Parameter) -> None:
         else:
             m = "Sorry, weather forecast is temporarily unavailable."
             param.respond(message=m)
-    if not forecast:
-        param.respond(message="Sorry, the weather comand is out of service.")
+    unavailable = backend.subsystems.unavailable("forecast", "weather")
+    if unavailable:
+        param.respond(message=unavailable)
     else:
         fetch_summary(param)
 
 
 def ip_event(param: Parameter) -> None:
-    @thread
+    @worker("ip", key=lambda p: ("ip",))
     def fetch_ip(param: Parameter):
+        ip = backend.subsystems.get("ip")
         if ip is None:
             return
         message = ip.get()
         if message is None:
             message = "Failed to fetch IP address."
         param.respond(message=message)
-    if not ip:
-        message = "Sorry, the ip command is out of service."
-        param.respond(message=message)
+    unavailable = backend.subsystems.unavailable("ip", "ip")
+    if unavailable:
+        param.respond(message=unavailable)
     else:
         fetch_ip(param)
 
 
 def ping_event(param: Parameter) -> None:
-    @thread
+    @worker("ping", key=lambda p: ("ping",))
     def ping_to_server(param: Parameter) -> None:
+        servers = backend.subsystems.get("servers")
         if servers is None:
             return
         up_down = {True: "UP", False: "DOWN"}
@@ -249,28 +296,23 @@ def ping_event(param: Parameter) -> None:
         else:
             param.respond(message="no servers")
 
-    if not servers:
-        message = "Sorry, the ping command is out of service."
-        param.respond(message=message)
+    unavailable = backend.subsystems.unavailable("servers", "ping")
+    if unavailable:
+        param.respond(message=unavailable)
     else:
         ping_to_server(param)
 
 
+def cron_event(param: Parameter) -> None:
+    param.respond(message=backend.scheduler.report(param.arguments.strip()))
+
+
 def help_event(param: Parameter) -> None:
-    cmd = []
-    if CO2PLOT:
-        cmd.append("air [now|DATE]")
-    if book:
-        cmd.append("book|TITLE|ISBN-10")
-    if ip:
-        cmd.append("ip")
-    if forecast:
-        cmd.append("weather")
-    if servers:
-        cmd.append("ping")
-    cmd.append("help|?")
-    message = "Usage: " + '|'.join(cmd)
-    param.respond(message=message)
+    def allows(command: str) -> bool:
+        return param.tenant is None or param.tenant.allows(command)
+
+    cmd = usage(commands, backend.co2plot, backend.subsystems, allows)
+    param.respond(message=f"Usage: {cmd}")
 
 
 commands = {
@@ -279,197 +321,202 @@ commands = {
     "ip": ip_event,
     "weather": weather_event,
     "ping": ping_event,
+    "cron": cron_event,
     "help": help_event,
     "?": help_event,
 }
 
 
 def parse_command(text: str) -> Tuple[str, str]:
-    text = text.strip()
-    result = re.match(r"(@\*\*\S+\*\*\s)*\s*((\S*)\s*(.*))", text)
-    if result is None:
-        return ("help", "")
-    user_id_, title, command, arg = result.groups()
-    if command == "":
-        return ("help", "")
-    cmd = [c for c in commands.keys() if c.startswith(command)]
-    if len(cmd) != 1:
-        return ("book", title)
-    return (cmd[0], arg)
-
-
-def message_handler(msg: Dict[str, Any]) -> None:
-    if msg["sender_email"] == zulip_email:
-        return
-    content = msg["content"]
-    if content is None:
-        return
-    cmd, arg = parse_command(content)
-    if msg["type"] == "private":
-        tag = dict(
-            type="private",
-            to=[x["id"] for x in msg["display_recipient"]],
-            content="",
-        )
-    else:
-        tag = dict(
-            type="stream",
-            to=msg["display_recipient"],
-            subject=msg["subject"],
-            content="",
-        )
-    param = Parameter(arguments=arg, tag=tag)
-    log.debug(f"cmd: {cmd}, arguments: {param.arguments}, tag: {tag}")
-    commands[cmd](param)
+    return split_command(text, commands, ZULIP_MENTION)
 
 
-@thread
-def call_on_message() -> None:
-    client = zulip.Client()
+# server states of monibot.backend.Backend.check_servers()
+SERVER_EMOJI = {
+    "up": ":green_circle:",
+    "degraded": ":yellow_circle:",
+    "failing": ":orange_circle:",
+    "down": ":red_circle:",
+}
 
-    def do_register() -> Tuple[str, int]:
-        while True:
-            res = client.register(event_types=["message"])
-            if "error" in res["result"]:
-                log.warning(f"Server returned error:\n{res['msg']}")
-                time.sleep(1)
-            else:
-                break
-        return (res["queue_id"], res["last_event_id"])
-    queue_id = None
-    last_event_id = None
-    while not finish_bot:
-        if queue_id is None or last_event_id is None:
-            (queue_id, last_event_id) = do_register()
+
+class ZulipFrontend:
+    """
+    event queue and report stream of one Zulip tenant
+
+    Tenants sharing a bot account should 'listen' to their own streams,
+    and all but one should set 'private' to false.
+    """
+    def __init__(self, tenant: Tenant):
+        self.tenant = tenant
+        # Zulip settings, also checks Zulip environmet variables
+        self.client = self.new_client()
+        stream_topic = tenant.get("stream", "ZULIP_MONIBOT_STREAM")
+        if not stream_topic or ":" not in stream_topic:
+            log.critical(f"{tenant.name}: Zulip stream:topic is not defined")
+            exit(1)
+        self.stream, self.topic = stream_topic.split(":", 1)
+        log.debug(f"{tenant.name}: #{self.stream}>{self.topic}")
+        self.listen = tenant.get("listen")
+        self.private = tenant.get("private") is not False
+        self.finish = threading.Event()
+        self.th: Optional[threading.Thread] = None
+
+        # coalescing and rate-limited report sender
+        channel = "zulip" if tenant.name == "default" else f"zulip:{tenant.name}"
         try:
-            res = client.get_events(
-                queue_id=queue_id,
-                last_event_id=last_event_id)
-        except (
-            requests.exceptions.Timeout,
-            requests.exceptions.SSLError,
-            requests.exceptions.ConnectionError,
-        ) as e:
-            log.warning(f"Connection error fetching events:\n {e}")
-            time.sleep(1)
-            continue
-        except Exception as e:
-            log.warning(f"Unexpected error:\n {e}")
-            time.sleep(1)
-            continue
-        if "error" in res["result"]:
-            if res["result"] == "http-error":
-                log.warning("HTTP error fetching events --"
-                            "probably a server restart")
-            else:
-                log.warning(f"Server returned error:\n{res['msg']}")
-                if (res.get("code") == "BAD_EVENT_QUEUE_ID" or
-                        res["msg"].startswith("Bad event queue id:")):
-                    queue_id = None
-            time.sleep(1)
-            continue
-        for event in res["events"]:
-            last_event_id = max(last_event_id, int(event["id"]))
-            if event["type"] == "message":
-                log.debug(event["message"])
-                message_handler(event["message"])
-    log.info("call_on_message is done.")
-
-
-q = queue.Queue()
-crons = []
-
-CO2PLOT = os.environ.get("CO2PLOT", None)
-if CO2PLOT:
-    if not os.path.exists(CO2PLOT):
-        log.info(f"co2plot configration file '{CO2PLOT}' not found")
-else:
-    log.info("Environment value 'CO2PLOT' is not defined")
-
-try:
-    book = BookStatus()
-except BookStatusError as e:
-    log.warning(f"Book search: {e}")
-    log.info("Disable book search")
-    book = None
-
-try:
-    forecast = OutsideTemperature()
-    c = Cron(
-        forecast.check_temperature,
-        interval_sec=forecast.interval_hours*60*60,
-        queue=q,
-    )
-    crons.append(c)
-except MonitorError as e:
-    log.warning(f"Weather forecast: {e}")
-    log.info("Disable outside temperature message")
-    forecast = None
-
-try:
-    servers = Server()
-
-    def check_servers():
-        if servers is None:
-            return ""
-        targets = servers.is_changed(
-            classes={0.9: ":yellow_circle:", 0.0: ":orange_circle:"},
-            class1=":green_circle:",
-            class0=":red_circle:",
-        )
-        message = ""
-        for target in targets:
-            message += f"{targets[target]} {target}\n"
-        return message
-
-    if servers:
-        c = Cron(
-            check_servers,
-            interval_sec=servers.ping_interval_sec,
-            queue=q,
+            self.q = Dispatcher(self.send_report, Batcher(channel=channel))
+        except DispatcherError as e:
+            log.warning(f"Report: {e}")
+            log.info("Use default report dispatcher")
+            self.q = Dispatcher(self.send_report, Batcher({}, channel=channel))
+        self.q.name = f"dispatcher:{channel}"
+
+    def new_client(self) -> zulip.Client:
+        return zulip.Client(
+            email=self.tenant.get("email"),
+            api_key=self.tenant.get("api_key"),
+            site=self.tenant.get("site"),
+            config_file=self.tenant.get("zuliprc"),
         )
-        crons.append(c)
-except MonitorError as e:
-    log.warning(f"Server monitor: {e}")
-    log.info("Disable server monitor message")
-    servers = None
 
-try:
-    ip = GetIP()
-except GetIPError as e:
-    log.warning(f"Get IP: {e}")
-    log.info("Disable IP")
-    ip = None
+    def message_handler(self, msg: Dict[str, Any]) -> None:
+        if msg["sender_email"] == self.client.email:
+            return
+        content = msg["content"]
+        if content is None:
+            return
+        if msg["type"] == "private":
+            if not self.private:
+                return
+            tag = dict(
+                type="private",
+                to=[x["id"] for x in msg["display_recipient"]],
+                content="",
+            )
+            channel = ",".join(str(x) for x in sorted(tag["to"]))
+        else:
+            if self.listen is not None and msg["display_recipient"] not in self.listen:
+                return
+            tag = dict(
+                type="stream",
+                to=msg["display_recipient"],
+                subject=msg["subject"],
+                content="",
+            )
+            channel = msg["display_recipient"]
+        cmd, arg = parse_command(content)
+        param = Parameter(arguments=arg, tag=tag, client=self.client,
+                          tenant=self.tenant)
+        if not self.tenant.allows(cmd):
+            param.respond(message=f"Sorry, the {cmd} command is not available here.")
+            return
+        prefix = f"zulip:{self.tenant.name}"
+        over_limit = backend.limiter.acquire(
+            cmd, f"{prefix}:{msg['sender_email']}", f"{prefix}:{channel}")
+        if over_limit:
+            param.respond(message=over_limit)
+            return
+        log.debug(f"cmd: {cmd}, arguments: {param.arguments}, tag: {tag}")
+        commands[cmd](param)
+
+    @thread
+    def call_on_message(self) -> None:
+        # long polling holds its connection, so it does not share self.client
+        client = self.new_client()
+
+        def do_register() -> Tuple[str, int]:
+            while True:
+                res = client.register(event_types=["message"])
+                if "error" in res["result"]:
+                    log.warning(f"Server returned error:\n{res['msg']}")
+                    time.sleep(1)
+                else:
+                    break
+            return (res["queue_id"], res["last_event_id"])
+        queue_id = None
+        last_event_id = None
+        while not self.finish.is_set():
+            if queue_id is None or last_event_id is None:
+                (queue_id, last_event_id) = do_register()
+            try:
+                res = client.get_events(
+                    queue_id=queue_id,
+                    last_event_id=last_event_id)
+            except (
+                requests.exceptions.Timeout,
+                requests.exceptions.SSLError,
+                requests.exceptions.ConnectionError,
+            ) as e:
+                log.warning(f"Connection error fetching events:\n {e}")
+                time.sleep(1)
+                continue
+            except Exception as e:
+                log.warning(f"Unexpected error:\n {e}")
+                time.sleep(1)
+                continue
+            if "error" in res["result"]:
+                if res["result"] == "http-error":
+                    log.warning("HTTP error fetching events --"
+                                "probably a server restart")
+                else:
+                    log.warning(f"Server returned error:\n{res['msg']}")
+                    if (res.get("code") == "BAD_EVENT_QUEUE_ID" or
+                            res["msg"].startswith("Bad event queue id:")):
+                        queue_id = None
+                time.sleep(1)
+                continue
+            for event in res["events"]:
+                last_event_id = max(last_event_id, int(event["id"]))
+                if event["type"] == "message":
+                    log.debug(event["message"])
+                    self.message_handler(event["message"])
+        log.info("call_on_message is done.")
+
+    def send_report(self, text: str) -> None:
+        result = self.client.send_message(dict(
+            type="stream",
+            to=self.stream,
+            subject=self.topic,
+            content=text,
+        ))
+        if result["result"] != "success":
+            raise DispatcherError(f"Can't send a report: {result['msg']}")
+
+    def start(self) -> None:
+        self.th = self.call_on_message()
+        self.q.start()
+
+    def stop(self) -> None:
+        self.finish.set()
+        self.q.abort()
+        self.q.join()
+        log.info("Wait stopping bot...")
+        self.th.join()
+
+
+def create_app(shared: Backend, tenant: Optional[Tenant] = None) -> ZulipFrontend:
+    """
+    Build the Zulip frontend of 'tenant' on 'shared', a
+    monibot.backend.Backend
+    """
+    global backend
+    backend = shared
+    if tenant is None:
+        tenant = Tenant("default", "zulip")
+    frontend = ZulipFrontend(tenant)
+    backend.attach(frontend.q, SERVER_EMOJI, tenant.alerts)
+    return frontend
 
 
 def main():
-    signal.signal(signal.SIGTERM, signal_handler)
-    for c in crons:
-        c.start()
-    client = zulip.Client()
-    log.info('running.')
-    th = call_on_message()
-    while not finish_bot:
-        try:
-            mes = q.get(timeout=5)
-        except queue.Empty:
-            continue
-        log.debug(f'dequeue message: {mes}')
-        try:
-            client.send_message(dict(
-                type="stream",
-                to=zulip_stream,
-                subject=zulip_topic,
-                content=mes,
-            ))
-        except requests.exceptions.RequestException as e:
-            log.warning(f"Can't send a message from the queue: {e}")
-            continue
-    log.info("Wait stopping bot...")
-    th.join()
-    for c in crons:
-        c.abort()
-        c.join()
+    shared = Backend()
+    frontend = create_app(shared)
+    frontend.start()
+    shared.start()
+    shared.run()
+    frontend.stop()
+    shared.stop()
     log.info("done.")
 
 
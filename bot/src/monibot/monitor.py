@@ -1,11 +1,19 @@
-from typing import Any, Dict
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Tuple
+import ipaddress
 import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime, timezone
 import json
+from monibot import aioprobe
 from monibot.jma import Weather, WeatherError
 from monibot.ping import ICMP, Web, DNS
 import logging
 
+if TYPE_CHECKING:
+    import aiohttp
+
 log = logging.getLogger(__name__)
 
 
@@ -51,7 +59,7 @@ def read_config(key: str) -> dict:
 
 
 class OutsideTemperature:
-    def __init__(self):
+    def __init__(self, weather=None):
         self.configuration = read_config("temperature")
         key = "outside_hot_alert_threshold"
         self.outside_hot_alert_threshold = get_value(self.configuration, key, float)
@@ -65,10 +73,13 @@ class OutsideTemperature:
         self.interval_hours = get_value(self.configuration, key, int)
         log.debug("%s: %d hours" % (key, self.interval_hours))
 
-        try:
-            self.wt = Weather()
-        except WeatherError as e:
-            raise MonitorError(e)
+        # a reloaded configuration keeps the running Weather and its caches
+        self.wt = weather
+        if self.wt is None:
+            try:
+                self.wt = Weather()
+            except WeatherError as e:
+                raise MonitorError(e)
 
         self.datetime_format = "at %I:%M %p on %A"
         self.degree = "°C"
@@ -77,6 +88,23 @@ class OutsideTemperature:
         self.wt.fetch()
         return self.wt.summary(md_type=md_type)
 
+    async def afetch_summary(self, session: "aiohttp.ClientSession", md_type="slack"):
+        await self.wt.amedas.afetch(session)
+        return self.wt.summary(md_type=md_type, fetch=False)
+
+    def fetch_observation(self, md_type="slack"):
+        """
+        Returns AMeDAS observation time and its summary
+        """
+        self.wt.amedas.fetch()
+        return (self.wt.amedas.latest_time,
+                self.wt.summary(md_type=md_type, fetch=False))
+
+    async def afetch_observation(self, session: "aiohttp.ClientSession", md_type="slack"):
+        await self.wt.amedas.afetch(session)
+        return (self.wt.amedas.latest_time,
+                self.wt.summary(md_type=md_type, fetch=False))
+
     def fetch_temperature(self):
         self.wt.fetch()
         low, low_t = self.wt.lowest()
@@ -91,14 +119,23 @@ class OutsideTemperature:
         return mes
 
     def check_temperature(self):
+        self.wt.fetch()
+        low, low_t = self.wt.lowest()
+        high, high_t = self.wt.highest()
+        return self.temperature_alert(low, low_t, high, high_t)
+
+    async def acheck_temperature(self, session: "aiohttp.ClientSession"):
+        await self.wt.forecast.afetch(session)
+        low, low_t = self.wt.forecast.lowest
+        high, high_t = self.wt.forecast.highest
+        return self.temperature_alert(low, low_t, high, high_t)
+
+    def temperature_alert(self, low, low_t, high, high_t):
         min = self.pipe_alert_threshold
         max = self.outside_hot_alert_threshold
         now = datetime.now(timezone.utc)
 
         log.debug("min=%d, max=%d" % (min, max))
-        self.wt.fetch()
-        low, low_t = self.wt.lowest()
-        high, high_t = self.wt.highest()
         mes = ""
         if all(x is not None for x in (low, low_t, high, high_t)):
             low_t_str = low_t.strftime(self.datetime_format)
@@ -132,8 +169,54 @@ class OutsideTemperature:
         return mes
 
 
+# a 'cidr' or 'file' entry of ping_servers expands to at most this many targets
+MAX_INVENTORY = 4096
+
+
+def expand_inventory(name: str, conf: Dict[str, Any]) -> Iterator[str]:
+    """
+    Yields the targets of one entry of ping_servers: the hosts of its
+    'cidr', the lines of its 'file', or else the entry itself
+    """
+    if "cidr" in conf:
+        try:
+            network = ipaddress.ip_network(conf["cidr"], strict=False)
+        except ValueError as e:
+            raise MonitorError(f"{name}: invalid cidr: {e}")
+        if network.num_addresses > MAX_INVENTORY + 2:
+            raise MonitorError(f"{name}: more than {MAX_INVENTORY} hosts in {network}")
+        for address in network.hosts():
+            yield str(address)
+    elif "file" in conf:
+        try:
+            with open(conf["file"], encoding="utf-8") as f:
+                lines = [line.strip() for line in f]
+        except OSError as e:
+            raise MonitorError(f"{name}: cannot open inventory: {e}")
+        targets = [line for line in lines if line and not line.startswith("#")]
+        if len(targets) > MAX_INVENTORY:
+            raise MonitorError(f"{name}: more than {MAX_INVENTORY} targets in {conf['file']}")
+        yield from targets
+    else:
+        yield name
+
+
 class Server:
+    """
+    Every round probes all targets concurrently, on up to 'max_probes'
+    threads, and waits for them until 'probe_deadline_sec'. A target
+    that has not answered by then counts as down, and its probe is not
+    started again until it finishes. All ICMP targets share one round of
+    echo requests on one of the threads. The threads are kept between
+    rounds until stop().
+
+    With "engine": "async" a round runs on the event loop of
+    monibot.aioprobe instead, at most 'max_concurrency' probes at once
+    and 'max_per_host' against one host, which scales to thousands of
+    targets. A target that misses the deadline is cancelled.
+    """
     ping = {"ICMP": ICMP, "Web": Web, "DNS": DNS}
+    engines = ("thread", "async")
 
     def __init__(self):
         self.configuration = read_config("servers")
@@ -143,36 +226,175 @@ class Server:
         key = "previous_data_points"
         self.previous_data_points = get_value(self.configuration, key, int)
 
+        try:
+            self.max_probes = int(self.configuration.get("max_probes", 16))
+            self.probe_deadline_sec = float(
+                self.configuration.get("probe_deadline_sec", 30))
+            self.engine = str(self.configuration.get("engine", "thread"))
+            self.probe_engine = aioprobe.ProbeEngine(
+                max_concurrency=int(self.configuration.get("max_concurrency", 256)),
+                max_per_host=int(self.configuration.get("max_per_host", 4)),
+            )
+        except (ValueError, TypeError) as e:
+            raise MonitorError(f"invalid probe configuration: {e}")
+        if (self.max_probes < 1 or self.probe_deadline_sec <= 0
+                or self.probe_engine.max_concurrency < 1
+                or self.probe_engine.max_per_host < 1):
+            raise MonitorError("'max_probes', 'probe_deadline_sec', 'max_concurrency' "
+                               "and 'max_per_host' must be positive")
+        if self.engine not in self.engines:
+            raise MonitorError(f"'engine' must be one of {', '.join(self.engines)}")
+        self.inflight: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+
         servers = self.configuration.get("ping_servers")
         if servers is None:
             raise MonitorError("'ping_servers' key not found")
 
         self.servers = []
-        for s in servers:
-            sv = Server.ping[servers[s]["type"]](s)
-            sv.monitor_latest = [1] * self.previous_data_points
-            sv.monitor_previous_state = None
-            sv.same_state_times = 0
-            self.servers.append(sv)
+        for name in servers:
+            # the other keys of a target are options of its probe
+            options = {
+                k: v for k, v in servers[name].items() if k not in ("type", "cidr", "file")
+            }
+            for s in expand_inventory(name, servers[name]):
+                try:
+                    sv = Server.ping[servers[name]["type"]](s, **options)
+                except (KeyError, TypeError, ValueError) as e:
+                    raise MonitorError(f"{name}: invalid target: {e}")
+                sv.monitor_latest = [1] * self.previous_data_points
+                sv.monitor_previous_state = None
+                sv.same_state_times = 0
+                self.servers.append(sv)
         if len(self.servers) == 0:
             raise MonitorError("no servers")
+        # started on the first round, so the async engine never starts one
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_probes,
+            thread_name_prefix="probe",
+        )
+        self.stopped = False
+
+    def stop(self) -> None:
+        """
+        Shut down the probe threads; probes still running finish on their own
+        """
+        with self.lock:
+            self.stopped = True
+        self.executor.shutdown(wait=False)
+
+    def adopt(self, old: "Server") -> None:
+        """
+        Carry over the history of targets that 'old' also monitors, and
+        stop 'old'
+        """
+        previous = {(type(s), s.target): s for s in old.servers}
+        for s in self.servers:
+            sv = previous.get((type(s), s.target))
+            if sv is None:
+                continue
+            history = list(sv.monitor_latest)[-self.previous_data_points:]
+            s.monitor_latest = [1] * (self.previous_data_points - len(history)) + history
+            s.monitor_previous_state = sv.monitor_previous_state
+            s.same_state_times = sv.same_state_times
+        old.stop()
+
+    def probe(self) -> List[Tuple[bool, str]]:
+        """
+        Returns (alive, response) of every target in one round
+        """
+        if self.engine == "async":
+            return self.aprobe_on_loop()
+        futures = []
+        with self.lock:
+            if self.stopped:
+                raise MonitorError("server monitor is stopped")
+            idle = [
+                s for s in self.servers
+                if s.target not in self.inflight or self.inflight[s.target].done()
+            ]
+            # all ICMP targets share one round of echo requests on one thread
+            batch = [s for s in idle if isinstance(s, ICMP)]
+            if batch:
+                future = self.executor.submit(ICMP.ping_all, batch)
+                for s in batch:
+                    self.inflight[s.target] = future
+            for s in idle:
+                if not isinstance(s, ICMP):
+                    self.inflight[s.target] = self.executor.submit(s.is_alive)
+            futures = [self.inflight[s.target] for s in self.servers]
+        # probes still running after the deadline finish on their own
+        _done, not_done = wait(set(futures), timeout=self.probe_deadline_sec)
+
+        results = []
+        for s, future in zip(self.servers, futures):
+            if future in not_done:
+                log.warning(f"{s.target}: no answer in {self.probe_deadline_sec} seconds")
+                results.append((False, f"{s.target}: no answer"))
+                continue
+            try:
+                result = future.result()
+                if isinstance(s, ICMP):
+                    result = result[s.target]
+                results.append(result)
+            except Exception as e:
+                log.warning(f"{s.target}: {e}")
+                results.append((False, f"{s.target}: {e}"))
+        return results
+
+    def aprobe_on_loop(self) -> List[Tuple[bool, str]]:
+        """
+        probe() on the shared event loop of monibot.aioprobe
+        """
+        try:
+            return aioprobe.loop.run(
+                lambda session: self.probe_engine.probe(
+                    self.servers, session, self.probe_deadline_sec),
+                # the engine cancels its probes at the deadline
+                timeout=self.probe_deadline_sec + 5,
+            )
+        except FutureTimeoutError:
+            log.warning(f"no answer from the probe loop in {self.probe_deadline_sec} seconds")
+            return [(False, f"{s.target}: no answer") for s in self.servers]
 
     def get_status(self) -> Dict[str, bool]:
-        status = {}
-        for s in self.servers:
-            alive, _res = s.is_alive()
-            status[s.target] = alive
-        return status
+        return {s.target: alive for s, (alive, _res) in zip(self.servers, self.probe())}
 
     def is_changed(
         self,
         classes: Dict[float, Any] = {},
         class0: Any = False,
         class1: Any = True,
+    ) -> Dict[str, Any]:
+        alives = [alive for alive, _res in self.probe()]
+        return self.update_status(alives, classes, class0, class1)
+
+    async def aget_status(self, session: "aiohttp.ClientSession") -> Dict[str, bool]:
+        results = await self.probe_engine.probe(
+            self.servers, session, self.probe_deadline_sec)
+        return {s.target: alive for s, (alive, _res) in zip(self.servers, results)}
+
+    async def ais_changed(
+        self,
+        session: "aiohttp.ClientSession",
+        classes: Dict[float, Any] = {},
+        class0: Any = False,
+        class1: Any = True,
+    ) -> Dict[str, Any]:
+        results = await self.probe_engine.probe(
+            self.servers, session, self.probe_deadline_sec)
+        alives = [alive for alive, _res in results]
+        return self.update_status(alives, classes, class0, class1)
+
+    def update_status(
+        self,
+        alives: List[bool],
+        classes: Dict[float, Any],
+        class0: Any,
+        class1: Any,
     ) -> Dict[str, Any]:
         status = {}
-        for s in self.servers:
-            alive, _res = s.is_alive()
+        for s, alive in zip(self.servers, alives):
             if alive:
                 s.monitor_latest.append(1)
             else:
@@ -0,0 +1,58 @@
+#! /usr/bin/env python3
+
+import importlib
+import logging
+import os
+from monibot.backend import Backend
+from monibot.tenant import TenantError, load_tenants
+
+log = logging.getLogger('multibot')
+
+# chat frontend name -> module with create_app()
+FRONTENDS = {
+    "slack": "monibot.monibot",
+    "zulip": "monibot.monibotz",
+}
+
+
+def parse_frontends(names: str):
+    frontends = [n.strip() for n in names.split(",") if n.strip()]
+    for name in frontends:
+        if name not in FRONTENDS:
+            log.critical(f"unknown frontend '{name}'")
+            exit(1)
+    if not frontends:
+        log.critical("no frontend in 'MONIBOT_FRONTENDS'")
+        exit(1)
+    return frontends
+
+
+def main():
+    """
+    Serve every tenant of the 'tenants' section, or every frontend of
+    MONIBOT_FRONTENDS (default "slack,zulip"), from one process with one
+    set of monitors, fetchers and crons
+    """
+    names = parse_frontends(os.environ.get("MONIBOT_FRONTENDS", "slack,zulip"))
+    try:
+        tenants = load_tenants(names)
+    except TenantError as e:
+        log.critical(f"Tenant: {e}")
+        exit(1)
+    shared = Backend()
+    frontends = []
+    for tenant in tenants:
+        module = importlib.import_module(FRONTENDS[tenant.frontend])
+        frontends.append(module.create_app(shared, tenant))
+    for frontend in frontends:
+        frontend.start()
+    shared.start()
+    shared.run()
+    for frontend in frontends:
+        frontend.stop()
+    shared.stop()
+    log.info("stopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+import logging
+log = logging.getLogger(__name__)
+
+
+class OutboxError(Exception):
+    pass
+
+
+# id, key, message, urgent
+Row = Tuple[int, str, str, bool]
+
+
+class Outbox:
+    """
+    persistent queue of report messages
+
+    Both tables are append-only while the bot runs: a report is a row of
+    'outbox' and its delivery a row of 'delivered'. Delivered reports are
+    removed when the outbox is opened again. Writes are committed in
+    batches of 'commit_rows' or every 'commit_interval_sec', and always
+    before a report is sent, so that a report is delivered at least once.
+    """
+    def __init__(
+        self,
+        path: str,
+        channel: str = "report",
+        commit_rows: int = 32,
+        commit_interval_sec: float = 1.0,
+    ):
+        self.channel = channel
+        self.commit_rows = commit_rows
+        self.commit_interval = commit_interval_sec
+        self.lock = threading.Lock()
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        except OSError as e:
+            raise OutboxError(f"cannot create directory of outbox '{path}': {e}")
+        try:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.executescript("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY,
+                    channel TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    urgent INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    UNIQUE (channel, key)
+                );
+                CREATE TABLE IF NOT EXISTS delivered (
+                    id INTEGER PRIMARY KEY,
+                    delivered REAL NOT NULL
+                );
+            """)
+            self.compact()
+        except sqlite3.Error as e:
+            raise OutboxError(f"cannot open outbox '{path}': {e}")
+        self.uncommitted = 0
+        self.last_commit = time.monotonic()
+
+    def compact(self) -> None:
+        with self.lock:
+            self.db.execute(
+                "DELETE FROM outbox WHERE id IN (SELECT id FROM delivered)")
+            self.db.execute(
+                "DELETE FROM delivered WHERE id NOT IN (SELECT id FROM outbox)")
+            self.db.commit()
+
+    def append(self, key: str, message: str, urgent: bool) -> Optional[int]:
+        """
+        Returns the id of the new row, or None if 'key' is already queued
+        """
+        with self.lock:
+            cur = self.db.execute(
+                "INSERT OR IGNORE INTO outbox "
+                "(channel, key, message, urgent, created) VALUES (?, ?, ?, ?, ?)",
+                (self.channel, key, message, int(urgent), time.time()))
+            if cur.rowcount == 0:
+                log.debug(f"{key} is already in the outbox")
+                if not self.uncommitted:
+                    # do not hold the write lock for an empty transaction
+                    self.db.rollback()
+                return None
+            self._written()
+            return cur.lastrowid
+
+    def delivered(self, ids: List[int]) -> None:
+        with self.lock:
+            now = time.time()
+            self.db.executemany(
+                "INSERT OR IGNORE INTO delivered (id, delivered) VALUES (?, ?)",
+                [(i, now) for i in ids])
+            self._written()
+
+    def _written(self) -> None:
+        self.uncommitted += 1
+        if (self.uncommitted >= self.commit_rows or
+                time.monotonic() - self.last_commit >= self.commit_interval):
+            self._commit()
+
+    def _commit(self) -> None:
+        self.db.commit()
+        self.uncommitted = 0
+        self.last_commit = time.monotonic()
+
+    def flush(self) -> None:
+        with self.lock:
+            if self.uncommitted:
+                self._commit()
+
+    def sync(self) -> Optional[float]:
+        """
+        Commit if the batch is due
+
+        Returns seconds until the pending batch is due, or None if
+        everything is committed
+        """
+        with self.lock:
+            if not self.uncommitted:
+                return None
+            wait = self.last_commit + self.commit_interval - time.monotonic()
+            if wait > 0:
+                return wait
+            self._commit()
+            return None
+
+    def pending(self, limit: int, after: int = 0) -> List[Row]:
+        """
+        Undelivered reports with id greater than 'after', oldest first
+        """
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, key, message, urgent FROM outbox "
+                "WHERE channel = ? AND id > ? "
+                "AND id NOT IN (SELECT id FROM delivered) "
+                "ORDER BY id LIMIT ?",
+                (self.channel, after, limit)).fetchall()
+        return [(i, k, m, bool(u)) for i, k, m, u in rows]
+
+    def close(self) -> None:
+        with self.lock:
+            self._commit()
+            self.db.close()
@@ -1,20 +1,27 @@
-from typing import Tuple
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
 from abc import ABC, abstractmethod
+import asyncio
 import subprocess
-import requests
-import dns.flags
+from concurrent.futures import ThreadPoolExecutor
 import dns.rdatatype
-import dns.resolver
-import re
+from monibot import dnsprobe, icmp, webprobe
 import logging
+if TYPE_CHECKING:
+    import aiohttp
 log = logging.getLogger(__name__)
 
+# ping(8) processes of ICMP.ping_all() at once without an ICMP socket
+PING_PROCESSES = 16
+
 
 class Ping(ABC):
     @abstractmethod
     def is_alive(self) -> Tuple[bool, str]:
         pass
 
+    async def ais_alive(self, session: "aiohttp.ClientSession") -> Tuple[bool, str]:
+        return await asyncio.to_thread(self.is_alive)
+
     @property
     @abstractmethod
     def target(self) -> str:
@@ -22,19 +29,75 @@ class Ping(ABC):
 
 
 class ICMP(Ping):
+    """
+    echo requests of monibot.icmp.engine, or ping(8) if the process may
+    open no ICMP socket
+    """
     def __init__(self, hostname: str):
         self.hostname = hostname
 
     def is_alive(self) -> Tuple[bool, str]:
+        try:
+            return self.echo_result(icmp.engine.ping(self.hostname))
+        except icmp.IcmpError as e:
+            log.debug(f"{e}, fork ping")
+        return self.fork()
+
+    def fork(self) -> Tuple[bool, str]:
         command = subprocess.Popen(
             ["ping", "-c", "5", "-q", self.hostname],
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE)
         res, err = command.communicate()
-        if command.returncode == 0:
+        return self.result(command.returncode, res)
+
+    async def ais_alive(self, session: "aiohttp.ClientSession") -> Tuple[bool, str]:
+        try:
+            return self.echo_result(await icmp.engine.aping(self.hostname))
+        except icmp.IcmpError as e:
+            log.debug(f"{e}, fork ping")
+        command = await asyncio.create_subprocess_exec(
+            "ping", "-c", "5", "-q", self.hostname,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE)
+        res, err = await command.communicate()
+        return self.result(command.returncode, res)
+
+    @staticmethod
+    def ping_all(targets: List["ICMP"]) -> Dict[str, Tuple[bool, str]]:
+        """
+        is_alive() of every target, with all echo requests sent in one
+        round of monibot.icmp.engine
+        """
+        try:
+            results = icmp.engine.ping_many([t.hostname for t in targets])
+        except icmp.IcmpError as e:
+            log.debug(f"{e}, fork ping")
+            return ICMP.fork_all(targets)
+        # e.g. IPv6 hosts without an ICMPv6 socket
+        unsent = [t for t in targets if results[t.hostname].socket_error]
+        forked = ICMP.fork_all(unsent) if unsent else {}
+        return {
+            t.target: forked.get(t.target) or t.echo_result(results[t.hostname])
+            for t in targets
+        }
+
+    @staticmethod
+    def fork_all(targets: List["ICMP"]) -> Dict[str, Tuple[bool, str]]:
+        """
+        ping(8) every target, PING_PROCESSES at once
+        """
+        with ThreadPoolExecutor(max_workers=PING_PROCESSES) as executor:
+            return dict(zip(
+                [t.target for t in targets],
+                executor.map(lambda t: t.fork(), targets),
+            ))
+
+    def result(self, returncode: int, res: bytes) -> Tuple[bool, str]:
+        if returncode == 0:
             response = res.decode("utf-8").split("\n")[-2]
             alive = True
-        elif command.returncode == 1:
+        elif returncode == 1:
             response = f"{self.target}: unreachable"
             alive = False
         else:
@@ -42,35 +105,88 @@ class ICMP(Ping):
             alive = False
         return alive, response
 
+    def echo_result(self, result: icmp.EchoResult) -> Tuple[bool, str]:
+        if result.error:
+            return False, f"{self.target}: failure in name resolution"
+        if result.received == 0:
+            return False, f"{self.target}: unreachable"
+        return True, result.summary()
+
     @property
     def target(self) -> str:
         return self.hostname
 
 
 class Web(Ping):
-    def __init__(self, url: str, timeout_sec: float = 3.0):
+    """
+    HTTP probe on the keep-alive session of monibot.webprobe
+
+    'method' may be "HEAD" for a target that answers it. Only the first
+    'max_bytes' of the body are read. A response slower than
+    'max_latency_ms', or a certificate expiring within 'min_cert_days',
+    counts as down, on the aiohttp session of ais_alive() too. The
+    timings of the last probe are in 'last'.
+    """
+    def __init__(
+        self,
+        url: str,
+        timeout_sec: float = 3.0,
+        method: str = "GET",
+        max_bytes: int = webprobe.MAX_BYTES,
+        max_latency_ms: Optional[float] = None,
+        min_cert_days: Optional[float] = None,
+    ):
         self.url = url
         self.timeout = timeout_sec
+        self.method = method.upper()
+        self.max_bytes = max_bytes
+        self.max_latency_ms = max_latency_ms
+        self.min_cert_days = min_cert_days
+        self.last: Optional[webprobe.WebResult] = None
 
     def is_alive(self) -> Tuple[bool, str]:
-        response = self.get_status()
-        if response == 200:
-            alive = True
-        else:
-            alive = False
-        return alive, str(response)
+        return self.check(self.probe())
+
+    def check(self, result: webprobe.WebResult) -> Tuple[bool, str]:
+        if result.status != 200:
+            return False, str(result.status)
+        if self.max_latency_ms is not None and result.total_ms > self.max_latency_ms:
+            return False, f"slow: {result.total_ms:.0f} ms"
+        days = result.cert_days
+        if self.min_cert_days is not None and days is not None and days < self.min_cert_days:
+            return False, f"certificate expires in {days:.0f} days"
+        return True, str(result.status)
+
+    def probe(self) -> webprobe.WebResult:
+        self.last = webprobe.probe(
+            self.url,
+            method=self.method,
+            timeout=self.timeout,
+            max_bytes=self.max_bytes,
+        )
+        return self.last
+
+    async def aprobe(self, session: "aiohttp.ClientSession") -> webprobe.WebResult:
+        self.last = await webprobe.aprobe(
+            session,
+            self.url,
+            method=self.method,
+            timeout=self.timeout,
+            max_bytes=self.max_bytes,
+        )
+        return self.last
+
+    async def ais_alive(self, session: "aiohttp.ClientSession") -> Tuple[bool, str]:
+        if session is None:
+            # no aiohttp, probe on the keep-alive session of a thread
+            return await asyncio.to_thread(self.is_alive)
+        return self.check(await self.aprobe(session))
 
     def get_status(self) -> int:
-        status_code = -1
-        try:
-            response = requests.get(self.url, timeout=self.timeout)
-        except requests.exceptions.ConnectionError:
-            status_code = "Failed to establish a new connection"
-        except requests.exceptions.Timeout:
-            status_code = "Timeout"
-        else:
-            status_code = response.status_code
-        return status_code
+        return self.probe().status
+
+    async def aget_status(self, session: "aiohttp.ClientSession") -> int:
+        return (await self.aprobe(session)).status
 
     @property
     def target(self) -> str:
@@ -78,44 +194,78 @@ class Web(Ping):
 
 
 class DNS(Ping):
-    def __init__(self, hostname: str, nameserver: str = '8.8.8.8'):
-        self.resolver = dns.resolver.Resolver()
-        self.resolver.nameservers = [nameserver]
-        self.resolver.timeout = 3.0
-        self.resolver.lifetime = 5.0
+    """
+    query of 'record_type' on the shared resolvers of monibot.dnsprobe
+
+    With 'nameservers' every one of them is asked in parallel, and all
+    must answer. Every value of 'expected' must be among the records,
+    and an answer slower than 'max_rtt_ms' counts as down. The results
+    of the last check, with round trip times, are in 'last'.
+    """
+    def __init__(
+        self,
+        hostname: str,
+        nameserver: str = '8.8.8.8',
+        nameservers: Optional[List[str]] = None,
+        record_type: str = "A",
+        expected: Union[str, List[str], None] = None,
+        timeout_sec: float = dnsprobe.TIMEOUT_SEC,
+        lifetime_sec: float = dnsprobe.LIFETIME_SEC,
+        max_rtt_ms: Optional[float] = None,
+    ):
         self.hostname = hostname
-        self.re_addr = re.compile(
-            r'^(?:(?:[1-9]?\d|1\d\d|2[0-4]\d|25[0-5])\.){3}'
-            r'(?:[1-9]?\d|1\d\d|2[0-4]\d|25[0-5])$')
+        if isinstance(nameservers, str):
+            nameservers = [nameservers]
+        self.nameservers = list(nameservers) if nameservers else [nameserver]
+        try:
+            self.rdtype = dns.rdatatype.from_text(record_type)
+        except dns.rdatatype.UnknownRdatatype:
+            raise ValueError(f"unknown record type '{record_type}'")
+        if isinstance(expected, str):
+            expected = [expected]
+        self.expected = {dnsprobe.normalize(e) for e in expected or []}
+        self.max_rtt_ms = max_rtt_ms
+        self.resolvers = [
+            dnsprobe.get_resolver(ns, float(timeout_sec), float(lifetime_sec))
+            for ns in self.nameservers
+        ]
+        self.aresolvers = [
+            dnsprobe.get_resolver(ns, float(timeout_sec), float(lifetime_sec), aio=True)
+            for ns in self.nameservers
+        ]
+        self.last: List[dnsprobe.DNSResult] = []
 
     def is_alive(self) -> Tuple[bool, str]:
-        answer = self.lookup()
-        if self.re_addr.search(answer):
-            alive = True
-        else:
-            alive = False
-        return alive, answer
+        self.last = dnsprobe.query_all(self.resolvers, self.hostname, self.rdtype)
+        return self.check(self.last)
 
-    def lookup(self) -> str:
-        answer = 'None'
-        try:
-            answers = self.resolver.resolve(
-                self.hostname,
-                raise_on_no_answer=False)
-        except dns.resolver.NoNameservers:
-            answer = "No response to dns request"
-        except dns.resolver.NXDOMAIN:
-            answer = "Hostname does not exist"
-        except dns.resolver.Timeout:
-            answer = "Request Timeout"
-        except dns.resolver.NoAnswer:
-            answer = "No answer"
-        else:
-            if len(answers) < 1:
-                answer = "No records"
-            else:
-                answer = str(answers[0])
-        return answer
+    async def ais_alive(self, session: "aiohttp.ClientSession") -> Tuple[bool, str]:
+        self.last = await dnsprobe.aquery_all(self.aresolvers, self.hostname, self.rdtype)
+        return self.check(self.last)
+
+    def failure(self, result: dnsprobe.DNSResult) -> Optional[str]:
+        """
+        Returns why 'result' is down, None if it is up
+        """
+        if result.error:
+            return result.error
+        if not result.answers:
+            return "No records"
+        missing = self.expected - {dnsprobe.normalize(a) for a in result.answers}
+        if missing:
+            return f"unexpected answer: {', '.join(result.answers)}"
+        if self.max_rtt_ms is not None and result.rtt_ms > self.max_rtt_ms:
+            return f"slow: {result.rtt_ms:.0f} ms"
+        return None
+
+    def check(self, results: List[dnsprobe.DNSResult]) -> Tuple[bool, str]:
+        failures = [(r, self.failure(r)) for r in results]
+        failures = [(r, f) for r, f in failures if f is not None]
+        if not failures:
+            return True, results[0].answers[0]
+        if len(results) == 1:
+            return False, failures[0][1]
+        return False, "; ".join(f"{r.nameserver}: {f}" for r, f in failures)
 
     @property
     def target(self) -> str:
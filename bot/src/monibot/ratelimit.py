@@ -0,0 +1,170 @@
+import os
+import json
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+import logging
+log = logging.getLogger(__name__)
+
+
+class RateLimitError(Exception):
+    pass
+
+
+def read_config() -> Dict[str, Any]:
+    ratelimit_config = os.environ.get("RATELIMIT_CONFIG")
+    if not ratelimit_config:
+        return {}
+
+    try:
+        f = open(ratelimit_config, encoding="utf-8")
+    except (IOError, FileNotFoundError):
+        raise RateLimitError(f"cannot open configuration file '{ratelimit_config}'")
+
+    try:
+        conf = json.load(f)
+    except ValueError as e:
+        log.warning(e)
+        raise RateLimitError("cannot parse configuration")
+
+    return conf.get("ratelimit", {})
+
+
+# command -> tokens taken from the buckets, 'default_cost' for the others
+COSTS = {
+    "air": 3,
+    "book": 3,
+    "help": 0,
+    "?": 0,
+}
+# keep at most this many buckets of each scope
+MAX_BUCKETS = 1024
+
+
+class TokenBucket:
+    """
+    'capacity' tokens refilled at 'rate' tokens per second
+    """
+    def __init__(self, capacity: float, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self.updated)
+        self.tokens = min(self.capacity, self.tokens + elapsed*self.rate)
+        self.updated = now
+
+    def wait_sec(self, cost: float) -> float:
+        """
+        Returns seconds until 'cost' tokens are available, 0 if they are
+        """
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens)/self.rate
+
+    def is_full(self) -> bool:
+        return self.tokens >= self.capacity
+
+
+class RateLimiter:
+    """
+    token buckets per user and per channel
+
+    A command takes its cost from both the bucket of the user and the
+    bucket of the channel, or from neither if either is short.
+    """
+    def __init__(
+        self,
+        configuration: Optional[Dict[str, Any]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if configuration is None:
+            configuration = read_config()
+        try:
+            self.limits = {
+                scope: self.parse_limit(configuration.get(scope, {}), default)
+                for scope, default in (("user", (6, 6)), ("channel", (12, 12)))
+            }
+            self.default_cost = float(configuration.get("default_cost", 1))
+            self.costs = dict(COSTS)
+            self.costs.update({
+                k: float(v) for k, v in configuration.get("costs", {}).items()
+            })
+        except (ValueError, TypeError, AttributeError) as e:
+            raise RateLimitError(f"invalid ratelimit configuration: {e}")
+        smallest = min(capacity for capacity, _rate in self.limits.values())
+        for command, cost in list(self.costs.items()) + [("default", self.default_cost)]:
+            if cost < 0 or cost > smallest:
+                raise RateLimitError(
+                    f"cost of '{command}' must be between 0 and {smallest}")
+        log.debug(f"limits: {self.limits}, costs: {self.costs}, "
+                  f"default_cost: {self.default_cost}")
+
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.buckets: Dict[str, Dict[str, TokenBucket]] = {
+            scope: {} for scope in self.limits
+        }
+
+    @staticmethod
+    def parse_limit(conf: Dict[str, Any], default: Tuple[int, int]) -> Tuple[float, float]:
+        """
+        Returns (capacity, tokens per second) of 'capacity' and
+        'refill_per_min'
+        """
+        capacity = float(conf.get("capacity", default[0]))
+        refill = float(conf.get("refill_per_min", default[1]))
+        if capacity <= 0 or refill <= 0:
+            raise ValueError("'capacity' and 'refill_per_min' must be positive")
+        return (capacity, refill/60)
+
+    def cost(self, command: str) -> float:
+        return self.costs.get(command, self.default_cost)
+
+    def _bucket(self, scope: str, key: str, now: float) -> TokenBucket:
+        buckets = self.buckets[scope]
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= MAX_BUCKETS:
+                # a full bucket is the same as a new one
+                for k, b in list(buckets.items()):
+                    b.refill(now)
+                    if b.is_full():
+                        del buckets[k]
+            capacity, rate = self.limits[scope]
+            bucket = TokenBucket(capacity, rate, now)
+            buckets[key] = bucket
+        bucket.refill(now)
+        return bucket
+
+    def acquire(self, command: str, user: str, channel: str) -> Optional[str]:
+        """
+        Take the cost of 'command' from the buckets of 'user' and
+        'channel'
+
+        Returns None if the command may run, otherwise the reply to send
+        instead.
+        """
+        cost = self.cost(command)
+        if cost == 0:
+            return None
+        with self.lock:
+            now = self.clock()
+            user_bucket = self._bucket("user", user, now)
+            channel_bucket = self._bucket("channel", channel, now)
+            user_wait = user_bucket.wait_sec(cost)
+            channel_wait = channel_bucket.wait_sec(cost)
+            if user_wait == 0 and channel_wait == 0:
+                user_bucket.tokens -= cost
+                channel_bucket.tokens -= cost
+                return None
+        log.info(f"rate limited {command}: user {user}, channel {channel}")
+        wait = math.ceil(max(user_wait, channel_wait))
+        if user_wait >= channel_wait:
+            return (f"Sorry, you are sending too many commands. "
+                    f"Try {command} again in {wait} seconds.")
+        return (f"Sorry, this channel is sending too many commands. "
+                f"Try {command} again in {wait} seconds.")
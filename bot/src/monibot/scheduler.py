@@ -0,0 +1,539 @@
+import os
+import json
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+import logging
+log = logging.getLogger(__name__)
+
+
+class SchedulerError(Exception):
+    pass
+
+
+# what to do with a run due more than 'misfire_grace_sec' ago
+MISFIRE_RUN_ONCE = "run_once"
+MISFIRE_SKIP = "skip"
+MISFIRE_POLICIES = [MISFIRE_RUN_ONCE, MISFIRE_SKIP]
+
+# the job a thread of a Scheduler is running
+_current = threading.local()
+
+
+def current_run() -> Optional[Tuple[str, float]]:
+    """
+    Returns (job name, scheduled time) of the run on this thread, None
+    outside a job
+    """
+    return getattr(_current, "run", None)
+
+
+def read_config() -> Dict[str, Any]:
+    scheduler_config = os.environ.get("SCHEDULER_CONFIG")
+    if not scheduler_config:
+        return {}
+
+    try:
+        f = open(scheduler_config, encoding="utf-8")
+    except (IOError, FileNotFoundError):
+        raise SchedulerError(f"cannot open configuration file '{scheduler_config}'")
+
+    try:
+        conf = json.load(f)
+    except ValueError as e:
+        log.warning(e)
+        raise SchedulerError("cannot parse configuration")
+
+    return conf.get("scheduler", {})
+
+
+class Every:
+    """
+    fixed-rate schedule
+
+    Runs are 'interval_sec' apart from the first one however long each
+    run takes, and the first run is due at once.
+    """
+    def __init__(self, interval_sec: float):
+        if interval_sec <= 0:
+            raise SchedulerError(f"interval must be positive: {interval_sec}")
+        self.interval = interval_sec
+
+    def first(self, now: float) -> float:
+        return now
+
+    def next(self, previous: float, now: float) -> float:
+        """
+        Returns the first run after 'now' on the grid of 'previous'
+        """
+        if previous > now:
+            return previous
+        return previous + (int((now - previous)/self.interval) + 1)*self.interval
+
+    def __repr__(self) -> str:
+        return f"every {self.interval} seconds"
+
+
+class CronSchedule:
+    """
+    schedule of a five-field cron expression in local time
+
+    minute hour day-of-month month day-of-week, each '*', a number, a
+    range 'a-b', a list 'a,b' or any of them with a step '/n'. Sunday is
+    0 or 7. As in cron, a day matches either day field when both are
+    restricted.
+    """
+    FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        fields = expression.split()
+        if len(fields) != 5:
+            raise SchedulerError(f"'{expression}' is not a cron expression")
+        try:
+            (self.minutes, self.hours, self.days,
+             self.months, weekdays) = [
+                self.parse_field(field, low, high)
+                for field, (low, high) in zip(fields, self.FIELDS)
+            ]
+        except ValueError as e:
+            raise SchedulerError(f"invalid cron expression '{expression}': {e}")
+        self.weekdays = {d % 7 for d in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def parse_field(field: str, low: int, high: int) -> Set[int]:
+        values: Set[int] = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, s = part.split("/", 1)
+                step = int(s)
+                if step < 1:
+                    raise ValueError(f"step must be positive: {step}")
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                a, b = part.split("-", 1)
+                start, end = int(a), int(b)
+            else:
+                start = int(part)
+                end = high if step > 1 else start
+            if start < low or end > high or start > end:
+                raise ValueError(f"'{field}' is out of {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def day_matches(self, t: datetime) -> bool:
+        day = t.day in self.days
+        weekday = (t.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, after: datetime) -> datetime:
+        t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366*5)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self.day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise SchedulerError(f"'{self.expression}' never runs")
+
+    def first(self, now: float) -> float:
+        return self.next(now, now)
+
+    def next(self, previous: float, now: float) -> float:
+        if previous > now:
+            return previous
+        return self.next_after(datetime.fromtimestamp(now)).timestamp()
+
+    def __repr__(self) -> str:
+        return f"cron '{self.expression}'"
+
+
+def parse_schedule(conf: Dict[str, Any]) -> Optional[Any]:
+    """
+    Returns the schedule of 'interval_sec' or 'cron' in a job entry of
+    the configuration, or None
+    """
+    if "cron" in conf:
+        return CronSchedule(str(conf["cron"]))
+    if "interval_sec" in conf:
+        return Every(float(conf["interval_sec"]))
+    return None
+
+
+# upper bounds of histogram buckets
+SECONDS_BUCKETS = [0.01, 0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300]
+BYTES_BUCKETS = [0, 64, 256, 1024, 4096, 16384]
+
+
+class Histogram:
+    """
+    counts of observations in buckets of 'bounds', with their sum and
+    maximum
+    """
+    def __init__(self, bounds: List[float]):
+        self.bounds = bounds
+        self.counts = [0]*(len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                break
+        else:
+            i = len(self.bounds)
+        self.counts[i] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> float:
+        """
+        Returns the upper bound of the bucket holding the 'q' quantile,
+        or the maximum if it is smaller
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q*self.count
+        seen = 0
+        for bound, count in zip(self.bounds + [self.max], self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def mean(self) -> float:
+        return self.total/self.count if self.count else 0.0
+
+
+class JobStats:
+    """
+    what the runs of one job took
+
+    'late' is the start of a run behind its due time, including the wait
+    for a free worker. An overrun is a run longer than the period of its
+    schedule.
+    """
+    def __init__(self):
+        self.runs = 0
+        self.failures = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.missed = 0
+        self.late = Histogram(SECONDS_BUCKETS)
+        self.duration = Histogram(SECONDS_BUCKETS)
+        self.output = Histogram(BYTES_BUCKETS)
+        self.last_error: Optional[str] = None
+
+    def summary(self) -> str:
+        text = (f"{self.runs} runs, {self.failures} failed, "
+                f"{self.overruns} overran, {self.skipped + self.missed} skipped")
+        if self.runs:
+            text += (
+                f"\n  took {self.duration.mean():.2f}s on average, "
+                f"p90 {self.duration.percentile(0.9):.2f}s, max {self.duration.max:.2f}s"
+                f"\n  started p90 {self.late.percentile(0.9):.2f}s late, "
+                f"max {self.late.max:.2f}s"
+                f"\n  output p90 {self.output.percentile(0.9):.0f} bytes, "
+                f"max {self.output.max:.0f} bytes"
+            )
+        if self.last_error:
+            text += f"\n  last error: {self.last_error}"
+        return text
+
+
+class Job:
+    def __init__(
+        self,
+        name: str,
+        func: Callable[..., Any],
+        schedule: Any,
+        args: Tuple[Any, ...] = (),
+        kwargs: Optional[Dict[str, Any]] = None,
+        queue: Any = None,
+        jitter_sec: float = 0.0,
+        misfire: str = MISFIRE_RUN_ONCE,
+    ):
+        self.name = name
+        self.func = func
+        self.schedule = schedule
+        self.args = args
+        self.kwargs = kwargs if kwargs is not None else {}
+        self.queue = queue
+        self.jitter = jitter_sec
+        self.misfire = misfire
+        # scheduled time without jitter, the grid of the next run
+        self.planned: Optional[float] = None
+        # time the pending heap entry fires, None if there is none
+        self.due: Optional[float] = None
+        self.version = 0
+        self.running = False
+        self.failures = 0
+        self.stats = JobStats()
+
+    def __repr__(self) -> str:
+        return f"{self.name} ({self.schedule})"
+
+
+class Scheduler:
+    """
+    run periodic jobs from one timer thread
+
+    The timer thread sleeps until the earliest job of a heap is due and
+    hands it to a bounded pool of workers. A job still running when it
+    is due again skips that run. A failed job is retried after
+    'retry_sec', doubling up to 'max_retry_sec', and is back on its
+    schedule once it succeeds. A run due more than 'misfire_grace_sec'
+    ago, after a suspend or a busy pool, runs once or is skipped by
+    'misfire'. The schedule, 'jitter_sec' and 'misfire' of each job can
+    be overridden in 'jobs'.
+    """
+    def __init__(
+        self,
+        configuration: Optional[Dict[str, Any]] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        if configuration is None:
+            configuration = read_config()
+        try:
+            self.max_workers = int(configuration.get("max_workers", 2))
+            self.jitter = float(configuration.get("jitter_sec", 0))
+            self.misfire = configuration.get("misfire", MISFIRE_RUN_ONCE)
+            self.grace = float(configuration.get("misfire_grace_sec", 30))
+            self.retry = float(configuration.get("retry_sec", 60))
+            self.max_retry = float(configuration.get("max_retry_sec", 600))
+            self.overrides = {
+                name: dict(conf)
+                for name, conf in configuration.get("jobs", {}).items()
+            }
+            for name, conf in self.overrides.items():
+                conf["schedule"] = parse_schedule(conf)
+                self.check_misfire(conf.get("misfire", self.misfire))
+        except (ValueError, TypeError, AttributeError) as e:
+            raise SchedulerError(f"invalid scheduler configuration: {e}")
+        if self.max_workers < 1:
+            raise SchedulerError("'max_workers' must be at least 1")
+        self.check_misfire(self.misfire)
+        log.debug(f"max_workers: {self.max_workers}, jitter_sec: {self.jitter}, "
+                  f"misfire: {self.misfire}, retry_sec: {self.retry}")
+
+        self.clock = clock
+        self.condition = threading.Condition()
+        self.jobs: Dict[str, Job] = {}
+        self.heap: List[Tuple[float, int, str, int]] = []
+        self.sequence = itertools.count()
+        self.started = False
+        self.finish = False
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def backoff(self, failures: int) -> float:
+        """
+        Returns the wait before retrying a job after 'failures' failed
+        runs in a row
+        """
+        return min(self.retry*2**(failures - 1), self.max_retry)
+
+    @staticmethod
+    def check_misfire(misfire: str) -> None:
+        if misfire not in MISFIRE_POLICIES:
+            raise SchedulerError(f"'misfire' must be one of {MISFIRE_POLICIES}")
+
+    def add(
+        self,
+        name: str,
+        func: Callable[..., Any],
+        schedule: Any,
+        args: Tuple[Any, ...] = (),
+        kwargs: Optional[Dict[str, Any]] = None,
+        queue: Any = None,
+    ) -> Optional[Job]:
+        """
+        Schedule 'func', putting what it returns to 'queue'
+
+        A job of the same name gets the new schedule, its next run one
+        period from now. Returns None after shutdown().
+        """
+        override = self.overrides.get(name, {})
+        if override.get("schedule") is not None:
+            schedule = override["schedule"]
+        with self.condition:
+            if self.finish:
+                return None
+            job = self.jobs.get(name)
+            now = self.clock()
+            if job is not None:
+                job.func, job.args, job.queue = func, args, queue
+                job.kwargs = kwargs if kwargs is not None else {}
+                job.schedule = schedule
+                self._plan(job, schedule.next(now, now))
+                log.debug(f"reschedule {job}")
+                return job
+            job = Job(
+                name, func, schedule, args, kwargs, queue,
+                jitter_sec=float(override.get("jitter_sec", self.jitter)),
+                misfire=override.get("misfire", self.misfire),
+            )
+            self.jobs[name] = job
+            self._plan(job, schedule.first(now))
+            log.debug(f"schedule {job}")
+            return job
+
+    def remove(self, name: str) -> None:
+        with self.condition:
+            job = self.jobs.pop(name, None)
+            if job is not None:
+                job.version += 1
+                job.due = None
+
+    def _plan(self, job: Job, planned: float) -> None:
+        job.planned = planned
+        jitter = random.uniform(0, job.jitter) if job.jitter > 0 else 0.0
+        self._push(job, planned + jitter)
+
+    def _push(self, job: Job, due: float) -> None:
+        job.version += 1
+        job.due = due
+        heapq.heappush(self.heap, (due, next(self.sequence), job.name, job.version))
+        self.condition.notify()
+
+    def start(self) -> None:
+        with self.condition:
+            if self.started or self.finish:
+                return
+            self.started = True
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="job",
+            )
+            self.thread = threading.Thread(target=self._loop, name="scheduler")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def is_alive(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def _loop(self) -> None:
+        log.debug("start scheduler")
+        with self.condition:
+            while not self.finish:
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+                due, _seq, name, version = self.heap[0]
+                delay = due - self.clock()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+                heapq.heappop(self.heap)
+                job = self.jobs.get(name)
+                if job is None or job.version != version:
+                    continue
+                self._fire(job, due)
+        log.debug("scheduler is done")
+
+    def _fire(self, job: Job, due: float) -> None:
+        """
+        Called with the condition held when the heap entry of 'job' is due
+        """
+        now = self.clock()
+        late = now - due
+        job.due = None
+        previous = job.planned
+        self._plan(job, job.schedule.next(job.planned, now))
+        period = getattr(job.schedule, "interval", job.planned - previous)
+        if job.running:
+            log.warning(f"{job.name} is still running, skip this run")
+            job.stats.skipped += 1
+            return
+        if late > self.grace and job.misfire == MISFIRE_SKIP:
+            log.warning(f"{job.name} is {late:.0f} seconds late, skip this run")
+            job.stats.missed += 1
+            return
+        job.running = True
+        self.executor.submit(self._run, job, due, period)
+
+    def _run(self, job: Job, due: float, period: float) -> None:
+        log.debug(f"call '{job.name}'")
+        started = self.clock()
+        ret = None
+        error = None
+        _current.run = (job.name, due)
+        try:
+            ret = job.func(*job.args, **job.kwargs)
+        except Exception as e:
+            error = e
+        finally:
+            _current.run = None
+        duration = self.clock() - started
+        with self.condition:
+            job.running = False
+            stats = job.stats
+            stats.runs += 1
+            stats.late.observe(max(0.0, started - due))
+            stats.duration.observe(duration)
+            stats.output.observe(len(ret) if isinstance(ret, str) else 0)
+            if duration > period:
+                stats.overruns += 1
+                log.warning(f"{job.name} took {duration:.1f} seconds, "
+                            f"longer than its period of {period:.0f} seconds")
+            if error is not None:
+                stats.failures += 1
+                stats.last_error = str(error)
+                job.failures += 1
+                backoff = self.backoff(job.failures)
+                log.warning(f"failed to execute {job.name}(): {error}, "
+                            f"retry in {backoff:.0f} seconds")
+                if not self.finish and self.jobs.get(job.name) is job:
+                    self._push(job, self.clock() + backoff)
+                return
+            if job.failures:
+                log.info(f"{job.name} is back on schedule")
+                job.failures = 0
+        if job.queue is not None and ret:
+            job.queue.put_nowait(ret)
+
+    def report(self, name: str = "") -> str:
+        """
+        Returns the statistics of the jobs whose names start with 'name'
+        """
+        with self.condition:
+            lines = [
+                f"{job}: {job.stats.summary()}"
+                for job in sorted(self.jobs.values(), key=lambda j: j.name)
+                if job.name.startswith(name)
+            ]
+        if not lines:
+            return f"no jobs '{name}'" if name else "no jobs"
+        return "\n".join(lines)
+
+    def shutdown(self, wait: bool = False) -> None:
+        """
+        Stop the timer thread and drop runs not started yet; a running
+        job is not interrupted
+        """
+        with self.condition:
+            self.finish = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait, cancel_futures=True)
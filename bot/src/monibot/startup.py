@@ -0,0 +1,240 @@
+import os
+import json
+import functools
+import itertools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+import logging
+log = logging.getLogger(__name__)
+
+
+class StartupError(Exception):
+    pass
+
+
+STARTING = "starting"
+READY = "ready"
+FAILED = "failed"
+
+
+def read_config() -> Dict[str, Any]:
+    startup_config = os.environ.get("STARTUP_CONFIG")
+    if not startup_config:
+        return {}
+
+    try:
+        f = open(startup_config, encoding="utf-8")
+    except (IOError, FileNotFoundError):
+        raise StartupError(f"cannot open configuration file '{startup_config}'")
+
+    try:
+        conf = json.load(f)
+    except ValueError as e:
+        log.warning(e)
+        raise StartupError("cannot parse configuration")
+
+    return conf.get("startup", {})
+
+
+class Subsystems:
+    """
+    initialize independent subsystems concurrently
+
+    Every factory runs on its own thread as soon as start() is called. A
+    subsystem is 'starting' until its factory returns, then 'ready', or
+    'failed' if the factory raised or did not return within its timeout.
+    A factory finishing after its timeout is discarded. Callbacks given
+    to on_ready() are called with the object once it is ready, and again
+    with every object swapped in by reload().
+    """
+    def __init__(self, configuration: Optional[Dict[str, Any]] = None):
+        if configuration is None:
+            configuration = read_config()
+        try:
+            self.timeout = float(configuration.get("timeout_sec", 30.0))
+            self.timeouts = {
+                name: float(sec)
+                for name, sec in configuration.get("timeouts", {}).items()
+            }
+        except (ValueError, TypeError, AttributeError) as e:
+            raise StartupError(f"invalid startup configuration: {e}")
+        self.lock = threading.Lock()
+        self.factories: Dict[str, Tuple[Callable[[], Any], Tuple[Type[Exception], ...]]] = {}
+        self.reloaders: Dict[str, Callable[[Any], Any]] = {}
+        self.states: Dict[str, str] = {}
+        self.objects: Dict[str, Any] = {}
+        self.events: Dict[str, threading.Event] = {}
+        self.callbacks: Dict[str, List[Callable[[Any], None]]] = {}
+        self.generation = itertools.count(1)
+        self.running: Dict[str, int] = {}
+        self.timers: List[threading.Timer] = []
+        self.executor: Optional[ThreadPoolExecutor] = None
+
+    def add(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        errors: Tuple[Type[Exception], ...] = (Exception,),
+        reload: Optional[Callable[[Any], Any]] = None,
+    ) -> None:
+        """
+        Register a subsystem; 'errors' are the exceptions that disable it
+        quietly, anything else is logged with its traceback. 'reload'
+        builds the replacement from the running object, otherwise
+        reload() calls 'factory' again.
+        """
+        self.factories[name] = (factory, errors)
+        if reload is not None:
+            self.reloaders[name] = reload
+        self.states[name] = STARTING
+        self.events[name] = threading.Event()
+        self.callbacks.setdefault(name, [])
+
+    def start(self) -> None:
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, len(self.factories)),
+            thread_name_prefix="startup",
+        )
+        for name, (factory, errors) in self.factories.items():
+            log.debug(f"start {name}")
+            with self.lock:
+                generation = self._running(name)
+            self._launch(name, generation, factory)
+
+    def reload(self, names: Optional[List[str]] = None) -> None:
+        """
+        Rebuild subsystems from their configuration
+
+        A ready subsystem keeps running until its replacement is ready,
+        and keeps running if the replacement fails. A failed subsystem
+        starts again.
+        """
+        for name in names if names is not None else list(self.factories):
+            factory, errors = self.factories[name]
+            with self.lock:
+                if name in self.running:
+                    log.info(f"{name} is still {self.states[name]}")
+                    continue
+                if self.states[name] == READY:
+                    reloader = self.reloaders.get(name)
+                    if reloader is not None:
+                        factory = functools.partial(reloader, self.objects[name])
+                else:
+                    self.states[name] = STARTING
+                    self.events[name].clear()
+                generation = self._running(name)
+            log.info(f"reload {name}")
+            self._launch(name, generation, factory)
+
+    def _running(self, name: str) -> int:
+        generation = next(self.generation)
+        self.running[name] = generation
+        return generation
+
+    def _launch(self, name: str, generation: int, factory: Callable[[], Any]) -> None:
+        timeout = self.timeouts.get(name, self.timeout)
+        timer = threading.Timer(timeout, self._timeout, (name, generation, timeout))
+        timer.daemon = True
+        timer.start()
+        self.timers = [t for t in self.timers if t.is_alive()] + [timer]
+        future = self.executor.submit(factory)
+        future.add_done_callback(
+            lambda f: self._done(name, generation, f))
+
+    def _done(self, name: str, generation: int, future: Future) -> None:
+        errors = self.factories[name][1]
+        try:
+            obj = future.result()
+        except errors as e:
+            self._finish(name, generation, error=f"{name}: {e}")
+            return
+        except Exception as e:
+            log.exception(f"{name}: {e}")
+            self._finish(name, generation, error=f"{name}: {e}")
+            return
+        self._finish(name, generation, obj=obj)
+
+    def _timeout(self, name: str, generation: int, timeout: float) -> None:
+        self._finish(name, generation, error=f"{name}: not ready in {timeout} seconds")
+
+    def _finish(
+        self,
+        name: str,
+        generation: int,
+        obj: Any = None,
+        error: Optional[str] = None,
+    ) -> None:
+        with self.lock:
+            if self.running.get(name) != generation:
+                log.debug(f"{name} is already {self.states[name]}")
+                return
+            del self.running[name]
+            callbacks = []
+            if error is None:
+                self.states[name] = READY
+                self.objects[name] = obj
+                callbacks = list(self.callbacks[name])
+            elif self.states[name] != READY:
+                self.states[name] = FAILED
+            state = self.states[name]
+            self.events[name].set()
+        if error is not None:
+            log.warning(error)
+            if state == READY:
+                log.info(f"Keep running {name}")
+            else:
+                log.info(f"Disable {name}")
+            return
+        log.info(f"{name} is {state}")
+        for callback in callbacks:
+            self._call(name, callback, obj)
+
+    @staticmethod
+    def _call(name: str, callback: Callable[[Any], None], obj: Any) -> None:
+        try:
+            callback(obj)
+        except Exception as e:
+            log.exception(f"failed to call back {name}: {e}")
+
+    def on_ready(self, name: str, callback: Callable[[Any], None]) -> None:
+        with self.lock:
+            self.callbacks[name].append(callback)
+            obj = self.objects.get(name)
+            ready = self.states[name] == READY
+        if ready:
+            self._call(name, callback, obj)
+
+    def state(self, name: str) -> str:
+        return self.states.get(name, FAILED)
+
+    def get(self, name: str) -> Any:
+        """
+        Returns the object of a ready subsystem, otherwise None
+        """
+        return self.objects.get(name)
+
+    def wait(self, name: str, timeout: Optional[float] = None) -> Any:
+        """
+        Block until the subsystem is ready or has failed
+        """
+        self.events[name].wait(timeout)
+        return self.get(name)
+
+    def unavailable(self, name: str, command: str) -> Optional[str]:
+        """
+        Returns the reply to a command whose subsystem is not ready, or
+        None if it is ready
+        """
+        state = self.state(name)
+        if state == READY:
+            return None
+        if state == STARTING:
+            return f"Sorry, the {command} command is starting up. Try again later."
+        return f"Sorry, the {command} command is out of service."
+
+    def shutdown(self) -> None:
+        for timer in self.timers:
+            timer.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,102 @@
+import os
+import json
+from typing import Any, Dict, Iterable, List, Optional
+import logging
+log = logging.getLogger(__name__)
+
+
+class TenantError(Exception):
+    pass
+
+
+FRONTENDS = ["slack", "zulip"]
+ALERTS = ["temperature", "servers"]
+# answered for everyone, whatever 'commands' says
+ALWAYS = ["help", "?"]
+
+
+def read_config() -> Dict[str, Any]:
+    tenant_config = os.environ.get("TENANT_CONFIG")
+    if not tenant_config:
+        return {}
+
+    try:
+        f = open(tenant_config, encoding="utf-8")
+    except (IOError, FileNotFoundError):
+        raise TenantError(f"cannot open configuration file '{tenant_config}'")
+
+    try:
+        conf = json.load(f)
+    except ValueError as e:
+        log.warning(e)
+        raise TenantError("cannot parse configuration")
+
+    return conf.get("tenants", {})
+
+
+class Tenant:
+    """
+    one Slack workspace or Zulip stream served by the process
+
+    'settings' holds the tokens of the frontend. A setting missing there
+    is read from the environment value of the single-tenant bot.
+    'commands' lists the commands the tenant may use, all if None.
+    'alerts' lists the kinds of report sent to the tenant.
+    """
+    def __init__(
+        self,
+        name: str,
+        frontend: str,
+        settings: Optional[Dict[str, Any]] = None,
+        commands: Optional[Iterable[str]] = None,
+        alerts: Optional[Iterable[str]] = None,
+    ):
+        if frontend not in FRONTENDS:
+            raise TenantError(f"{name}: unknown frontend '{frontend}'")
+        self.name = name
+        self.frontend = frontend
+        self.settings = settings if settings is not None else {}
+        self.commands = None if commands is None else set(commands)
+        self.alerts = set(ALERTS if alerts is None else alerts)
+        unknown = self.alerts - set(ALERTS)
+        if unknown:
+            raise TenantError(f"{name}: unknown alerts {sorted(unknown)}")
+
+    def allows(self, command: str) -> bool:
+        return self.commands is None or command in ALWAYS or command in self.commands
+
+    def get(self, key: str, env: Optional[str] = None) -> Any:
+        value = self.settings.get(key)
+        if value is None and env is not None:
+            value = os.environ.get(env)
+        return value
+
+
+def load_tenants(
+    frontends: List[str],
+    configuration: Optional[Dict[str, Any]] = None,
+) -> List[Tenant]:
+    """
+    Tenants of the 'tenants' section, or one tenant named "default" for
+    each of 'frontends' configured by environment values
+    """
+    if configuration is None:
+        configuration = read_config()
+    if not configuration:
+        return [Tenant("default", frontend) for frontend in frontends]
+
+    tenants = []
+    for name, conf in configuration.items():
+        try:
+            settings = {k: v for k, v in conf.items()
+                        if k not in ("frontend", "commands", "alerts")}
+            tenants.append(Tenant(
+                name,
+                conf.get("frontend", ""),
+                settings,
+                conf.get("commands"),
+                conf.get("alerts"),
+            ))
+        except (AttributeError, TypeError) as e:
+            raise TenantError(f"{name}: invalid tenant: {e}")
+    return tenants
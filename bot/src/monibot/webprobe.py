@@ -0,0 +1,291 @@
+import asyncio
+import socket
+import ssl
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Union
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+import logging
+log = logging.getLogger(__name__)
+
+# probes run concurrently, one connection of each host for every probe thread
+POOL_MAXSIZE = 16
+MAX_BYTES = 64*1024
+# the rest of a body read after 'max_bytes', so that its connection goes
+# back to the pool; a longer body costs a new connection next time
+DRAIN_BYTES = 64*1024
+
+
+class TimingMixin:
+    """
+    record how long name resolution, TCP connect and TLS handshake of a
+    new connection took, in 'timings'
+    """
+    timings: Dict[str, float] = {}
+
+    def _new_conn(self):
+        started = time.monotonic()
+        host = getattr(self, "_dns_host", None)
+        if host is None:
+            # an urllib3 without '_dns_host', no timings
+            self.timings = {"started": started}
+            return super()._new_conn()
+        try:
+            infos = socket.getaddrinfo(
+                host, self.port, allowed_gai_family(), socket.SOCK_STREAM)
+        except (socket.gaierror, UnicodeError) as e:
+            raise NewConnectionError(self, f"Failed to establish a new connection: {e}")
+        resolved = time.monotonic()
+        # try every address in turn like urllib3 does, Host and SNI still use 'host'
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        error = NewConnectionError(self, f"Failed to establish a new connection: no address of {host}")
+        try:
+            for address in addresses:
+                self._dns_host = address
+                try:
+                    conn = super()._new_conn()
+                    break
+                except (NewConnectionError, ConnectTimeoutError) as e:
+                    log.debug(f"{host} ({address}): {e}")
+                    error = e
+            else:
+                raise error
+        finally:
+            self._dns_host = host
+        connected = time.monotonic()
+        self.timings = {
+            "started": started,
+            "dns": resolved - started,
+            "connect": connected - resolved,
+            "tls": 0.0,
+        }
+        return conn
+
+
+class TimedHTTPConnection(TimingMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimingMixin, HTTPSConnection):
+    def connect(self):
+        super().connect()
+        if "connect" in self.timings:
+            self.timings["tls"] = (
+                time.monotonic() - self.timings["started"]
+                - self.timings["dns"] - self.timings["connect"])
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    keep-alive session shared by every Web probe of the process
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = TimedAdapter(pool_maxsize=POOL_MAXSIZE)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+class WebResult:
+    """
+    one HTTP probe, times in milliseconds
+
+    'status' is the HTTP status code or the reason of the failure. The
+    setup times are zero when the probe reused a pooled connection.
+    """
+    def __init__(self, url: str):
+        self.url = url
+        self.status: Union[int, str] = -1
+        self.reused = False
+        self.dns_ms = 0.0
+        self.connect_ms = 0.0
+        self.tls_ms = 0.0
+        self.ttfb_ms = 0.0
+        self.total_ms = 0.0
+        self.bytes = 0
+        self.cert_expires: Optional[datetime] = None
+
+    @property
+    def cert_days(self) -> Optional[float]:
+        """
+        days until the certificate expires
+        """
+        if self.cert_expires is None:
+            return None
+        return (self.cert_expires - datetime.now(timezone.utc)).total_seconds()/86400
+
+    def summary(self) -> str:
+        text = f"{self.status}"
+        if isinstance(self.status, int):
+            text += (f", dns {self.dns_ms:.1f} ms, connect {self.connect_ms:.1f} ms, "
+                     f"tls {self.tls_ms:.1f} ms, ttfb {self.ttfb_ms:.1f} ms, "
+                     f"total {self.total_ms:.1f} ms, {self.bytes} bytes")
+            if self.reused:
+                text += ", reused"
+            if self.cert_days is not None:
+                text += f", certificate expires in {self.cert_days:.0f} days"
+        return text
+
+
+def peer_cert_expires(sock: Any) -> Optional[datetime]:
+    """
+    expiry of the certificate of an ssl.SSLSocket or ssl.SSLObject
+    """
+    if not isinstance(sock, (ssl.SSLSocket, ssl.SSLObject)):
+        return None
+    try:
+        cert = sock.getpeercert()
+    except (ValueError, OSError):
+        return None
+    if not cert or "notAfter" not in cert:
+        return None
+    return datetime.fromtimestamp(ssl.cert_time_to_seconds(cert["notAfter"]), timezone.utc)
+
+
+def cert_expires(conn: Any) -> Optional[datetime]:
+    return peer_cert_expires(getattr(conn, "sock", None))
+
+
+def remainder(length: Optional[str], read: int) -> int:
+    """
+    Returns how much of a body of Content-Length 'length' is left after
+    'read' bytes, DRAIN_BYTES if the length is unknown
+    """
+    try:
+        return max(0, int(length) - read)
+    except (TypeError, ValueError):
+        return DRAIN_BYTES
+
+
+def probe(
+    url: str,
+    method: str = "GET",
+    timeout: float = 3.0,
+    max_bytes: int = MAX_BYTES,
+) -> WebResult:
+    """
+    Request 'url' on the shared session, reading at most 'max_bytes' of
+    the body
+
+    A GET with no 'max_bytes' is sent as HEAD. Up to DRAIN_BYTES more
+    are read and discarded, so that the connection is reused.
+    """
+    if max_bytes <= 0 and method == "GET":
+        method = "HEAD"
+    result = WebResult(url)
+    started = time.monotonic()
+    try:
+        with get_session().request(method, url, timeout=timeout, stream=True) as response:
+            headers = time.monotonic()
+            result.status = response.status_code
+            conn = getattr(response.raw, "connection", None)
+            timings = getattr(conn, "timings", {})
+            if timings.get("started", 0) >= started:
+                result.dns_ms = timings.get("dns", 0.0)*1000
+                result.connect_ms = timings.get("connect", 0.0)*1000
+                result.tls_ms = timings.get("tls", 0.0)*1000
+            else:
+                result.reused = True
+            result.cert_expires = cert_expires(conn)
+            setup = result.dns_ms + result.connect_ms + result.tls_ms
+            result.ttfb_ms = max(0.0, (headers - started)*1000 - setup)
+            chunks = response.iter_content(chunk_size=8192)
+            for chunk in chunks:
+                result.bytes += len(chunk)
+                if result.bytes >= max_bytes:
+                    break
+            # a body read to its end releases the connection to the pool
+            left = remainder(response.headers.get("Content-Length"), result.bytes)
+            if 0 < left <= DRAIN_BYTES:
+                drained = 0
+                for chunk in chunks:
+                    drained += len(chunk)
+                    if drained > DRAIN_BYTES:
+                        break
+    except requests.exceptions.ConnectionError:
+        result.status = "Failed to establish a new connection"
+    except requests.exceptions.Timeout:
+        result.status = "Timeout"
+    except requests.exceptions.RequestException as e:
+        result.status = f"{type(e).__name__}"
+    result.total_ms = (time.monotonic() - started)*1000
+    log.debug(f"{url}: {result.summary()}")
+    return result
+
+
+async def aprobe(
+    session: Any,
+    url: str,
+    method: str = "GET",
+    timeout: float = 3.0,
+    max_bytes: int = MAX_BYTES,
+) -> WebResult:
+    """
+    probe() on an aiohttp session
+
+    aiohttp does not tell how a connection was set up, so only the
+    time to first byte and the total time are recorded.
+    """
+    import aiohttp
+    if max_bytes <= 0 and method == "GET":
+        method = "HEAD"
+    result = WebResult(url)
+    started = time.monotonic()
+    try:
+        async with session.request(
+                method, url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            result.ttfb_ms = (time.monotonic() - started)*1000
+            result.status = response.status
+            transport = response.connection.transport if response.connection else None
+            if transport is not None:
+                result.cert_expires = peer_cert_expires(transport.get_extra_info("ssl_object"))
+            async for chunk in response.content.iter_chunked(8192):
+                result.bytes += len(chunk)
+                if result.bytes >= max_bytes:
+                    break
+            left = remainder(response.headers.get("Content-Length"), result.bytes)
+            if 0 < left <= DRAIN_BYTES:
+                drained = 0
+                async for chunk in response.content.iter_chunked(8192):
+                    drained += len(chunk)
+                    if drained > DRAIN_BYTES:
+                        break
+    except aiohttp.ClientConnectionError:
+        result.status = "Failed to establish a new connection"
+    except asyncio.TimeoutError:
+        result.status = "Timeout"
+    except aiohttp.ClientError as e:
+        result.status = f"{type(e).__name__}"
+    result.total_ms = (time.monotonic() - started)*1000
+    log.debug(f"{url}: {result.summary()}")
+    return result
@@ -0,0 +1,162 @@
+import os
+import json
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional
+import logging
+log = logging.getLogger(__name__)
+
+
+class WorkerError(Exception):
+    pass
+
+
+class WorkerBusyError(WorkerError):
+    pass
+
+
+def read_config() -> Dict[str, Any]:
+    worker_config = os.environ.get("WORKER_CONFIG")
+    if not worker_config:
+        return {}
+
+    try:
+        f = open(worker_config, encoding="utf-8")
+    except (IOError, FileNotFoundError):
+        raise WorkerError(f"cannot open configuration file '{worker_config}'")
+
+    try:
+        conf = json.load(f)
+    except ValueError as e:
+        log.warning(e)
+        raise WorkerError("cannot parse configuration")
+
+    return conf.get("worker", {})
+
+
+class WorkerPool:
+    """
+    run command jobs on a fixed number of threads
+
+    Jobs wait in a bounded queue until a worker is free and the number of
+    running jobs of the same name is under its limit.
+    """
+    def __init__(self, configuration: Optional[Dict[str, Any]] = None):
+        if configuration is None:
+            configuration = read_config()
+        try:
+            self.max_workers = int(configuration.get("max_workers", 4))
+            self.max_queue = int(configuration.get("max_queue", 16))
+            self.limits = {
+                k: int(v) for k, v in configuration.get("limits", {}).items()
+            }
+        except (ValueError, TypeError, AttributeError) as e:
+            raise WorkerError(f"invalid worker configuration: {e}")
+        if self.max_workers < 1:
+            raise WorkerError("'max_workers' must be at least 1")
+        log.debug(f"max_workers: {self.max_workers}, "
+                  f"max_queue: {self.max_queue}, limits: {self.limits}")
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="worker",
+        )
+        self.lock = threading.Lock()
+        self.pending: deque = deque()
+        self.running: Dict[str, int] = {}
+
+    def submit(self, name: str, func: Callable, *args: Any, **kwargs: Any) -> int:
+        """
+        Queue a job
+
+        Returns 0 if the job started at once, otherwise its position in
+        the queue. Raises WorkerBusyError if the queue is full.
+        """
+        job = (name, func, args, kwargs)
+        with self.lock:
+            if len(self.pending) >= self.max_queue:
+                raise WorkerBusyError(f"{len(self.pending)} jobs are waiting")
+            self.pending.append(job)
+            self._dispatch()
+            for position, pending in enumerate(self.pending, 1):
+                if pending is job:
+                    log.debug(f"{name} is queued #{position}")
+                    return position
+        return 0
+
+    def _dispatch(self) -> None:
+        for job in list(self.pending):
+            if sum(self.running.values()) >= self.max_workers:
+                break
+            name = job[0]
+            limit = self.limits.get(name)
+            if limit is not None and self.running.get(name, 0) >= limit:
+                continue
+            self.pending.remove(job)
+            self.running[name] = self.running.get(name, 0) + 1
+            self.executor.submit(self._run, job)
+
+    def _run(self, job) -> None:
+        name, func, args, kwargs = job
+        log.debug(f"start {func.__name__} job...")
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            log.exception(f"failed to execute {func.__name__}(): {e}")
+        finally:
+            with self.lock:
+                self.running[name] -= 1
+                self._dispatch()
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self.lock:
+            self.pending.clear()
+        self.executor.shutdown(wait=wait)
+
+
+class Flight:
+    """
+    one in-flight job and the requests waiting for its result
+    """
+    def __init__(self, key: Hashable, waiter: Any):
+        self.key = key
+        self.waiters: List[Any] = [waiter]
+
+
+class SingleFlight:
+    """
+    coalesce identical requests into one job
+
+    The first request of a key becomes the leader and runs the job.
+    Identical requests arriving before the leader lands only join the
+    waiters and get the same result.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights: Dict[Hashable, Flight] = {}
+
+    def join(self, key: Hashable, waiter: Any) -> Optional[Flight]:
+        """
+        Returns a new Flight if the caller is the leader, otherwise None
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is not None:
+                flight.waiters.append(waiter)
+                log.debug(f"{key} joins {len(flight.waiters) - 1} waiters")
+                return None
+            flight = Flight(key, waiter)
+            self.flights[key] = flight
+            return flight
+
+    def land(self, flight: Flight) -> List[Any]:
+        """
+        Close the flight and return its waiters, only once
+        """
+        with self.lock:
+            if self.flights.get(flight.key) is flight:
+                del self.flights[flight.key]
+            waiters = flight.waiters
+            flight.waiters = []
+        return waiters
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+import pytest
+from monibot import aio
+from monibot.scheduler import Scheduler
+from monibot.startup import STARTING, Subsystems
+
+
+def test_coalescer():
+    calls = []
+
+    async def job():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def run():
+        flights = aio.Coalescer()
+        results = await asyncio.gather(
+            flights.run(("air", "1d"), job),
+            flights.run(("air", "1d"), job),
+            flights.run(("air", "2d"), job),
+        )
+        assert flights.flights == {}
+        again = await flights.run(("air", "1d"), job)
+        return results, again
+
+    results, again = asyncio.run(run())
+    assert results[0] == results[1]
+    assert len(calls) == 3
+    assert again == 3
+
+
+def test_cron():
+    async def run():
+        q = asyncio.Queue()
+        count = 0
+
+        async def check():
+            nonlocal count
+            count += 1
+            return "" if count % 2 else f"message {count}"
+
+        task = asyncio.create_task(aio.cron(check, 0.01, q))
+        first = await asyncio.wait_for(q.get(), 1)
+        second = await asyncio.wait_for(q.get(), 1)
+        task.cancel()
+        return first, second
+
+    assert asyncio.run(run()) == ("message 2", "message 4")
+
+
+def test_cron_schedule():
+    async def run():
+        q = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        started = []
+
+        async def slow():
+            started.append(loop.time())
+            await asyncio.sleep(0.05)
+            if len(started) in (2, 3):
+                raise ValueError("upstream is down")
+            return ""
+
+        scheduler = Scheduler({"retry_sec": 0.02, "max_retry_sec": 0.03})
+        task = asyncio.create_task(aio.cron(slow, 0.2, q, scheduler))
+        while len(started) < 5:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        return [b - a for a, b in zip(started, started[1:])]
+
+    gaps = asyncio.run(run())
+    # a run of 0.05 seconds does not shift the runs 0.2 seconds apart
+    assert gaps[0] == pytest.approx(0.2, abs=0.03)
+    # retried after 0.02 and 0.03 seconds, then back on the grid
+    assert gaps[1] == pytest.approx(0.05 + 0.02, abs=0.02)
+    assert gaps[2] == pytest.approx(0.05 + 0.03, abs=0.02)
+    assert sum(gaps[:4]) == pytest.approx(0.6, abs=0.03)
+
+
+def test_on_ready():
+    seen = []
+
+    async def run():
+        subsystems = Subsystems({"timeout_sec": 5})
+        subsystems.add("slow", lambda: time.sleep(0.1) or "ready")
+        ready = asyncio.Event()
+
+        def callback(obj):
+            seen.append((obj, threading.current_thread()))
+            ready.set()
+
+        aio.on_ready(subsystems, "slow", callback)
+        subsystems.start()
+        # the event loop goes on while the factory runs
+        assert subsystems.state("slow") == STARTING
+        await asyncio.wait_for(ready.wait(), 5)
+        subsystems.shutdown()
+
+    asyncio.run(run())
+    assert seen == [("ready", threading.main_thread())]
+
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
+
+
+def test_plot_output_error(mocker):
+    mocker.patch("co2.co2plot.figure",
+                 side_effect=aio.co2plot.OutputError("unknown output format 'gif'"))
+
+    async def plot():
+        return await aio.plot(asyncio.Semaphore(1), None, "co2plot.json", "/tmp")
+
+    assert asyncio.run(plot()) == ("co2plot: unknown output format 'gif'", [])
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from monibot import aioprobe
+
+
+class Target:
+    running = 0
+    most = 0
+    per_host = {}
+
+    def __init__(self, target, delay=0.05, alive=True, error=None):
+        self.target = target
+        self.delay = delay
+        self.alive = alive
+        self.error = error
+
+    async def ais_alive(self, session):
+        host = aioprobe.host_of(self)
+        Target.running += 1
+        Target.most = max(Target.most, Target.running)
+        Target.per_host[host] = Target.per_host.get(host, 0) + 1
+        assert Target.per_host[host] <= Target.limit
+        try:
+            await asyncio.sleep(self.delay)
+            if self.error is not None:
+                raise self.error
+            return (self.alive, f"{self.target} {session}")
+        finally:
+            Target.running -= 1
+            Target.per_host[host] -= 1
+
+
+def test_host_of():
+    assert aioprobe.host_of(Target("https://www.example.com:8443/a?b")) == "www.example.com"
+    assert aioprobe.host_of(Target("192.0.2.1")) == "192.0.2.1"
+
+
+def test_limits():
+    Target.running, Target.most, Target.per_host, Target.limit = 0, 0, {}, 2
+    targets = [Target(f"http://host{i % 3}.example/{i}") for i in range(30)]
+    engine = aioprobe.ProbeEngine(max_concurrency=5, max_per_host=2)
+    results = asyncio.run(engine.probe(targets, "session"))
+    assert results == [(True, f"{t.target} session") for t in targets]
+    # three hosts of two probes each, but five at once
+    assert Target.most == 5
+
+
+def test_deadline_and_errors():
+    Target.running, Target.most, Target.per_host, Target.limit = 0, 0, {}, 4
+    targets = [
+        Target("a.example"),
+        Target("b.example", delay=5),
+        Target("c.example", error=OSError("broken")),
+        Target("d.example", alive=False),
+    ]
+    engine = aioprobe.ProbeEngine()
+    started = time.monotonic()
+    results = asyncio.run(engine.probe(targets, None, deadline=0.3))
+    assert time.monotonic() - started < 1
+    assert results == [
+        (True, "a.example None"),
+        (False, "b.example: no answer"),
+        (False, "c.example: broken"),
+        (False, "d.example None"),
+    ]
+    assert Target.running == 0
+    assert asyncio.run(engine.probe([], None)) == []
+
+
+def test_loop_thread():
+    loop = aioprobe.LoopThread()
+    loop.session = "shared"
+
+    async def call(session):
+        await asyncio.sleep(0.01)
+        return session
+
+    assert loop.run(call, timeout=5) == "shared"
+    assert loop.start() is loop.start()
+    loop.session = None
+    loop.close()
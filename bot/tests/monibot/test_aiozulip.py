@@ -0,0 +1,65 @@
+import asyncio
+from types import SimpleNamespace
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from monibot.aiozulip import AsyncClient
+
+
+def zulip_app(calls):
+    async def register(request):
+        calls.append("register")
+        return web.json_response(
+            {"result": "success", "queue_id": "q1", "last_event_id": -1})
+
+    async def events(request):
+        calls.append(("events", request.query["last_event_id"]))
+        return web.json_response({"result": "success", "events": [
+            {"id": 0, "type": "heartbeat"},
+            {"id": 1, "type": "message", "message": {"content": "ip"}},
+        ]})
+
+    async def upload(request):
+        calls.append("upload")
+        data = await request.post()
+        assert data["file"].filename == "a.png"
+        return web.json_response(
+            {"result": "success", "uri": "/user_uploads/a.png"})
+
+    app = web.Application()
+    app.router.add_post("/api/v1/register", register)
+    app.router.add_get("/api/v1/events", events)
+    app.router.add_post("/api/v1/user_uploads", upload)
+    return app
+
+
+def test_async_client():
+    calls = []
+
+    async def run():
+        server = TestServer(zulip_app(calls))
+        await server.start_server()
+        try:
+            # the settings zulip.Client reads from zuliprc
+            client = SimpleNamespace(
+                email="bot@example.com", api_key="key",
+                base_url=str(server.make_url("/api")))
+            async with aiohttp.ClientSession() as session:
+                zc = AsyncClient(session, client)
+                finish = asyncio.Event()
+                async for msg in zc.messages(finish):
+                    assert msg == {"content": "ip"}
+                    finish.set()
+                for _ in range(2):
+                    uri = await zc.upload_file("a.png", b"same figure")
+                    assert uri == "/user_uploads/a.png"
+        finally:
+            await server.close()
+
+    asyncio.run(run())
+    assert calls == ["register", ("events", "-1"), "upload"]
+
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
@@ -0,0 +1,34 @@
+import asyncio
+import logging
+import pytest
+from monibot.startup import Subsystems
+
+pytest.importorskip("aiohttp")
+
+
+def test_import_without_environment(monkeypatch, caplog):
+    for name in ("SLACK_BOT_TOKEN", "SLACK_APP_TOKEN", "REPORT_WEBHOOK"):
+        monkeypatch.delenv(name, raising=False)
+    from monibot import amonibot
+    assert amonibot.app is None
+
+    monkeypatch.setenv("SLACK_BOT_TOKEN", "xoxb-test")
+    with caplog.at_level(logging.CRITICAL, logger="amonibot"):
+        with pytest.raises(SystemExit):
+            asyncio.run(amonibot.amain())
+    assert "Environment value 'SLACK_APP_TOKEN' is not defined" in caplog.text
+
+
+def test_starting_subsystem(monkeypatch):
+    from monibot import amonibot
+    subsystems = Subsystems({})
+    subsystems.add("book", lambda: None)
+    monkeypatch.setattr(amonibot, "subsystems", subsystems)
+    replies = []
+
+    async def respond(channel, message, figures=[]):
+        replies.append(message)
+
+    monkeypatch.setattr(amonibot, "respond", respond)
+    asyncio.run(amonibot.run_command("C1", "book python"))
+    assert replies == ["Sorry, the book command is starting up. Try again later."]
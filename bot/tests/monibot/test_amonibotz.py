@@ -0,0 +1,19 @@
+import asyncio
+import logging
+import pytest
+
+pytest.importorskip("aiohttp")
+
+
+@pytest.mark.parametrize("stream", [None, "monibot"])
+def test_import_without_environment(stream, monkeypatch, caplog):
+    monkeypatch.delenv("ZULIP_MONIBOT_STREAM", raising=False)
+    from monibot import amonibotz
+    assert amonibotz.client is None
+
+    if stream is not None:
+        monkeypatch.setenv("ZULIP_MONIBOT_STREAM", stream)
+    with caplog.at_level(logging.CRITICAL, logger="amonibotz"):
+        with pytest.raises(SystemExit):
+            asyncio.run(amonibotz.amain())
+    assert "Zulip stream:topic is not defined" in caplog.text
@@ -0,0 +1,189 @@
+import queue
+from datetime import date, datetime
+from types import SimpleNamespace
+import pytest
+from monibot.backend import Backend, RELOADABLE, ZULIP_MENTION, report_key
+from monibot.backend import latest_text, plot_title, split_command, usage
+from monibot.dispatcher import Batcher, Dispatcher
+from monibot.startup import Subsystems, READY
+from monibot.scheduler import Scheduler
+from monibot.worker import WorkerPool
+
+
+class FakeServers:
+    def __init__(self, changes):
+        self.changes = changes
+        self.calls = 0
+        self.stopped = False
+
+    def is_changed(self, classes, class1, class0):
+        self.calls += 1
+        return {target: {True: class1, False: class0}.get(state, state)
+                for target, state in self.changes.items()}
+
+    def stop(self):
+        self.stopped = True
+
+
+def ready(backend, name, obj):
+    backend.subsystems.states[name] = READY
+    backend.subsystems.objects[name] = obj
+
+
+def make_backend():
+    backend = Backend(Subsystems({}), WorkerPool({}), scheduler=Scheduler({}))
+    slack, zulip = queue.Queue(), queue.Queue()
+    backend.attach(slack, {"up": ":large_green_circle:", "down": ":red_circle:"})
+    backend.attach(zulip, {"up": ":green_circle:", "down": ":red_circle:"})
+    return backend, slack, zulip
+
+
+def test_subsystems():
+    backend, slack_, zulip_ = make_backend()
+    for name in RELOADABLE:
+        assert backend.subsystems.state(name) == "starting"
+
+
+def test_check_servers_fans_out():
+    backend, slack, zulip = make_backend()
+    servers = FakeServers({"a.example": True, "b.example": False, "c.example": "degraded"})
+    ready(backend, "servers", servers)
+    assert backend.check_servers() == ""
+    assert servers.calls == 1
+    assert slack.get_nowait() == (
+        ":large_green_circle: a.example\n:red_circle: b.example\ndegraded c.example\n")
+    assert zulip.get_nowait() == (
+        ":green_circle: a.example\n:red_circle: b.example\ndegraded c.example\n")
+
+    servers.changes = {}
+    backend.check_servers()
+    assert slack.empty() and zulip.empty()
+
+
+def test_check_temperature_fans_out():
+    backend, slack, zulip = make_backend()
+    assert backend.check_temperature() == ""
+    message = "keep your pipes!!\nA low of -6.0°C"
+    ready(backend, "forecast", SimpleNamespace(check_temperature=lambda: message))
+    backend.check_temperature()
+    assert slack.get_nowait() == message
+    assert zulip.get_nowait() == message
+
+
+def test_start_cron():
+    backend, slack_, zulip_ = make_backend()
+
+    def refresh():
+        return ""
+
+    backend.start_cron(refresh, 60)
+    backend.start_cron(refresh, 30)
+    assert list(backend.scheduler.jobs) == ["refresh"]
+    assert backend.scheduler.jobs["refresh"].schedule.interval == 30
+    assert not backend.scheduler.is_alive()
+
+    backend.scheduler.start()
+    servers = FakeServers({})
+    servers.ping_interval_sec = 120
+    ready(backend, "servers", servers)
+    for callback in backend.subsystems.callbacks["servers"]:
+        callback(servers)
+    assert backend.scheduler.jobs["check_servers"].schedule.interval == 120
+    assert backend.scheduler.is_alive()
+    backend.stop()
+    assert not backend.scheduler.is_alive()
+    assert servers.stopped
+    backend.start_cron(lambda: "", 10)
+    assert "<lambda>" not in backend.scheduler.jobs
+
+
+def test_alerts():
+    backend, slack, zulip = make_backend()
+    quiet = queue.Queue()
+    backend.attach(quiet, {}, alerts=["temperature"])
+    ready(backend, "servers", FakeServers({"a.example": False}))
+    backend.check_servers()
+    assert slack.get_nowait() == ":red_circle: a.example\n"
+    assert quiet.empty()
+
+    backend.report("cold", "temperature")
+    assert quiet.get_nowait() == "cold"
+    assert zulip.get_nowait() == ":red_circle: a.example\n"
+    assert zulip.get_nowait() == "cold"
+
+
+def test_report_key(tmp_path, mocker):
+    backend = Backend(Subsystems({}), WorkerPool({}), scheduler=Scheduler({}))
+    batcher = Batcher({"outbox": str(tmp_path / "outbox.db")})
+    backend.attach(Dispatcher(lambda text: None, batcher), {"down": ":red_circle:"})
+    ready(backend, "servers", FakeServers({"a.example": False}))
+
+    # outside a scheduled run every report is new
+    assert report_key("a") is None
+    run = mocker.patch("monibot.backend.current_run", return_value=("check_servers", 1000.0))
+    key = report_key(":red_circle: a.example\n")
+    assert key.startswith("check_servers:1000:")
+    assert report_key("other") != key
+
+    backend.check_servers()
+    backend.check_servers()
+    assert [r.key for r in batcher.pending] == [key]
+    # the same run replayed after a restart
+    batcher.outbox.flush()
+    replayed = Batcher({"outbox": str(tmp_path / "outbox.db")})
+    assert replayed.put(":red_circle: a.example\n", key=key) is None
+
+    run.return_value = ("check_servers", 1060.0)
+    backend.check_servers()
+    assert len(batcher.pending) == 2
+
+
+COMMANDS = ["air", "book", "ip", "weather", "ping", "help", "?"]
+
+
+@pytest.mark.parametrize("message, command, argument", [
+    ("ip", "ip", ""),
+    ("air 1d", "air", "1d"),
+    ("", "help", ""),
+    ("?", "?", ""),
+    ("we", "weather", ""),
+    ("hello world", "book", "hello world"),
+    ("    hello world", "book", "hello world"),
+    ("book hello world", "book", "hello world"),
+])
+def test_split_command(message, command, argument):
+    assert split_command(message, COMMANDS) == (command, argument)
+    if message:
+        assert split_command(f"@**Bot** @**Dot** {message}", COMMANDS, ZULIP_MENTION) == (
+            command, argument)
+
+
+def test_usage():
+    subsystems = Subsystems({})
+    for name in ["book", "forecast", "servers", "ip"]:
+        subsystems.add(name, lambda: None)
+    assert usage(COMMANDS, None, subsystems) == "help|?"
+    subsystems.states["servers"] = READY
+    subsystems.objects["servers"] = object()
+    assert usage(COMMANDS, "co2plot.json", subsystems) == "air [now|DATE]|ping|help|?"
+    assert usage(COMMANDS + ["cron"], None, subsystems,
+                 lambda command: command != "ping") == "cron [JOB]|help|?"
+
+
+def test_latest_text():
+    now = {"room": {
+        "timestamp": "2024-01-01 10:00",
+        "metadata": {
+            "t": {"name": "Temperature", "unit": "degree celsius"},
+            "c": {"name": "Carbon Dioxide", "unit": "ppm"},
+        },
+        "payload": {"t": 21.25, "c": 612},
+    }}
+    assert latest_text(now) == "room (2024-01-01 10:00)\n     🌡 21.2°\n     💨 612ppm\n"
+
+
+def test_plot_title():
+    assert plot_title(None) == "Measurements "
+    assert plot_title((date(2024, 1, 1), None)) == "Measurements from 2024-01-01 "
+    assert plot_title((datetime(2024, 1, 1, 9), datetime(2024, 1, 1, 12))) == (
+        "Measurements from 2024-01-01 09:00 to 2024-01-01 12:00")
@@ -0,0 +1,83 @@
+import asyncio
+import pytest
+from slack_sdk import WebClient
+import monibot.command as cmd
+
+
+def test_shared_client(mocker, monkeypatch):
+    monkeypatch.setenv("SLACK_BOT_TOKEN", "xoxb-dummy")
+    mocker.patch.object(cmd, "_client", None)
+    client = cmd.get_client()
+    assert client is cmd.get_client()
+    kinds = [type(h).__name__ for h in client.retry_handlers]
+    assert "RateLimitErrorRetryHandler" in kinds
+
+    other = WebClient(token="xoxb-dummy")
+    cmd.set_client(other)
+    assert cmd.get_client() is other
+    assert len(other.retry_handlers) == 3
+
+
+def test_respond(mocker, monkeypatch):
+    monkeypatch.setenv("SLACK_BOT_TOKEN", "xoxb-dummy")
+    mocker.patch.object(cmd, "_client", None)
+    upload = mocker.patch.object(WebClient, "files_upload_v2")
+    post = mocker.patch.object(WebClient, "chat_postMessage")
+
+    command = cmd.Command(channel="C0123", message="Measurements")
+    command.respond()
+    post.assert_called_once_with(channel="C0123", text="Measurements")
+
+    command.files = ["a.png", "b.png"]
+    command.respond()
+    upload.assert_called_once_with(
+        channel="C0123",
+        file_uploads=[
+            {"file": "a.png", "title": "Measurements"},
+            {"file": "b.png", "title": "Measurements"},
+        ],
+    )
+
+
+def test_respond_tenant_client(mocker, monkeypatch):
+    monkeypatch.setenv("SLACK_BOT_TOKEN", "xoxb-dummy")
+    shared = mocker.patch.object(cmd, "get_client")
+    workspace = mocker.Mock()
+
+    command = cmd.Command(channel="C0123", message="hello", client=workspace)
+    command.respond()
+    workspace.chat_postMessage.assert_called_once_with(channel="C0123", text="hello")
+    shared.assert_not_called()
+
+
+def test_async_retry_handlers():
+    web = pytest.importorskip("aiohttp.web")
+    from slack_sdk.web.async_client import AsyncWebClient
+    calls = []
+
+    async def auth_test(request):
+        calls.append(request.path)
+        if len(calls) == 1:
+            return web.json_response(
+                {"ok": False, "error": "ratelimited"},
+                status=429, headers={"Retry-After": "0"})
+        return web.json_response({"ok": True, "user_id": "U0123"})
+
+    async def call():
+        app = web.Application()
+        app.router.add_post("/api/auth.test", auth_test)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            client = AsyncWebClient(token="xoxb-dummy", base_url=f"http://127.0.0.1:{port}/api/")
+            cmd.add_retry_handlers(client, cmd.async_retry_handlers())
+            return await client.auth_test()
+        finally:
+            await runner.cleanup()
+
+    response = asyncio.run(call())
+    assert response["user_id"] == "U0123"
+    assert calls == ["/api/auth.test", "/api/auth.test"]
@@ -0,0 +1,129 @@
+import os
+import threading
+import pytest
+import monibot.dispatcher as dispatcher
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_read_config(tmp_path):
+    os.environ.pop("REPORT_CONFIG", None)
+    assert dispatcher.read_config() == {}
+
+    config_path = tmp_path / "monibot.conf"
+    config_path.write_text('{"report": {"window_sec": 5, "urgent": ["fire"]}}')
+    os.environ["REPORT_CONFIG"] = str(config_path)
+    batcher = dispatcher.Batcher()
+    assert batcher.window == 5.0
+    assert batcher.is_urgent("fire!!")
+    assert not batcher.is_urgent(":red_circle: example.com")
+
+    config_path.write_text('{"report": {"window_sec": "x"}}')
+    with pytest.raises(dispatcher.DispatcherError):
+        dispatcher.Batcher()
+
+    os.environ["REPORT_CONFIG"] = str(tmp_path / "xxx.conf")
+    with pytest.raises(dispatcher.DispatcherError) as excinfo:
+        dispatcher.Batcher()
+    assert "cannot open configuration file" in str(excinfo.value)
+    os.environ.pop("REPORT_CONFIG")
+
+
+def test_batcher_window():
+    clock = Clock()
+    batcher = dispatcher.Batcher({"window_sec": 2, "min_interval_sec": 1}, clock)
+    assert batcher.next_wait() is None
+
+    batcher.put(":large_green_circle: a\n")
+    clock.now += 1
+    batcher.put(":large_green_circle: b\n")
+    assert batcher.next_wait() == 1.0
+    assert batcher.take() == []
+
+    clock.now += 1
+    batch = batcher.take()
+    assert batcher.text(batch) == ":large_green_circle: a\n:large_green_circle: b"
+    batcher.done(batch)
+
+    batcher.put(":large_green_circle: c")
+    clock.now += 2
+    assert batcher.next_wait() == 0
+    batcher.put("keep your pipes!!\nA low of -6.0°C")
+    batch = batcher.take()
+    assert [r.message for r in batch] == [
+        "keep your pipes!!\nA low of -6.0°C",
+        ":large_green_circle: c",
+    ]
+
+
+def test_batcher_urgent_and_rate_limit():
+    clock = Clock()
+    batcher = dispatcher.Batcher({"window_sec": 10, "min_interval_sec": 1}, clock)
+    batcher.put(":red_circle: example.com")
+    assert batcher.next_wait() == 0
+    batcher.done(batcher.take())
+
+    batcher.put(":red_circle: example.org")
+    assert batcher.next_wait() == 1.0
+    clock.now += 1
+    assert batcher.text(batcher.take()) == ":red_circle: example.org"
+
+
+def test_batcher_retry():
+    clock = Clock()
+    batcher = dispatcher.Batcher(
+        {"window_sec": 0, "retry_sec": 10, "max_retry_sec": 15}, clock)
+    batcher.put("first")
+    batcher.put("second")
+    batch = batcher.take()
+    batcher.done(batch, RuntimeError("network"))
+    assert batcher.next_wait() == 10.0
+
+    batcher.put(":red_circle: example.com")
+    clock.now += 10
+    batch = batcher.take()
+    assert [r.message for r in batch] == [":red_circle: example.com", "first", "second"]
+    batcher.done(batch, RuntimeError("network"))
+    assert batcher.next_wait() == 15.0
+
+    clock.now += 15
+    batch = batcher.take()
+    batcher.done(batch, dispatcher.RetryAfter(30))
+    assert batcher.next_wait() == 30.0
+
+
+def test_batcher_max_length():
+    clock = Clock()
+    batcher = dispatcher.Batcher({"window_sec": 0, "max_length": 10}, clock)
+    for message in ("aaaa", "bbbb", "cccc"):
+        batcher.put(message)
+    assert batcher.text(batcher.take()) == "aaaa\nbbbb"
+
+
+def test_dispatcher():
+    sent = []
+    done = threading.Event()
+
+    def send(text):
+        sent.append(text)
+        done.set()
+
+    q = dispatcher.Dispatcher(
+        send, dispatcher.Batcher({"window_sec": 0.2, "min_interval_sec": 0}))
+    q.start()
+    q.put_nowait("a")
+    q.put_nowait("b")
+    assert done.wait(5)
+    q.abort()
+    q.join(5)
+    assert sent == ["a\nb"]
+
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
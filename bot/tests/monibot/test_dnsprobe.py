@@ -0,0 +1,138 @@
+import asyncio
+import socketserver
+import threading
+import time
+import dns.message
+import dns.rcode
+import dns.rdatatype
+import dns.rrset
+import pytest
+from monibot import dnsprobe
+from monibot.ping import DNS
+
+ZONE = {
+    ("www.example.com.", "A"): ["192.0.2.10", "192.0.2.11"],
+    ("example.com.", "MX"): ["10 mail.example.com."],
+    ("slow.example.com.", "A"): ["192.0.2.20"],
+}
+
+
+class Handler(socketserver.BaseRequestHandler):
+    delay = {}
+
+    def handle(self):
+        data, sock = self.request
+        request = dns.message.from_wire(data)
+        question = request.question[0]
+        name = question.name.to_text()
+        rdtype = dns.rdatatype.to_text(question.rdtype)
+        host = self.server.server_address[0]
+        time.sleep(self.delay.get((host, name), 0))
+        response = dns.message.make_response(request)
+        records = ZONE.get((name, rdtype))
+        if records is not None:
+            response.answer.append(dns.rrset.from_text_list(name, 60, "IN", rdtype, records))
+        elif not any(n == name for n, _t in ZONE):
+            response.set_rcode(dns.rcode.NXDOMAIN)
+        sock.sendto(response.to_wire(), self.client_address)
+
+
+@pytest.fixture
+def nameservers(monkeypatch):
+    """
+    two nameservers on 127.0.0.2 and 127.0.0.3, the resolvers of the
+    probes point at their port
+    """
+    servers = []
+    for address in ("127.0.0.2", "127.0.0.3"):
+        server = socketserver.ThreadingUDPServer((address, 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    ports = {s.server_address[0]: s.server_address[1] for s in servers}
+    original = dnsprobe.get_resolver
+
+    def get_resolver(nameserver, *args, **kwargs):
+        resolver = original(nameserver, *args, **kwargs)
+        resolver.port = ports.get(nameserver, 53)
+        return resolver
+
+    monkeypatch.setattr(dnsprobe, "get_resolver", get_resolver)
+    # resolvers pointed at the test ports are not shared with later tests
+    monkeypatch.setattr(dnsprobe, "_resolvers", {})
+    monkeypatch.setattr(Handler, "delay", {})
+    yield list(ports)
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_shared_resolver(monkeypatch):
+    monkeypatch.setattr(dnsprobe, "_resolvers", {})
+    resolver = dnsprobe.get_resolver("192.0.2.53")
+    assert dnsprobe.get_resolver("192.0.2.53") is resolver
+    assert dnsprobe.get_resolver("192.0.2.53", timeout=1.0) is not resolver
+    assert resolver.nameservers == ["192.0.2.53"]
+    assert resolver.cache is None
+    with pytest.raises(ValueError):
+        dnsprobe.get_resolver("ns.example.com")
+
+
+def test_query(nameservers):
+    target = DNS("www.example.com", nameserver=nameservers[0])
+    alive, response = target.is_alive()
+    assert alive is True
+    assert response in ("192.0.2.10", "192.0.2.11")
+    result, = target.last
+    assert sorted(result.answers) == ["192.0.2.10", "192.0.2.11"]
+    assert 0 < result.rtt_ms < 1000
+    assert result.summary().startswith(
+        f"127.0.0.2: www.example.com A {', '.join(result.answers)}, ")
+
+    assert DNS("www.example.invalid", nameserver=nameservers[0]).is_alive() == (
+        False, "Hostname does not exist")
+    assert DNS("www.example.com", nameserver=nameservers[0], record_type="MX").is_alive() == (
+        False, "No records")
+
+
+def test_expected(nameservers):
+    target = DNS("example.com", nameserver=nameservers[0], record_type="mx",
+                 expected="10 MAIL.example.com")
+    assert target.is_alive() == (True, "10 mail.example.com.")
+    target = DNS("www.example.com", nameserver=nameservers[0],
+                 expected=["192.0.2.11", "192.0.2.12"])
+    alive, response = target.is_alive()
+    assert alive is False
+    assert response.startswith("unexpected answer: 192.0.2.1")
+    assert DNS("www.example.com", nameserver=nameservers[0],
+               expected=["192.0.2.11", "192.0.2.10"]).is_alive()[0] is True
+    with pytest.raises(ValueError):
+        DNS("example.com", record_type="XYZ")
+
+
+def test_parallel_nameservers(nameservers):
+    Handler.delay = {(ns, "slow.example.com."): 0.3 for ns in nameservers}
+    target = DNS("slow.example.com", nameservers=nameservers)
+    started = time.monotonic()
+    assert target.is_alive() == (True, "192.0.2.20")
+    # both answer in one delay
+    assert time.monotonic() - started < 0.55
+    assert [r.nameserver for r in target.last] == nameservers
+
+    Handler.delay = {(nameservers[1], "slow.example.com."): 0.3}
+    target = DNS("slow.example.com", nameservers=nameservers, max_rtt_ms=200)
+    alive, response = target.is_alive()
+    assert alive is False
+    assert response.startswith("127.0.0.3: slow: ")
+
+    alive, response = asyncio.run(target.ais_alive(None))
+    assert alive is False
+    assert response.startswith("127.0.0.3: slow: ")
+    assert target.last[0].rtt_ms < 200
+
+
+def test_timeout(monkeypatch):
+    monkeypatch.setattr(dnsprobe, "_resolvers", {})
+    target = DNS("example.com", nameserver="192.0.2.1", timeout_sec=0.2, lifetime_sec=0.3)
+    started = time.monotonic()
+    assert target.is_alive() == (False, "Request Timeout")
+    assert time.monotonic() - started < 1
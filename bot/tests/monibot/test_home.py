@@ -0,0 +1,90 @@
+import pytest
+import monibot
+from monibot.home import HomeSnapshot
+
+
+class Forecast:
+    def __init__(self):
+        self.latest_time = 20241027102000
+        self.calls = 0
+
+    def fetch_observation(self):
+        self.calls += 1
+        return (self.latest_time, f"observed at {self.latest_time}")
+
+
+class IP:
+    def __init__(self):
+        self.address = "192.0.2.1"
+
+    def get(self):
+        if self.address is None:
+            raise ConnectionError("no route")
+        return self.address
+
+
+latest = {
+    "living/SCD30": {
+        "timestamp": "2024-10-27T10:20:00+0900",
+        "payload": {2: 582.0},
+        "metadata": {2: {"name": "Carbon Dioxide", "unit": "ppm"}},
+    },
+}
+
+
+def test_home_snapshot(mocker):
+    get_latest = mocker.patch("co2.co2plot.get_latest", return_value=latest)
+    forecast = Forecast()
+    ip = IP()
+    now = [1000.0]
+    assert HomeSnapshot().blocks[0]["text"]["text"] == "No Air Information"
+    home = HomeSnapshot("co2plot.json", forecast, ip, clock=lambda: now[0])
+
+    assert home.update(*home.collect()) is True
+    view = home.view("U012345")
+    assert view["blocks"][0]["text"]["text"] == "*Welcome :house:, <@U012345>*"
+    fields = view["blocks"][1]["fields"]
+    assert fields[0]["text"] == \
+        "living/SCD30 (2024-10-27T10:20:00+0900)\n💨 582ppm \n"
+    assert fields[1]["text"] == "observed at 20241027102000"
+    assert view["blocks"][3]["text"]["text"] == \
+        f"IP Adderss: 192.0.2.1\nVersion: {monibot.__version__}"
+
+    blocks = home.blocks
+    assert home.update(*home.collect()) is False
+    assert home.blocks is blocks
+
+    # the observation and the address are not fetched again while fresh
+    forecast.latest_time = 20241027103000
+    ip.address = None
+    now[0] += 60
+    assert home.update(*home.collect()) is False
+    assert forecast.calls == 1
+
+    now[0] += 600
+    assert home.update(*home.collect()) is True
+    assert forecast.calls == 2
+    assert home.blocks[0]["fields"][1]["text"] == "observed at 20241027103000"
+    assert "192.0.2.1" in home.blocks[2]["text"]["text"]
+
+    # a failed fetch is retried on the next refresh
+    now[0] += 3600
+    home.update(*home.collect())
+    assert home.is_stale("address")
+    ip.address = "192.0.2.2"
+    now[0] += 60
+    assert home.update(*home.collect()) is True
+    assert not home.is_stale("address")
+    assert "192.0.2.2" in home.blocks[2]["text"]["text"]
+    assert get_latest.call_count == 6
+
+
+def test_home_snapshot_forecast_unavailable():
+    home = HomeSnapshot(forecast=Forecast())
+    assert home.update(None, None, None) is False
+    assert home.blocks[0]["fields"][0]["text"] == \
+        "Sorry, weather forecast is temporarily unavailable."
+
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
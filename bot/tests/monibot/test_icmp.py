@@ -0,0 +1,182 @@
+import asyncio
+import socket
+import struct
+import time
+import pytest
+from monibot import icmp
+from monibot.ping import ICMP
+
+
+def test_checksum():
+    # RFC 1071 example
+    assert icmp.checksum(bytes([0x00, 0x01, 0xf2, 0x03, 0xf4, 0xf5, 0xf6, 0xf7])) == 0x220d
+    packet = icmp.echo_request(0x1234, 7)
+    assert icmp.checksum(packet) == 0
+    assert struct.unpack("!BBHHH", packet[:8])[3:] == (0x1234, 7)
+
+
+def test_parse_reply():
+    reply = struct.pack("!BBHHH", icmp.ICMP_ECHO_REPLY, 0, 0, 0x1234, 7) + icmp.PAYLOAD
+    assert icmp.parse_reply(reply, raw=False) == (0x1234, 7)
+    ip_header = bytes([0x45]) + bytes(19)
+    assert icmp.parse_reply(ip_header + reply, raw=True) == (0x1234, 7)
+    # our own request seen by a raw socket
+    assert icmp.parse_reply(ip_header + icmp.echo_request(0x1234, 7), raw=True) is None
+    assert icmp.parse_reply(b"\x00", raw=False) is None
+
+
+def test_echo_result():
+    result = icmp.EchoResult("localhost", "127.0.0.1")
+    assert result.loss == 100.0
+    assert result.min is None
+    result.sent = 4
+    result.rtts = [1.0, 2.0, 3.0]
+    assert result.received == 3
+    assert result.loss == 25.0
+    assert (result.min, result.avg, result.max) == (1.0, 2.0, 3.0)
+    assert result.mdev == pytest.approx(0.816, abs=0.001)
+    assert result.summary() == (
+        "4 packets transmitted, 3 received, 25% packet loss, "
+        "rtt min/avg/max/mdev = 1.000/2.000/3.000/0.816 ms")
+
+
+def test_icmp_result():
+    target = ICMP("example.invalid")
+    assert target.echo_result(icmp.EchoResult("example.invalid", error="no name")) == (
+        False, "example.invalid: failure in name resolution")
+    assert target.echo_result(icmp.EchoResult("example.invalid", "192.0.2.1")) == (
+        False, "example.invalid: unreachable")
+
+
+def test_engine_localhost():
+    try:
+        sock, _raw = icmp.open_socket()
+    except icmp.IcmpError as e:
+        pytest.skip(str(e))
+    sock.close()
+
+    engine = icmp.EchoEngine()
+    results = engine.ping_many(["localhost", "127.0.0.1", "example.invalid"],
+                               count=3, interval=0.05)
+    for host in ["localhost", "127.0.0.1"]:
+        assert results[host].sent == 3
+        assert results[host].received == 3
+        assert results[host].loss == 0
+    assert results["example.invalid"].error is not None
+    assert engine.pending == {}
+
+
+def test_aping_localhost():
+    try:
+        sock, _raw = icmp.open_socket()
+    except icmp.IcmpError as e:
+        pytest.skip(str(e))
+    sock.close()
+
+    engine = icmp.EchoEngine()
+
+    async def ping_all():
+        return await asyncio.gather(
+            engine.aping("localhost", count=3, interval=0.05),
+            engine.aping("127.0.0.1", count=3, interval=0.05),
+            engine.aping("example.invalid", count=3, interval=0.05),
+        )
+
+    localhost, loopback, invalid = asyncio.run(ping_all())
+    for result in (localhost, loopback):
+        assert result.sent == 3
+        assert result.received == 3
+    assert invalid.error is not None
+    assert engine.pending == {}
+
+
+def test_ping_all(mocker):
+    ping_many = mocker.patch.object(icmp.engine, "ping_many", return_value={
+        "a.example": icmp.EchoResult("a.example", error="no name"),
+        "b.example": icmp.EchoResult("b.example", "192.0.2.1"),
+    })
+    targets = [ICMP("a.example"), ICMP("b.example")]
+    assert ICMP.ping_all(targets) == {
+        "a.example": (False, "a.example: failure in name resolution"),
+        "b.example": (False, "b.example: unreachable"),
+    }
+    ping_many.assert_called_once_with(["a.example", "b.example"])
+
+    # an IPv6 host without an ICMPv6 socket forks ping
+    fork = mocker.patch.object(ICMP, "fork", return_value=(True, "ping"))
+    v6 = icmp.EchoResult("b.example", "2001:db8::1", family=socket.AF_INET6)
+    v6.socket_error = "cannot open ICMPv6 socket"
+    ping_many.return_value["b.example"] = v6
+    assert ICMP.ping_all(targets) == {
+        "a.example": (False, "a.example: failure in name resolution"),
+        "b.example": (True, "ping"),
+    }
+    assert fork.call_count == 1
+
+    # without an ICMP socket every target forks ping
+    ping_many.side_effect = icmp.IcmpError("no socket")
+    assert ICMP.ping_all(targets) == {"a.example": (True, "ping"), "b.example": (True, "ping")}
+    assert fork.call_count == 3
+
+
+def test_engine_ipv6():
+    try:
+        sock, _raw = icmp.open_socket(socket.AF_INET6)
+    except icmp.IcmpError as e:
+        pytest.skip(str(e))
+    sock.close()
+
+    engine = icmp.EchoEngine()
+    results = engine.ping_many(["::1", "127.0.0.1"], count=3, interval=0.05)
+    assert results["::1"].family == socket.AF_INET6
+    for host in ["::1", "127.0.0.1"]:
+        assert results[host].received == 3
+    assert asyncio.run(engine.aping("::1", count=2, interval=0.05)).received == 2
+    assert engine.pending == {}
+
+
+def test_engine_without_ipv6(mocker):
+    try:
+        sock, _raw = icmp.open_socket()
+    except icmp.IcmpError as e:
+        pytest.skip(str(e))
+    sock.close()
+
+    open_socket = icmp.open_socket
+
+    def ipv4_only(family=socket.AF_INET):
+        if family == socket.AF_INET6:
+            raise icmp.IcmpError("cannot open ICMPv6 socket")
+        return open_socket(family)
+
+    mocker.patch("monibot.icmp.open_socket", ipv4_only)
+    engine = icmp.EchoEngine()
+    results = engine.ping_many(["::1", "127.0.0.1"], count=2, interval=0.05)
+    assert results["::1"].socket_error == "cannot open ICMPv6 socket"
+    assert results["::1"].sent == 0
+    assert results["127.0.0.1"].received == 2
+    with pytest.raises(icmp.IcmpError):
+        engine.ping("::1")
+
+
+def test_resolve_all(mocker):
+    def slow(host, *args, **kwargs):
+        time.sleep(0.3)
+        if host == "v6.example":
+            return [(socket.AF_INET6, socket.SOCK_DGRAM, 17, "", ("2001:db8::1", 0, 0, 0))]
+        if host == "both.example":
+            return [
+                (socket.AF_INET6, socket.SOCK_DGRAM, 17, "", ("2001:db8::2", 0, 0, 0)),
+                (socket.AF_INET, socket.SOCK_DGRAM, 17, "", ("192.0.2.2", 0)),
+            ]
+        raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+
+    mocker.patch("socket.getaddrinfo", slow)
+    started = time.monotonic()
+    v6, both, invalid = icmp.resolve_all(["v6.example", "both.example", "x.invalid"])
+    # in parallel, not one after another
+    assert time.monotonic() - started < 0.6
+    assert (v6.address, v6.family) == ("2001:db8::1", socket.AF_INET6)
+    assert (both.address, both.family) == ("192.0.2.2", socket.AF_INET)
+    assert invalid.address is None
+    assert invalid.error.startswith("failure in name resolution")
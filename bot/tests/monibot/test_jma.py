@@ -1,4 +1,5 @@
 # TEST JMA MODULE
+import json
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from unittest.mock import Mock
@@ -25,6 +26,24 @@ class MockResponse:
         raise requests.exceptions.HTTPError
 
 
+@pytest.fixture(autouse=True)
+def amedas_devices(monkeypatch: pytest.MonkeyPatch) -> None:
+    with Path(Path(__file__).parent, "jma/amedastable.json").open("r", encoding="utf-8") as f:
+        monkeypatch.setattr(monibot.jma, "_amedas_devices", json.load(f))
+
+
+def test_amedas_devices(mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(monibot.jma, "_amedas_devices", None)
+    get = mocker.patch("monibot.jma.requests.get", return_value=MockResponse(None, 404))
+    with pytest.raises(monibot.jma.WeatherError):
+        monibot.jma.amedas_devices()
+
+    get.return_value = MockResponse('{"14163": {"enName": "Sapporo"}}', HTTP_200_OK)
+    assert monibot.jma.amedas_devices()["14163"]["enName"] == "Sapporo"
+    monibot.jma.amedas_devices()
+    assert get.call_count == 2
+
+
 def test_nearest_temperature_point(mocker: MockerFixture) -> None:
     expected = ("260000", "61286")
 
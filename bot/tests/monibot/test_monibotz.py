@@ -26,3 +26,29 @@ def test_parse_command():
         (cmd, arg) = monibotz.parse_command(message)
         assert cmd == command
         assert arg == argument
+
+
+@pytest.mark.skipif("os.environ.get('ZULIP_EMAIL') is None",
+                    "os.environ.get('ZULIP_API_KEY') is None",
+                    "os.environ.get('ZULIP_SITE') is None",
+                    "os.environ.get('ZULIP_MONIBOT_STREAM') is None",
+                    reason="Need environment variables of Zulip")
+def test_respond_upload_cache(mocker, tmp_path):
+    import zulip
+    from monibot import monibotz
+    client = zulip.Client()
+    upload = mocker.patch.object(
+        client, "upload_file",
+        return_value={"result": "success", "uri": "/user_uploads/a.png"})
+    send = mocker.patch.object(
+        client, "send_message", return_value={"result": "success"})
+
+    figure = tmp_path / "a.png"
+    figure.write_bytes(b"same figure")
+    for _ in range(2):
+        param = monibotz.Parameter(tag={"type": "stream", "content": ""},
+                                   client=client)
+        param.respond(files=[str(figure)], filenames=["title"])
+        assert param.tag["content"] == "[title](/user_uploads/a.png)"
+    assert upload.call_count == 1
+    assert send.call_count == 2
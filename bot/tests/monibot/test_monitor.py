@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 
 import os
+import asyncio
 import datetime as dt
 from datetime import datetime, timezone
 import json
+import threading
+import time
 from tempfile import TemporaryDirectory
 from pathlib import Path
 import pytest
@@ -293,7 +296,9 @@ class TestServer:
             assert len(targets[t]["alive"]) == len(targets[t]["expected"])
 
         return_values_icmp = [[(False, "ICMP mocker"), (True, "ICMP mocker")][x] for x in targets["localhost_icmp"]["alive"]]
-        mocker.patch("monibot.ping.ICMP.is_alive", side_effect=return_values_icmp)
+        icmp_values = iter(return_values_icmp)
+        mocker.patch("monibot.ping.ICMP.ping_all",
+                     side_effect=lambda batch: {t.target: next(icmp_values) for t in batch})
         return_values_web = [[(False, "Web mocker"), (True, "Web mocker")][x] for x in targets["localhost_web"]["alive"]]
         mocker.patch("monibot.ping.Web.is_alive", side_effect=return_values_web)
         return_values_dns = [[(False, "DNS mocker"), (True, "DNS mocker")][x] for x in targets["localhost_dns"]["alive"]]
@@ -315,6 +320,252 @@ class TestServer:
                     state = changes.get(target)
                     assert state == exp, f"{i}: {target}\n{changes}"
 
+    @pytest.mark.parametrize("targets, classes, class10, config", list(delay_and_return.values()), ids=list(delay_and_return.keys()))
+    def test_ais_changed(self, mocker, targets, classes, class10, config):
+        for cls in ("ICMP", "Web", "DNS"):
+            alive = targets[f"localhost_{cls.lower()}"]["alive"]
+            mocker.patch(
+                f"monibot.ping.{cls}.ais_alive",
+                new_callable=mocker.AsyncMock,
+                side_effect=[(bool(x), f"{cls} mocker") for x in alive],
+            )
+
+        with TemporaryDirectory() as dname:
+            config_path = Path(dname) / "test_read_config.json"
+            os.environ["MONITOR_CONFIG"] = str(config_path)
+            config_path.write_text(config)
+            servers = moni.Server()
+            for i, _ in enumerate(targets["localhost_dns"]["alive"]):
+                if class10 is None:
+                    changes = asyncio.run(servers.ais_changed(None, classes=classes))
+                else:
+                    changes = asyncio.run(servers.ais_changed(
+                        None, classes=classes, class1=class10[1], class0=class10[0]))
+
+                for target in targets:
+                    exp = targets[target]["expected"][i]
+                    state = changes.get(target)
+                    assert state == exp, f"{i}: {target}\n{changes}"
+
+    def test_adopt(self, mocker):
+        mocker.patch("monibot.ping.ICMP.ping_all",
+                     side_effect=lambda batch: {t.target: (True, "ICMP mocker") for t in batch})
+        mocker.patch("monibot.ping.Web.is_alive", return_value=(False, "Web mocker"))
+        mocker.patch("monibot.ping.DNS.is_alive", return_value=(True, "DNS mocker"))
+
+        def config(points, servers):
+            return json.dumps({"monitor": {"servers": {
+                "ping_interval_sec": 60,
+                "previous_data_points": points,
+                "ping_servers": servers,
+            }}})
+
+        with TemporaryDirectory() as dname:
+            config_path = Path(dname) / "test_adopt.json"
+            os.environ["MONITOR_CONFIG"] = str(config_path)
+            config_path.write_text(config(3, {
+                "localhost": {"type": "ICMP"},
+                "http://localhost/": {"type": "Web"},
+            }))
+            old = moni.Server()
+            assert old.is_changed() == {"localhost": True}
+            assert old.is_changed() == {}
+
+            config_path.write_text(config(4, {
+                "localhost": {"type": "ICMP"},
+                "http://localhost/": {"type": "DNS"},
+            }))
+            new = moni.Server()
+            new.adopt(old)
+            icmp, dns = new.servers
+            assert icmp.monitor_latest == [1, 1, 1, 1]
+            assert icmp.monitor_previous_state is True
+            assert dns.monitor_latest == [1, 1, 1, 1]
+            assert dns.monitor_previous_state is None
+            # the ICMP target keeps its state, the DNS target is new
+            assert new.is_changed() == {"http://localhost/": True}
+            # the old monitor is stopped with its threads
+            with pytest.raises(moni.MonitorError):
+                old.probe()
+            new.stop()
+
+    def test_concurrent_probes(self, mocker):
+        release = threading.Event()
+
+        def slow(self):
+            time.sleep(0.3)
+            return (True, "slow mocker")
+
+        def hung(self):
+            release.wait(5)
+            return (True, "hung mocker")
+
+        def slow_batch(batch):
+            time.sleep(0.3)
+            return {t.target: (True, "slow mocker") for t in batch}
+
+        ping_all = mocker.patch("monibot.ping.ICMP.ping_all", side_effect=slow_batch)
+        mocker.patch("monibot.ping.Web.is_alive", slow)
+        mocker.patch("monibot.ping.DNS.is_alive", hung)
+
+        with TemporaryDirectory() as dname:
+            config_path = Path(dname) / "test_probe.json"
+            os.environ["MONITOR_CONFIG"] = str(config_path)
+            config_path.write_text(json.dumps({"monitor": {"servers": {
+                "ping_interval_sec": 60,
+                "previous_data_points": 1,
+                "probe_deadline_sec": 0.6,
+                "ping_servers": {
+                    "a.example": {"type": "ICMP"},
+                    "b.example": {"type": "ICMP"},
+                    "http://c.example/": {"type": "Web"},
+                    "d.example": {"type": "DNS"},
+                },
+            }}}))
+            servers = moni.Server()
+
+        started = time.time()
+        status = servers.get_status()
+        assert time.time() - started < 0.9
+        assert status == {
+            "a.example": True,
+            "b.example": True,
+            "http://c.example/": True,
+            "d.example": False,
+        }
+        # both ICMP targets in one round of echo requests
+        batch, = ping_all.call_args.args
+        assert [t.target for t in batch] == ["a.example", "b.example"]
+        assert ping_all.call_count == 1
+        # the hung probe is not started again while it runs
+        hung_probe = servers.inflight["d.example"]
+        servers.get_status()
+        assert servers.inflight["d.example"] is hung_probe
+        release.set()
+        hung_probe.result(timeout=5)
+        assert servers.get_status()["d.example"] is True
+        # the rounds share the threads of one executor
+        assert len(servers.executor._threads) <= 3
+        servers.stop()
+
+    def test_invalid_probe_config(self):
+        with TemporaryDirectory() as dname:
+            config_path = Path(dname) / "test_probe.json"
+            os.environ["MONITOR_CONFIG"] = str(config_path)
+            config_path.write_text(json.dumps({"monitor": {"servers": {
+                "ping_interval_sec": 60,
+                "previous_data_points": 1,
+                "max_probes": 0,
+                "ping_servers": {"a.example": {"type": "ICMP"}},
+            }}}))
+            with pytest.raises(moni.MonitorError):
+                moni.Server()
+
+            config_path.write_text(json.dumps({"monitor": {"servers": {
+                "ping_interval_sec": 60,
+                "previous_data_points": 1,
+                "ping_servers": {
+                    "http://a.example/": {"type": "Web", "method": "HEAD"},
+                    "b.example": {"type": "ICMP", "method": "HEAD"},
+                },
+            }}}))
+            with pytest.raises(moni.MonitorError):
+                moni.Server()
+            config_path.write_text(json.dumps({"monitor": {"servers": {
+                "ping_interval_sec": 60,
+                "previous_data_points": 1,
+                "ping_servers": {
+                    "http://a.example/": {"type": "Web", "method": "HEAD"},
+                },
+            }}}))
+            assert moni.Server().servers[0].method == "HEAD"
+
+
+    def test_inventory(self):
+        with TemporaryDirectory() as dname:
+            inventory = Path(dname) / "hosts.txt"
+            inventory.write_text("# web servers\nhttp://a.example/\n\n  http://b.example/  \n")
+            config_path = Path(dname) / "test_inventory.json"
+            os.environ["MONITOR_CONFIG"] = str(config_path)
+            config_path.write_text(json.dumps({"monitor": {"servers": {
+                "ping_interval_sec": 60,
+                "previous_data_points": 1,
+                "ping_servers": {
+                    "lan": {"type": "ICMP", "cidr": "192.0.2.8/30"},
+                    "web": {"type": "Web", "file": str(inventory), "method": "HEAD"},
+                    "example.com": {"type": "DNS"},
+                },
+            }}}))
+            servers = moni.Server().servers
+            assert [s.target for s in servers] == [
+                "192.0.2.9", "192.0.2.10",
+                "http://a.example/", "http://b.example/",
+                "example.com",
+            ]
+            assert servers[2].method == servers[3].method == "HEAD"
+
+            for entry in (
+                {"type": "ICMP", "cidr": "192.0.2.0/33"},
+                {"type": "ICMP", "cidr": "10.0.0.0/8"},
+                {"type": "Web", "file": str(Path(dname) / "missing.txt")},
+            ):
+                config_path.write_text(json.dumps({"monitor": {"servers": {
+                    "ping_interval_sec": 60,
+                    "previous_data_points": 1,
+                    "ping_servers": {"bad": entry},
+                }}}))
+                with pytest.raises(moni.MonitorError):
+                    moni.Server()
+
+    def test_async_engine(self, mocker):
+        async def alive(self, session):
+            await asyncio.sleep(0.05)
+            return (True, "mocker")
+
+        async def hung(self, session):
+            await asyncio.sleep(5)
+            return (True, "hung mocker")
+
+        mocker.patch("monibot.ping.ICMP.ais_alive", alive)
+        mocker.patch("monibot.ping.DNS.ais_alive", hung)
+
+        with TemporaryDirectory() as dname:
+            config_path = Path(dname) / "test_engine.json"
+            os.environ["MONITOR_CONFIG"] = str(config_path)
+            config_path.write_text(json.dumps({"monitor": {"servers": {
+                "ping_interval_sec": 60,
+                "previous_data_points": 1,
+                "probe_deadline_sec": 0.5,
+                "engine": "async",
+                "max_concurrency": 64,
+                "ping_servers": {
+                    "lan": {"type": "ICMP", "cidr": "192.0.2.0/24"},
+                    "example.com": {"type": "DNS"},
+                },
+            }}}))
+            servers = moni.Server()
+
+            started = time.time()
+            status = servers.get_status()
+            assert time.time() - started < 1
+            assert len(status) == 255
+            assert all(status[f"192.0.2.{i}"] for i in range(1, 255))
+            assert status["example.com"] is False
+
+            config_path.write_text(config_path.read_text().replace('"async"', '"fork"'))
+            with pytest.raises(moni.MonitorError):
+                moni.Server()
+
+
+def test_outsidetemperature_reload(mocker):
+    os.environ["MONITOR_CONFIG"] = f"{testdir}/monitor-test.conf"
+    weather = mocker.patch("monibot.monitor.Weather")
+    outside = moni.OutsideTemperature()
+    reloaded = moni.OutsideTemperature(weather=outside.wt)
+    assert weather.call_count == 1
+    assert reloaded.wt is outside.wt
+    assert reloaded.pipe_alert_threshold == -5.0
+
 
 if __name__ == "__main__":
     pytest.main(["-v", __file__])
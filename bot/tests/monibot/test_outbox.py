@@ -0,0 +1,102 @@
+import pytest
+from monibot.dispatcher import Batcher
+from monibot.outbox import Outbox, OutboxError
+
+
+def test_outbox(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    outbox = Outbox(path, channel="slack", commit_rows=2)
+    first = outbox.append("k1", "first", False)
+    second = outbox.append("k2", ":red_circle: a", True)
+    assert outbox.append("k1", "first again", False) is None
+    assert outbox.sync() is None
+    outbox.append("k3", "third", False)
+    assert 0 < outbox.sync() <= 1.0
+    outbox.flush()
+    zulip = Outbox(path, channel="zulip")
+    assert zulip.pending(10) == []
+    zulip.close()
+
+    assert outbox.pending(10) == [
+        (first, "k1", "first", False),
+        (second, "k2", ":red_circle: a", True),
+        (second + 1, "k3", "third", False),
+    ]
+    outbox.delivered([first, second + 1])
+    assert outbox.pending(10) == [(second, "k2", ":red_circle: a", True)]
+    assert outbox.pending(10, after=second) == []
+    outbox.close()
+
+    outbox = Outbox(path, channel="slack")
+    assert outbox.pending(10) == [(second, "k2", ":red_circle: a", True)]
+    assert outbox.db.execute("SELECT count(*) FROM delivered").fetchone() == (0,)
+    outbox.close()
+
+    # a missing directory is created
+    Outbox(str(tmp_path / "var" / "lib" / "outbox.db")).close()
+    assert (tmp_path / "var" / "lib" / "outbox.db").exists()
+    (tmp_path / "file").write_text("")
+    with pytest.raises(OutboxError):
+        Outbox(str(tmp_path / "file" / "outbox.db"))
+
+
+def test_batcher_without_outbox(tmp_path):
+    (tmp_path / "file").write_text("")
+    batcher = Batcher({
+        "outbox": str(tmp_path / "file" / "outbox.db"),
+        "window_sec": 5,
+        "urgent": ["!!"],
+    })
+    assert batcher.outbox is None
+    assert batcher.window == 5
+    assert batcher.is_urgent("hot!!")
+    assert batcher.put("hot!!").urgent
+
+
+def test_batcher_replay(tmp_path):
+    config = {"outbox": str(tmp_path / "outbox.db"), "window_sec": 0}
+    batcher = Batcher(config, channel="slack")
+    batcher.put("first", key="k1")
+    batcher.put("second")
+    assert batcher.put("first", key="k1") is None
+    batch = batcher.take()
+    batcher.done(batch, RuntimeError("network"))
+    batcher.close()
+
+    batcher = Batcher(config, channel="slack")
+    batcher.put("third")
+    batch = batcher.take()
+    assert batcher.text(batch) == "first\nsecond\nthird"
+    batcher.done(batch)
+    batcher.close()
+
+    batcher = Batcher(config, channel="slack")
+    assert batcher.next_wait() is None
+    batcher.close()
+
+
+def test_batcher_spill(tmp_path):
+    config = {
+        "outbox": str(tmp_path / "outbox.db"),
+        "window_sec": 0,
+        "min_interval_sec": 0,
+        "max_memory": 2,
+        "max_length": 1,
+    }
+    batcher = Batcher(config)
+    for message in "abcde":
+        batcher.put(message)
+    batcher.put(":red_circle: x")
+    assert len(batcher.pending) == 3
+
+    sent = []
+    while batcher.next_wait() is not None:
+        batch = batcher.take()
+        sent.append(batcher.text(batch))
+        batcher.done(batch)
+    assert sent == [":red_circle: x", "a", "b", "c", "d", "e"]
+    batcher.close()
+
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
@@ -0,0 +1,72 @@
+import json
+import pytest
+from monibot.ratelimit import RateLimiter, RateLimitError, read_config
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_read_config(tmp_path, monkeypatch):
+    monkeypatch.delenv("RATELIMIT_CONFIG", raising=False)
+    assert read_config() == {}
+
+    conf = tmp_path / "monibot.conf"
+    conf.write_text(json.dumps({"ratelimit": {"default_cost": 2}}))
+    monkeypatch.setenv("RATELIMIT_CONFIG", str(conf))
+    assert read_config() == {"default_cost": 2}
+
+    conf.write_text("{")
+    with pytest.raises(RateLimitError):
+        read_config()
+
+
+def test_invalid_config():
+    with pytest.raises(RateLimitError):
+        RateLimiter({"user": {"capacity": 0}})
+    with pytest.raises(RateLimitError):
+        RateLimiter({"costs": {"air": "a lot"}})
+    with pytest.raises(RateLimitError):
+        RateLimiter({"user": {"capacity": 2}, "costs": {"air": 3}})
+
+
+def test_user_bucket():
+    clock = Clock()
+    limiter = RateLimiter({
+        "user": {"capacity": 6, "refill_per_min": 6},
+        "channel": {"capacity": 100, "refill_per_min": 100},
+        "costs": {"air": 3},
+    }, clock=clock)
+    assert limiter.acquire("air", "alice", "C1") is None
+    assert limiter.acquire("air", "alice", "C1") is None
+    reply = limiter.acquire("air", "alice", "C1")
+    assert reply == "Sorry, you are sending too many commands. Try air again in 30 seconds."
+    # other users and free commands are not limited
+    assert limiter.acquire("air", "bob", "C1") is None
+    assert limiter.acquire("help", "alice", "C1") is None
+
+    clock.now += 10
+    assert limiter.acquire("ip", "alice", "C1") is None
+    assert limiter.acquire("air", "alice", "C1") is not None
+    clock.now += 30
+    assert limiter.acquire("air", "alice", "C1") is None
+
+
+def test_channel_bucket():
+    clock = Clock()
+    limiter = RateLimiter({
+        "user": {"capacity": 10, "refill_per_min": 10},
+        "channel": {"capacity": 4, "refill_per_min": 2},
+        "default_cost": 2,
+    }, clock=clock)
+    assert limiter.acquire("ping", "alice", "C1") is None
+    assert limiter.acquire("ping", "bob", "C1") is None
+    reply = limiter.acquire("ping", "carol", "C1")
+    assert reply.startswith("Sorry, this channel is sending too many commands.")
+    # a refused command takes nothing from the user bucket
+    assert limiter.buckets["user"]["carol"].tokens == 10
+    assert limiter.acquire("ping", "carol", "C2") is None
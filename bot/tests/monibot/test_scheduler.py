@@ -0,0 +1,216 @@
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+import pytest
+from monibot.scheduler import CronSchedule, Every, Histogram, Scheduler, SchedulerError
+from monibot.scheduler import current_run, read_config
+
+
+def test_read_config(tmp_path, monkeypatch):
+    monkeypatch.delenv("SCHEDULER_CONFIG", raising=False)
+    assert read_config() == {}
+
+    conf = tmp_path / "monibot.conf"
+    conf.write_text(json.dumps({"scheduler": {"max_workers": 1}}))
+    monkeypatch.setenv("SCHEDULER_CONFIG", str(conf))
+    assert read_config() == {"max_workers": 1}
+
+    conf.write_text("{")
+    with pytest.raises(SchedulerError):
+        read_config()
+
+
+def test_invalid_config():
+    with pytest.raises(SchedulerError):
+        Scheduler({"max_workers": 0})
+    with pytest.raises(SchedulerError):
+        Scheduler({"misfire": "later"})
+    with pytest.raises(SchedulerError):
+        Scheduler({"jobs": {"check_servers": {"cron": "every minute"}}})
+    with pytest.raises(SchedulerError):
+        Every(0)
+
+
+def test_every():
+    every = Every(10)
+    assert every.first(100) == 100
+    assert every.next(100, 100) == 110
+    # a slow run does not shift the grid
+    assert every.next(100, 107.5) == 110
+    # missed runs are skipped
+    assert every.next(100, 135) == 140
+    assert every.next(150, 135) == 150
+
+
+@pytest.mark.parametrize("expression, after, expected", [
+    ("*/15 * * * *", "2024-01-01 10:07", "2024-01-01 10:15"),
+    ("0 6 * * *", "2024-01-01 10:07", "2024-01-02 06:00"),
+    ("30 9 * * 1-5", "2024-01-05 10:00", "2024-01-08 09:30"),
+    ("0 0 1 * *", "2024-01-31 23:59", "2024-02-01 00:00"),
+    ("0 12 29 2 *", "2024-03-01 00:00", "2028-02-29 12:00"),
+    ("0 0 13 * 5", "2024-01-01 00:00", "2024-01-05 00:00"),
+    ("0 0 * * 7", "2024-01-01 00:00", "2024-01-07 00:00"),
+    ("5,10 1 * * *", "2024-01-01 01:05", "2024-01-01 01:10"),
+])
+def test_cron_schedule(expression, after, expected):
+    schedule = CronSchedule(expression)
+    start = datetime.strptime(after, "%Y-%m-%d %H:%M")
+    assert schedule.next_after(start) == datetime.strptime(expected, "%Y-%m-%d %H:%M")
+
+
+def test_invalid_cron_schedule():
+    for expression in ["* * * *", "60 * * * *", "* * 0 * *", "*/0 * * * *", "a * * * *"]:
+        with pytest.raises(SchedulerError):
+            CronSchedule(expression)
+
+
+def test_fixed_rate():
+    q = queue.Queue()
+    times = []
+
+    def tick():
+        times.append(time.time())
+        time.sleep(0.05)
+        return f"tick {len(times)}"
+
+    s = Scheduler({})
+    s.add("tick", tick, Every(0.2), queue=q)
+    s.start()
+    assert [q.get(timeout=5) for _ in range(3)] == ["tick 1", "tick 2", "tick 3"]
+    s.shutdown(wait=True)
+    # runs are 0.2 seconds apart although each takes 0.05 seconds
+    assert times[2] - times[0] == pytest.approx(0.4, abs=0.05)
+    assert s.add("late", tick, Every(1)) is None
+    assert not s.is_alive()
+
+
+def test_current_run():
+    q = queue.Queue()
+    s = Scheduler({})
+    s.add("who", lambda: current_run(), Every(0.1), queue=q)
+    s.start()
+    name, due = q.get(timeout=5)
+    s.shutdown(wait=True)
+    assert name == "who"
+    assert due == pytest.approx(time.time(), abs=1)
+    assert current_run() is None
+
+
+def test_overlap():
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(None)
+        release.wait(5)
+        return ""
+
+    s = Scheduler({"max_workers": 2})
+    s.add("slow", slow, Every(0.05))
+    s.start()
+    time.sleep(0.3)
+    assert len(calls) == 1
+    release.set()
+    s.shutdown(wait=True)
+
+
+def test_backoff():
+    calls = []
+    done = threading.Event()
+
+    def flaky():
+        calls.append(time.time())
+        if len(calls) < 3:
+            raise ValueError("not yet")
+        done.set()
+        return ""
+
+    s = Scheduler({"retry_sec": 0.1, "max_retry_sec": 0.15})
+    s.add("flaky", flaky, Every(60))
+    s.start()
+    assert done.wait(5)
+    assert s.jobs["flaky"].failures == 0
+    assert calls[1] - calls[0] == pytest.approx(0.1, abs=0.05)
+    assert calls[2] - calls[1] == pytest.approx(0.15, abs=0.05)
+    # back on the grid of the first run
+    assert s.jobs["flaky"].planned == pytest.approx(calls[0] + 60, abs=0.01)
+
+    # shutdown does not wait for the backoff
+    s.add("broken", lambda: 1/0, Every(60))
+    started = time.time()
+    s.shutdown(wait=True)
+    assert time.time() - started < 1
+
+
+def test_misfire_skip():
+    calls = []
+    s = Scheduler({"misfire_grace_sec": 1, "jobs": {"late": {"misfire": "skip"}}})
+    s.add("late", lambda: calls.append("late"), Every(60))
+    s.add("once", lambda: calls.append("once"), Every(60))
+    # both were due two minutes ago, as after a suspend
+    with s.condition:
+        for job in s.jobs.values():
+            job.planned -= 120
+            s._push(job, job.planned)
+    s.start()
+    time.sleep(0.2)
+    s.shutdown(wait=True)
+    assert calls == ["once"]
+    assert s.jobs["late"].planned > time.time()
+
+
+def test_reschedule_and_override():
+    s = Scheduler({"jitter_sec": 0.5, "jobs": {"forecast": {"cron": "0 6 * * *"}}})
+    job = s.add("refresh", lambda: "", Every(60))
+    assert s.add("refresh", lambda: "", Every(30)) is job
+    assert job.schedule.interval == 30
+    assert job.planned <= job.due <= job.planned + 0.5
+    assert isinstance(s.add("forecast", lambda: "", Every(60)).schedule, CronSchedule)
+    s.remove("refresh")
+    assert "refresh" not in s.jobs
+    s.shutdown()
+
+
+def test_histogram():
+    h = Histogram([1, 2, 5])
+    for value in [0.5, 0.5, 1.5, 4, 8]:
+        h.observe(value)
+    assert h.counts == [2, 1, 1, 1]
+    assert h.mean() == pytest.approx(2.9)
+    assert h.percentile(0.5) == 2
+    assert h.percentile(1.0) == 8
+    assert Histogram([1]).percentile(0.9) == 0
+
+
+def test_stats():
+    done = threading.Event()
+    calls = []
+
+    def probe():
+        calls.append(None)
+        if len(calls) == 1:
+            raise ValueError("no route to host")
+        time.sleep(0.15)
+        done.set()
+        return "x.example is DOWN\n"
+
+    s = Scheduler({"retry_sec": 0.05})
+    s.add("probe", probe, Every(0.1))
+    s.start()
+    assert done.wait(5)
+    s.shutdown(wait=True)
+    stats = s.jobs["probe"].stats
+    # a third run may have started before shutdown()
+    assert stats.runs >= 2
+    assert stats.failures == 1
+    assert stats.overruns >= 1
+    assert stats.duration.max >= 0.15
+    assert stats.output.max == len("x.example is DOWN\n")
+    assert stats.last_error == "no route to host"
+
+    report = s.report("pr")
+    assert report.startswith(f"probe (every 0.1 seconds): {stats.runs} runs, 1 failed")
+    assert "last error: no route to host" in report
+    assert s.report("unknown") == "no jobs 'unknown'"
@@ -0,0 +1,173 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from monibot.startup import Subsystems, StartupError, read_config
+from monibot.startup import STARTING, READY, FAILED
+
+
+def test_read_config(tmp_path, monkeypatch):
+    monkeypatch.delenv("STARTUP_CONFIG", raising=False)
+    assert read_config() == {}
+
+    conf = tmp_path / "monibot.conf"
+    conf.write_text(json.dumps({"startup": {"timeout_sec": 5}}))
+    monkeypatch.setenv("STARTUP_CONFIG", str(conf))
+    assert read_config() == {"timeout_sec": 5}
+
+    conf.write_text("{")
+    with pytest.raises(StartupError):
+        read_config()
+
+    monkeypatch.setenv("STARTUP_CONFIG", str(tmp_path / "none.conf"))
+    with pytest.raises(StartupError):
+        read_config()
+
+
+def test_invalid_config():
+    with pytest.raises(StartupError):
+        Subsystems({"timeout_sec": "soon"})
+    with pytest.raises(StartupError):
+        Subsystems({"timeouts": {"forecast": None}})
+
+
+def test_concurrent_start():
+    release = threading.Event()
+    started = []
+
+    def slow():
+        started.append("slow")
+        release.wait(5)
+        return "slow object"
+
+    def fast():
+        started.append("fast")
+        return "fast object"
+
+    s = Subsystems({})
+    s.add("slow", slow)
+    s.add("fast", fast)
+    ready = []
+    s.on_ready("slow", ready.append)
+    s.start()
+
+    assert s.wait("fast", 5) == "fast object"
+    assert s.state("fast") == READY
+    assert s.state("slow") == STARTING
+    assert s.get("slow") is None
+    assert "starting" in s.unavailable("slow", "weather")
+    assert s.unavailable("fast", "ip") is None
+
+    release.set()
+    assert s.wait("slow", 5) == "slow object"
+    assert ready == ["slow object"]
+    late = []
+    s.on_ready("slow", late.append)
+    assert late == ["slow object"]
+    s.shutdown()
+
+
+def test_failure():
+    class BrokenError(Exception):
+        pass
+
+    def broken():
+        raise BrokenError("no configuration")
+
+    def crashed():
+        raise KeyError("oops")
+
+    s = Subsystems({})
+    s.add("broken", broken, (BrokenError,))
+    s.add("crashed", crashed, (BrokenError,))
+    s.start()
+    assert s.wait("broken", 5) is None
+    assert s.wait("crashed", 5) is None
+    assert s.state("broken") == FAILED
+    assert s.state("crashed") == FAILED
+    assert "out of service" in s.unavailable("broken", "book")
+    assert s.state("unknown") == FAILED
+    s.shutdown()
+
+
+def test_timeout():
+    release = threading.Event()
+
+    def hung():
+        release.wait(5)
+        return "too late"
+
+    s = Subsystems({"timeout_sec": 30, "timeouts": {"hung": 0.05}})
+    s.add("hung", hung)
+    ready = []
+    s.on_ready("hung", ready.append)
+    s.start()
+    assert s.wait("hung", 5) is None
+    assert s.state("hung") == FAILED
+
+    release.set()
+    s.executor.shutdown(wait=True)
+    assert s.state("hung") == FAILED
+    assert s.get("hung") is None
+    assert ready == []
+    s.shutdown()
+
+
+def test_reload():
+    generation = iter(range(1, 10))
+
+    def factory():
+        n = next(generation)
+        if n == 3:
+            raise ValueError("broken configuration")
+        return {"generation": n}
+
+    def reloader(old):
+        new = factory()
+        new["previous"] = old["generation"]
+        return new
+
+    s = Subsystems({})
+    s.add("monitor", factory, (ValueError,), reload=reloader)
+    s.add("plain", lambda: object())
+    ready = []
+    s.on_ready("monitor", ready.append)
+    s.start()
+    assert s.wait("monitor", 5) == {"generation": 1}
+    plain = s.wait("plain", 5)
+
+    s.reload(["monitor"])
+    s.executor.shutdown(wait=True)
+    assert s.get("monitor") == {"generation": 2, "previous": 1}
+    assert ready[-1] is s.get("monitor")
+
+    s.executor = ThreadPoolExecutor()
+    s.reload()
+    s.executor.shutdown(wait=True)
+    # a broken reload keeps the running object
+    assert s.state("monitor") == READY
+    assert s.get("monitor") == {"generation": 2, "previous": 1}
+    assert s.get("plain") is not plain
+    assert len(ready) == 2
+    s.shutdown()
+
+
+def test_reload_failed():
+    calls = []
+
+    def factory():
+        calls.append(None)
+        if len(calls) == 1:
+            raise ValueError("not yet")
+        return "ready"
+
+    s = Subsystems({})
+    s.add("late", factory, (ValueError,))
+    s.start()
+    assert s.wait("late", 5) is None
+    assert s.state("late") == FAILED
+
+    s.reload()
+    assert s.wait("late", 5) == "ready"
+    assert s.state("late") == READY
+    s.shutdown()
@@ -0,0 +1,67 @@
+import json
+import pytest
+from monibot.tenant import Tenant, TenantError, load_tenants, read_config
+
+
+def test_read_config(tmp_path, monkeypatch):
+    monkeypatch.delenv("TENANT_CONFIG", raising=False)
+    assert read_config() == {}
+
+    conf = tmp_path / "monibot.conf"
+    conf.write_text(json.dumps({"tenants": {"lab": {"frontend": "zulip"}}}))
+    monkeypatch.setenv("TENANT_CONFIG", str(conf))
+    assert read_config() == {"lab": {"frontend": "zulip"}}
+
+    conf.write_text("{")
+    with pytest.raises(TenantError):
+        read_config()
+
+    monkeypatch.setenv("TENANT_CONFIG", str(tmp_path / "none.conf"))
+    with pytest.raises(TenantError):
+        read_config()
+
+
+def test_default_tenants():
+    tenants = load_tenants(["slack", "zulip"], {})
+    assert [(t.name, t.frontend) for t in tenants] == [
+        ("default", "slack"), ("default", "zulip")]
+    assert tenants[0].allows("book")
+    assert tenants[0].alerts == {"temperature", "servers"}
+
+
+def test_load_tenants(monkeypatch):
+    monkeypatch.setenv("SLACK_APP_TOKEN", "xapp-env")
+    tenants = load_tenants(["slack"], {
+        "office": {
+            "frontend": "slack",
+            "slack_bot_token": "xoxb-office",
+            "commands": ["air", "weather"],
+            "alerts": ["temperature"],
+        },
+        "lab": {
+            "frontend": "zulip",
+            "stream": "lab:monibot",
+        },
+    })
+    office, lab = tenants
+    assert office.get("slack_bot_token", "SLACK_BOT_TOKEN") == "xoxb-office"
+    assert office.get("slack_app_token", "SLACK_APP_TOKEN") == "xapp-env"
+    assert office.get("commands") is None
+    assert office.allows("air")
+    assert office.allows("help")
+    assert not office.allows("ping")
+    assert office.alerts == {"temperature"}
+    assert lab.frontend == "zulip"
+    assert lab.get("stream") == "lab:monibot"
+    assert lab.allows("ping")
+
+
+def test_invalid_tenants():
+    with pytest.raises(TenantError):
+        load_tenants([], {"irc": {"frontend": "irc"}})
+    with pytest.raises(TenantError):
+        load_tenants([], {"office": {"frontend": "slack", "alerts": ["air"]}})
+    with pytest.raises(TenantError):
+        load_tenants([], {"office": "slack"})
+    with pytest.raises(TenantError):
+        Tenant("office", "slack", alerts=["book"])
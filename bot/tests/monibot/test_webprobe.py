@@ -0,0 +1,196 @@
+import asyncio
+import http.server
+import json
+import socket
+import ssl
+import threading
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import pytest
+from monibot import webprobe
+from monibot.monitor import Server
+from monibot.ping import Web
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    body = b"x"*200000
+
+    def do_GET(self):
+        if self.path == "/loop":
+            self.send_response(302)
+            self.send_header("Location", "/loop")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def do_HEAD(self):
+        self.send_response(204 if self.path == "/empty" else 200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    # clients that stop reading after 'max_bytes' reset the connection
+    httpd.handle_error = lambda request, client_address: None
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://localhost:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_keep_alive(server):
+    first = webprobe.probe(f"{server}/", method="HEAD")
+    assert first.status == 200
+    assert not first.reused
+    assert first.connect_ms > 0
+    assert first.tls_ms == 0
+    second = webprobe.probe(f"{server}/", method="HEAD")
+    assert second.reused
+    assert second.dns_ms == second.connect_ms == 0
+    assert second.ttfb_ms > 0
+    assert "reused" in second.summary()
+
+
+def test_next_address(server, mocker):
+    port = int(server.rsplit(":", 1)[1])
+    addresses = [
+        (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.9", port)),
+        (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", port)),
+    ]
+    getaddrinfo = socket.getaddrinfo
+
+    def resolve(host, *args, **kwargs):
+        # 'localhost' has a dead address first, the addresses themselves resolve as usual
+        if host == "localhost":
+            return list(resolve.addresses)
+        return getaddrinfo(host, *args, **kwargs)
+
+    resolve.addresses = addresses
+    mocker.patch("socket.getaddrinfo", resolve)
+    # a new session, so that the connection is not reused
+    mocker.patch.object(webprobe, "_session", None)
+    result = webprobe.probe(f"{server}/", method="HEAD")
+    assert result.status == 200
+    assert not result.reused
+
+    mocker.patch.object(webprobe, "_session", None)
+    resolve.addresses = addresses[:1]
+    assert webprobe.probe(f"{server}/", method="HEAD").status == (
+        "Failed to establish a new connection")
+
+
+def test_max_bytes(server):
+    result = webprobe.probe(f"{server}/", max_bytes=10000)
+    assert result.status == 200
+    assert 10000 <= result.bytes < len(Handler.body)
+
+
+def test_max_bytes_reuse(server, mocker):
+    mocker.patch.object(webprobe, "_session", None)
+    # a short rest of the body is drained, the connection is kept
+    webprobe.probe(f"{server}/", max_bytes=len(Handler.body) - webprobe.DRAIN_BYTES//2)
+    assert webprobe.probe(f"{server}/", method="HEAD").reused
+    # a long one is not read, the next probe connects again
+    webprobe.probe(f"{server}/", max_bytes=10000)
+    assert not webprobe.probe(f"{server}/", method="HEAD").reused
+    # GET without a body is sent as HEAD
+    result = webprobe.probe(f"{server}/empty", max_bytes=0)
+    assert (result.status, result.bytes) == (204, 0)
+
+
+def test_without_dns_host(mocker):
+    # an urllib3 that connects without '_dns_host'
+    new_conn = mocker.patch.object(webprobe.HTTPConnection, "_new_conn")
+    conn = webprobe.TimedHTTPConnection("localhost", 80)
+    del conn._dns_host
+    assert conn._new_conn() is new_conn.return_value
+    assert set(conn.timings) == {"started"}
+
+
+def test_failure():
+    result = webprobe.probe("http://example.invalid/")
+    assert result.status == "Failed to establish a new connection"
+    assert result.summary() == "Failed to establish a new connection"
+
+
+def test_cert_expires(mocker):
+    sock = mocker.Mock(spec=ssl.SSLSocket)
+    sock.getpeercert.return_value = {"notAfter": "Jun  1 12:00:00 2030 GMT"}
+    expires = webprobe.cert_expires(SimpleNamespace(sock=sock))
+    assert expires == datetime(2030, 6, 1, 12, tzinfo=timezone.utc)
+    assert webprobe.cert_expires(SimpleNamespace(sock=None)) is None
+    sock.getpeercert.return_value = {}
+    assert webprobe.cert_expires(SimpleNamespace(sock=sock)) is None
+
+
+def test_web_alerts(server, mocker):
+    assert Web(f"{server}/", method="head").is_alive() == (True, "200")
+    assert Web(f"{server}/empty", method="HEAD").is_alive() == (False, "204")
+    assert Web(f"{server}/", max_latency_ms=0).is_alive()[1].startswith("slow: ")
+
+    result = webprobe.WebResult("https://example.com/")
+    result.status = 200
+    result.cert_expires = datetime.now(timezone.utc) + timedelta(days=3, hours=1)
+    mocker.patch("monibot.webprobe.probe", return_value=result)
+    web = Web("https://example.com/", min_cert_days=14)
+    assert web.is_alive() == (False, "certificate expires in 3 days")
+    assert web.last is result
+
+
+def test_aget_status_errors(server):
+    aiohttp = pytest.importorskip("aiohttp")
+
+    async def statuses():
+        async with aiohttp.ClientSession() as session:
+            return [
+                await Web(url).aget_status(session)
+                for url in (f"{server}/", f"{server}/loop", "http:///index.html")
+            ]
+
+    ok, loop, invalid = asyncio.run(statuses())
+    assert (ok, loop) == (200, "TooManyRedirects")
+    # InvalidURL, or its subclass InvalidUrlClientError
+    assert invalid.startswith("InvalidU")
+
+
+@pytest.mark.parametrize("engine", ["thread", "async"])
+def test_engines_agree(server, engine, tmp_path, monkeypatch, mocker):
+    pytest.importorskip("aiohttp")
+    config = tmp_path / "monibot.conf"
+    config.write_text(json.dumps({"monitor": {"servers": {
+        "ping_interval_sec": 60,
+        "previous_data_points": 1,
+        "engine": engine,
+        "ping_servers": {
+            f"{server}/": {"type": "Web", "max_bytes": 1000, "min_cert_days": 1},
+            f"{server}/empty": {"type": "Web", "method": "HEAD"},
+            f"{server}/loop": {"type": "Web"},
+            f"{server}/?slow": {"type": "Web", "max_latency_ms": 0},
+            f"{server}/?cert": {"type": "Web", "min_cert_days": 14},
+        },
+    }}}))
+    monkeypatch.setenv("MONITOR_CONFIG", str(config))
+    soon = datetime.now(timezone.utc) + timedelta(days=3, hours=1)
+    # the server is plain HTTP, pretend every connection has a certificate
+    mocker.patch("monibot.webprobe.peer_cert_expires", return_value=soon)
+    servers = Server()
+
+    results = dict(zip([s.target for s in servers.servers], servers.probe()))
+    assert results[f"{server}/empty"] == (False, "204")
+    assert results[f"{server}/loop"] == (False, "TooManyRedirects")
+    assert results[f"{server}/?slow"][1].startswith("slow: ")
+    assert results[f"{server}/?cert"] == (False, "certificate expires in 3 days")
+    assert results[f"{server}/"] == (True, "200")
+    first = servers.servers[0].last
+    assert 1000 <= first.bytes < len(Handler.body)
@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+import pytest
+import monibot.worker as worker
+
+
+def test_read_config(tmp_path):
+    os.environ.pop("WORKER_CONFIG", None)
+    assert worker.read_config() == {}
+
+    config_path = tmp_path / "monibot.conf"
+    config_path.write_text('{"worker": {"max_workers": 2, "limits": {"air": 1}}}')
+    os.environ["WORKER_CONFIG"] = str(config_path)
+    pool = worker.WorkerPool()
+    assert pool.max_workers == 2
+    assert pool.limits == {"air": 1}
+    pool.shutdown()
+
+    config_path.write_text('{"worker": {"max_workers": 0}}')
+    with pytest.raises(worker.WorkerError):
+        worker.WorkerPool()
+
+    os.environ["WORKER_CONFIG"] = str(tmp_path / "xxx.conf")
+    with pytest.raises(worker.WorkerError) as excinfo:
+        worker.WorkerPool()
+    assert "cannot open configuration file" in str(excinfo.value)
+    os.environ.pop("WORKER_CONFIG")
+
+
+def test_worker_pool_limits():
+    pool = worker.WorkerPool({"max_workers": 3, "max_queue": 2, "limits": {"air": 1}})
+    release = threading.Event()
+    started = []
+
+    def job(name):
+        started.append(name)
+        release.wait(5)
+
+    assert pool.submit("air", job, "air1") == 0
+    assert pool.submit("air", job, "air2") == 1
+    assert pool.submit("ping", job, "ping1") == 0
+    assert pool.submit("air", job, "air3") == 2
+    with pytest.raises(worker.WorkerBusyError):
+        pool.submit("ip", job, "ip1")
+    time.sleep(0.2)
+    assert sorted(started) == ["air1", "ping1"]
+
+    release.set()
+    for _ in range(50):
+        if len(started) == 4:
+            break
+        time.sleep(0.1)
+    pool.shutdown()
+    assert sorted(started) == ["air1", "air2", "air3", "ping1"]
+
+
+def test_worker_pool_exception():
+    pool = worker.WorkerPool({"max_workers": 1})
+    done = threading.Event()
+
+    def fail():
+        raise RuntimeError("oops")
+
+    pool.submit("air", fail)
+    pool.submit("air", done.set)
+    assert done.wait(5)
+    pool.shutdown()
+
+
+def test_single_flight():
+    flights = worker.SingleFlight()
+    leader = flights.join(("air", "1d"), "param1")
+    assert leader is not None
+    assert flights.join(("air", "1d"), "param2") is None
+    assert flights.join(("air", "1d"), "param3") is None
+    other = flights.join(("air", "2d"), "param4")
+    assert other is not None
+
+    assert flights.land(leader) == ["param1", "param2", "param3"]
+    assert flights.land(leader) == []
+    assert flights.land(other) == ["param4"]
+
+    again = flights.join(("air", "1d"), "param5")
+    assert again is not None
+    assert flights.land(leader) == []
+    assert flights.join(("air", "1d"), "param6") is None
+    assert flights.land(again) == ["param5", "param6"]
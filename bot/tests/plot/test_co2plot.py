@@ -7,6 +7,7 @@ import pytest
 from freezegun import freeze_time
 from co2.co2plot import guess_xsv, extract_plot_data
 from co2.co2plot import read_database, plot, get_latest, figure
+from co2.co2plot import OutputError
 
 
 testdir = "tests/plot"
@@ -158,3 +159,39 @@ def png_hash_without_text(filename):
                 hash_without_text = hashlib.sha256(f.read()).hexdigest()
                 break
     return hash_without_text
+
+
+figure_output_patterns = [
+    ({"format": "png", "width": 600}, "png", (600, 480), None),
+    ({"format": "png", "dpi": 50, "colors": 16}, "png", (750, 600), None),
+    ({"format": "webp", "dpi": 50}, "webp", (750, 600), None),
+    ({"format": "png", "max_bytes": 40000}, "png", None, 40000),
+    ({"format": "svg"}, "svg", None, None),
+]
+
+
+@pytest.mark.parametrize(
+    "output, extension, size, max_bytes",
+    figure_output_patterns
+)
+def test_figure_output(output, extension, size, max_bytes):
+    from PIL import Image
+
+    pngfile = f"{png_path}/test_figure_output.png"
+    actual = figure(config=f"{testdir}/test_config5.json",
+                    filename=pngfile, output=output)
+
+    assert actual == f"{png_path}/test_figure_output.{extension}"
+    assert os.path.exists(actual)
+    if size:
+        assert Image.open(actual).size == size
+    if max_bytes:
+        assert os.path.getsize(actual) <= max_bytes
+    os.remove(actual)
+
+
+def test_figure_unknown_format():
+    with pytest.raises(OutputError, match="unknown output format 'gif'"):
+        figure(config=f"{testdir}/test_config5.json",
+               filename=f"{png_path}/test_figure_output.png",
+               output={"format": "gif"})
@@ -50,3 +50,37 @@ def test_dateparser(date, expected, monkeypatch):
     assert datetime.date.today() == TODAY
     actual = dateparser.parse(date)
     assert expected == actual
+
+
+NOW = datetime.datetime(2020, 3, 1, 10, 30)
+
+parse_time_patterns = [
+    ("6h", (NOW-datetime.timedelta(hours=6), NOW)),
+    ("1H", (NOW-datetime.timedelta(hours=1), NOW)),
+    ("90min", (NOW-datetime.timedelta(minutes=90), NOW)),
+    ("30 minutes", (NOW-datetime.timedelta(minutes=30), NOW)),
+    ("6x", None),
+    ("08:00-12:00", (datetime.datetime(2020, 3, 1, 8, 0),
+                     datetime.datetime(2020, 3, 1, 12, 0))),
+    ("11:00-12:00", (datetime.datetime(2020, 2, 29, 11, 0),
+                     datetime.datetime(2020, 2, 29, 12, 0))),
+    ("22:00-02:00", (datetime.datetime(2020, 2, 29, 22, 0),
+                     datetime.datetime(2020, 3, 1, 2, 0))),
+    ("25:00-26:00", None),
+    ("2020-01-01..2020-01-15",
+        (datetime.date(2020, 1, 1), datetime.date(2020, 1, 16))),
+    ("1/2 .. 1/5", (datetime.date(2020, 1, 2), datetime.date(2020, 1, 6))),
+    ("2020-02-29..", (datetime.date(2020, 2, 29), None)),
+    ("..2020-01-15", (None, datetime.date(2020, 1, 16))),
+    ("2020-03-01..6h", (datetime.datetime(2020, 3, 1, 0, 0), NOW)),
+    ("2020-01-15..2020-01-01", None),
+    ("2020-01-15..xxx", None),
+    ("..", None),
+]
+
+
+@pytest.mark.parametrize("date, expected", parse_time_patterns)
+@freeze_time("2020-03-01 10:30:45")
+def test_dateparser_time(date, expected):
+    actual = dateparser.parse(date)
+    assert expected == actual
@@ -0,0 +1,67 @@
+import pytest
+from co2 import payload
+from co2.co2plot import read_database, extract_plot_data
+
+testdir = "tests/plot"
+
+
+@pytest.mark.parametrize("data, expected", [
+    ("0.0,10,-2.2", ("csv", {0: 0.0, 1: 10.0, 2: -2.2})),
+    ("0.0 10\t-2.2", ("ssv", {0: 0.0, 1: 10.0, 2: -2.2})),
+    ('{"CO2": 450}', ("json", {"CO2": 450})),
+    ('[1, 2]', ("json", {0: 1, 1: 2})),
+    ('"text"', (None, {})),
+    (None, (None, {})),
+])
+def test_guess(data, expected):
+    assert payload.guess(data) == expected
+
+
+def test_registry_declared():
+    registry = payload.SchemaRegistry({
+        "living/SCD30": {
+            "format": "ssv",
+            "columns": ["temperature", "humidity", "co2"],
+        },
+    })
+    assert registry.key("living/SCD30", "co2") == 2
+    assert registry.key("living/SCD30", 1) == 1
+    assert registry.decode("living/SCD30", "25.2 24.9 582") == \
+        {0: 25.2, 1: 24.9, 2: 582.0}
+    assert registry.decode("living/SCD30", "25.2,24.9,582") == {}
+    assert registry.decode("living/SCD30", "25.2 24.9") == {}
+    assert registry.report() == {"living/SCD30": 2}
+    assert registry.report() == {}
+
+
+def test_registry_inferred():
+    registry = payload.SchemaRegistry()
+    assert registry.decode("living/DS11B20", "xxx") == {}
+    assert registry.decode("living/DS11B20", "18.0") == {0: 18.0}
+    assert registry.schema("living/DS11B20").format == "csv"
+    assert registry.decode("living/DS11B20", '{"t": 18.0}') == {}
+    assert registry.report() == {"living/DS11B20": 2}
+
+
+@pytest.mark.parametrize("topics", [
+    [],
+    {"living/SCD30": {}},
+    {"living/SCD30": {"format": "xml"}},
+    {"living/SCD30": {"format": "csv", "columns": "temperature"}},
+])
+def test_registry_error(topics):
+    with pytest.raises(payload.PayloadError):
+        payload.SchemaRegistry(topics)
+
+
+def test_extract_plot_data_by_name():
+    registry = payload.SchemaRegistry({
+        "living/SCD30": {
+            "format": "ssv",
+            "columns": ["temperature", "humidity", "co2"],
+        },
+    })
+    df = read_database(f"{testdir}/test_2_topic.db", "measurement")
+    ser = extract_plot_data(df, "living/SCD30", "co2", registry)
+    assert len(ser) == 847
+    assert registry.report() == {}